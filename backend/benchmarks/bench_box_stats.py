@@ -0,0 +1,117 @@
+"""
+Micro-benchmark des statistiques de profondeur par box : calcul direct sur la
+zone de chaque box vs tables de sommes cumulées pour mean/std, et
+box_region_stats (qui choisit selon l'aire totale des boxes). Min et max restent
+lus sur la zone de chaque box (coût proportionnel à son aire) : la colonne
+"dont min/max" mesure cette part seule.
+
+Usage (depuis backend/):
+    python benchmarks/bench_box_stats.py
+    python benchmarks/bench_box_stats.py --sizes 10 100 1000 --box-side 0.1 0.5
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services import box_ops  # noqa: E402
+from services.box_ops import box_region_stats  # noqa: E402
+
+
+def reference_stats(values: np.ndarray, boxes: np.ndarray) -> list:
+    """Calcul direct : mean, std, min et max sur la zone de chaque box"""
+    stats = []
+    for x1, y1, x2, y2 in boxes.astype(np.int64):
+        region = values[y1:y2, x1:x2]
+        stats.append(
+            {
+                "mean": float(region.mean()),
+                "std": float(region.std()),
+                "min": float(region.min()),
+                "max": float(region.max()),
+                "pixels": int(region.size),
+            }
+        )
+    return stats
+
+
+def table_stats(values: np.ndarray, boxes: np.ndarray) -> list:
+    """box_region_stats forcé sur les tables de sommes cumulées"""
+    ratio = box_ops.SUMMED_AREA_MIN_RATIO
+    box_ops.SUMMED_AREA_MIN_RATIO = -1
+    try:
+        return box_region_stats(values, boxes)
+    finally:
+        box_ops.SUMMED_AREA_MIN_RATIO = ratio
+
+
+def extrema_only(values: np.ndarray, boxes: np.ndarray) -> list:
+    """Part de box_region_stats proportionnelle à l'aire des boxes"""
+    return [
+        (values[y1:y2, x1:x2].min(), values[y1:y2, x1:x2].max())
+        for x1, y1, x2, y2 in boxes.astype(np.int64)
+    ]
+
+
+def make_boxes(count: int, side: float, height: int, width: int, rng) -> np.ndarray:
+    """Boxes aléatoires de côté side x dimensions de la carte"""
+    w, h = max(1, int(width * side)), max(1, int(height * side))
+    x1 = rng.integers(0, width - w + 1, size=count)
+    y1 = rng.integers(0, height - h + 1, size=count)
+    return np.stack([x1, y1, x1 + w, y1 + h], axis=1)
+
+
+def best_time(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 50, 500])
+    parser.add_argument("--box-side", type=float, nargs="+", default=[0.05, 0.2, 0.5])
+    parser.add_argument("--shape", type=int, nargs=2, default=[960, 1280])
+    parser.add_argument("--repeat", type=int, default=3)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    height, width = args.shape
+    values = rng.uniform(0, 255, size=(height, width))
+
+    print(
+        f"{'boxes':>7} {'côté':>6} {'aire/carte':>11} {'direct (ms)':>12} "
+        f"{'tables (ms)':>12} {'dont min/max (ms)':>18} {'choisi (ms)':>12}"
+    )
+    for side in args.box_side:
+        for size in args.sizes:
+            boxes = make_boxes(size, side, height, width, rng)
+
+            expected = reference_stats(values, boxes)
+            for ref, got in zip(expected, table_stats(values, boxes)):
+                assert got["pixels"] == ref["pixels"] and got["min"] == ref["min"]
+                assert got["max"] == ref["max"]
+                assert np.isclose(got["mean"], ref["mean"])
+                assert np.isclose(got["std"], ref["std"], atol=1e-6)
+
+            t_direct = best_time(lambda: reference_stats(values, boxes), args.repeat)
+            t_tables = best_time(lambda: table_stats(values, boxes), args.repeat)
+            t_extrema = best_time(lambda: extrema_only(values, boxes), args.repeat)
+            t_chosen = best_time(lambda: box_region_stats(values, boxes), args.repeat)
+            area = sum(ref["pixels"] for ref in expected) / values.size
+            print(
+                f"{size:>7} {side:>6.2f} {area:>11.1f} {t_direct * 1000:>12.2f} "
+                f"{t_tables * 1000:>12.2f} {t_extrema * 1000:>18.2f} {t_chosen * 1000:>12.2f}"
+            )
+
+
+if __name__ == "__main__":
+    main()
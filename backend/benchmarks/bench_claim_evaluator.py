@@ -0,0 +1,152 @@
+"""
+Micro-benchmark de l'évaluation des dégâts : calcul d'origine pièce par pièce
+(coût, détail et gravité, recherche linéaire du coût de chaque pièce) vs
+ClaimEvaluator.analyze_damages (coûts indexés, coûts ajustés par un seul produit
+NumPy, sommes, gravité et détail en boucles Python).
+
+Usage (depuis backend/):
+    python benchmarks/bench_claim_evaluator.py
+    python benchmarks/bench_claim_evaluator.py --sizes 10 1000 10000 --repeat 5
+"""
+
+import argparse
+import random
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.claim_evaluator import ClaimEvaluator  # noqa: E402
+
+
+def reference_part_cost(part_name: str) -> float:
+    if part_name in ClaimEvaluator.PIECE_COSTS:
+        return ClaimEvaluator.PIECE_COSTS[part_name]
+    for key, cost in ClaimEvaluator.PIECE_COSTS.items():
+        if key in part_name or part_name in key:
+            return cost
+    return 500
+
+
+def reference_factor(obj: dict) -> float:
+    depth = obj.get("depth")
+    if not depth:
+        return 1.0
+    low, high = ClaimEvaluator.DEFORMATION_FACTOR_RANGE
+    ratio = min(depth.get("std", 0) / ClaimEvaluator.DEFORMATION_STD_REFERENCE, 1.0)
+    return round(low + (high - low) * ratio, 3)
+
+
+def reference_analysis(damage: dict) -> dict:
+    """Implémentation d'origine (une boucle par résultat)"""
+    objects = damage.get("detected_objects", [])
+
+    total_cost = 0
+    for obj in objects:
+        part_name = obj.get("class", "unknown").lower()
+        total_cost += (
+            reference_part_cost(part_name) * obj.get("confidence", 0) * reference_factor(obj)
+        )
+    if total_cost == 0 and "depth_stats" in damage:
+        stats = damage["depth_stats"]
+        total_cost = max(stats.get("mean", 0) * 10 + stats.get("max", 0) * 5, 200)
+
+    breakdown = []
+    for obj in objects:
+        part_name = obj.get("class", "unknown")
+        base_cost = reference_part_cost(part_name.lower())
+        factor = reference_factor(obj)
+        breakdown.append(
+            {
+                "part": part_name,
+                "confidence": round(obj.get("confidence", 0) * 100, 1),
+                "base_cost": base_cost,
+                "deformation_factor": factor,
+                "estimated_cost": round(base_cost * obj.get("confidence", 0) * factor, 2),
+            }
+        )
+
+    mean_depth = damage.get("depth_stats", {}).get("mean", 0)
+    deformed = sum(
+        1
+        for obj in objects
+        if (obj.get("depth") or {}).get("std", 0) >= ClaimEvaluator.DEFORMATION_STD_REFERENCE
+    )
+    if len(objects) >= 3 or mean_depth > 150 or deformed >= 2:
+        severity = "severe"
+    elif len(objects) >= 2 or mean_depth > 100 or deformed >= 1:
+        severity = "moderate"
+    else:
+        severity = "minor"
+
+    return {
+        "estimated_cost": round(total_cost, 2),
+        "severity": severity,
+        "breakdown": breakdown,
+    }
+
+
+# Noms exacts, noms libres (correspondance partielle) et pièces inconnues
+PART_NAMES = list(ClaimEvaluator.PIECE_COSTS) + [
+    "Front Bumper",
+    "bumpers",
+    "left door panel",
+    "damaged hood area",
+    "spoiler",
+    "glass",
+]
+
+
+def make_damage(count: int, rng: random.Random) -> dict:
+    objects = []
+    for _ in range(count):
+        obj = {"class": rng.choice(PART_NAMES), "confidence": rng.random()}
+        if rng.random() < 0.6:
+            obj["depth"] = {"std": rng.uniform(0, 60), "mean": rng.uniform(0, 255)}
+        objects.append(obj)
+    damage = {"detected_objects": objects}
+    if rng.random() < 0.5:
+        damage["depth_stats"] = {"mean": rng.uniform(0, 200), "max": 255}
+    return damage
+
+
+def best_time(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[5, 100, 1000, 10000])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--check", type=int, default=2000, help="Sinistres aléatoires comparés")
+    args = parser.parse_args()
+
+    evaluator = ClaimEvaluator()
+    rng = random.Random(0)
+
+    # Les deux implémentations doivent donner exactement les mêmes résultats
+    damages = [make_damage(rng.randrange(0, 6), rng) for _ in range(args.check)]
+    assert evaluator.analyze_damages(damages) == [reference_analysis(d) for d in damages]
+    print(f"✓ {args.check} sinistres aléatoires : résultats identiques")
+
+    print(f"{'détections':>11} {'origine (ms)':>13} {'vectorisé (ms)':>15} {'gain':>7}")
+    for size in args.sizes:
+        # Détections réparties sur des sinistres de 10 pièces (portefeuille)
+        damages = [make_damage(min(10, size), rng) for _ in range(max(1, size // 10))]
+
+        t_reference = best_time(lambda: [reference_analysis(d) for d in damages], args.repeat)
+        t_vectorized = best_time(lambda: evaluator.analyze_damages(damages), args.repeat)
+        print(
+            f"{size:>11} {t_reference * 1000:>13.2f} {t_vectorized * 1000:>15.2f} "
+            f"{t_reference / t_vectorized:>6.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
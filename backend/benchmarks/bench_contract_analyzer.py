@@ -0,0 +1,158 @@
+"""
+Micro-benchmark de l'analyse de contrat : patterns d'origine (7 re.search
+IGNORECASE, lower() et sous-chaînes) vs ContractMatcher (un seul texte en
+minuscules, mots-clés localisés par str.find, montants vérifiés sur place).
+
+Usage (depuis backend/):
+    python benchmarks/bench_contract_analyzer.py
+    python benchmarks/bench_contract_analyzer.py --pages 10 100 300 --repeat 5
+"""
+
+import argparse
+import random
+import re
+import sys
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.contract_analyzer import ContractAnalyzer  # noqa: E402
+
+
+def _reference_amount(text: str, patterns: list) -> dict:
+    for pattern in patterns:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            amount = match.group(1).replace(" ", "").replace(",", ".")
+            return {"amount": float(amount), "currency": "EUR", "found": True}
+    return {"found": False, "amount": None}
+
+
+def reference_analysis(text: str) -> tuple:
+    """Implémentation d'origine (franchise, plafond, garanties)"""
+    franchise = _reference_amount(
+        text,
+        [
+            r"franchise[:\s]+(\d+[\s,.]?\d*)\s*€",
+            r"franchise[:\s]+(\d+[\s,.]?\d*)\s*euros?",
+            r"montant de la franchise[:\s]+(\d+[\s,.]?\d*)\s*€",
+        ],
+    )
+    plafond = _reference_amount(
+        text,
+        [
+            r"plafond[:\s]+(\d+[\s,.]?\d*)\s*€",
+            r"plafond de garantie[:\s]+(\d+[\s,.]?\d*)\s*€",
+            r"limite de garantie[:\s]+(\d+[\s,.]?\d*)\s*€",
+            r"montant maximum[:\s]+(\d+[\s,.]?\d*)\s*€",
+        ],
+    )
+    text_lower = text.lower()
+    garanties = {
+        "tous_risques": "tous risques" in text_lower or "tout risque" in text_lower,
+        "tiers": "responsabilité civile" in text_lower or "au tiers" in text_lower,
+        "vol": "vol" in text_lower,
+        "incendie": "incendie" in text_lower,
+        "bris_de_glace": "bris de glace" in text_lower or "brise de glace" in text_lower,
+        "assistance": "assistance" in text_lower or "dépannage" in text_lower,
+    }
+    return franchise, plafond, garanties
+
+
+def matcher_analysis(analyzer: ContractAnalyzer, text: str) -> tuple:
+    markers = analyzer.matcher.scan(text)
+    return (
+        analyzer._amount(markers["franchise"]),
+        analyzer._amount(markers["plafond"]),
+        markers["garanties"],
+    )
+
+
+FILLER = (
+    "le présent contrat couvre les dommages subis par le véhicule assuré dans les "
+    "conditions définies aux conditions générales et particulières article "
+    "souscripteur conducteur désigné sinistre déclaration délai de cinq jours"
+).split()
+
+MARKERS = [
+    "Franchise: 300 €",
+    "franchise 450 euros",
+    "FRANCHISE : 1 200,50 €",
+    "Montant de la franchise: 250 €",
+    "Plafond: 15000 €",
+    "plafond de garantie : 20 000 €",
+    "Limite de garantie 8.500 €",
+    "montant maximum: 30000€",
+    "franchise: voir annexe",
+    "plafond de 5000 €",
+    "Tous Risques",
+    "tout risque",
+    "Responsabilité Civile",
+    "assurance au tiers",
+    "VOL",
+    "Incendie",
+    "bris de glace",
+    "brise de glace",
+    "Assistance 0 km",
+    "dépannage",
+    "plafondépannage",
+    "montant maximumontant maximum: 40 €",
+]
+
+
+def make_contract(pages: int, rng: random.Random, markers: int) -> str:
+    """Contrat synthétique : ~500 mots par page, marqueurs placés au hasard"""
+    words = [rng.choice(FILLER) for _ in range(pages * 500)]
+    for _ in range(markers):
+        words.insert(rng.randrange(len(words) + 1), rng.choice(MARKERS))
+    lines = [" ".join(words[i : i + 12]) for i in range(0, len(words), 12)]
+    return "\n".join(lines)
+
+
+def best_time(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--pages", type=int, nargs="+", default=[1, 10, 100])
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument(
+        "--check", type=int, default=2000, help="Contrats aléatoires comparés"
+    )
+    args = parser.parse_args()
+
+    analyzer = ContractAnalyzer()
+    rng = random.Random(0)
+
+    # Les deux implémentations doivent donner exactement les mêmes résultats
+    for i in range(args.check):
+        text = make_contract(1, rng, rng.randrange(0, 8))
+        assert matcher_analysis(analyzer, text) == reference_analysis(text), (
+            f"Résultats différents pour le contrat {i}:\n{text}"
+        )
+    print(f"✓ {args.check} contrats aléatoires : résultats identiques")
+
+    print(f"{'pages':>6} {'marqueurs':>10} {'origine (ms)':>13} {'matcher (ms)':>13} {'gain':>7}")
+    for pages in args.pages:
+        # Sans marqueur (pire cas : tout le texte est parcouru), puis contrat typique
+        for markers in (0, 20):
+            text = make_contract(pages, rng, markers)
+            assert matcher_analysis(analyzer, text) == reference_analysis(text)
+
+            t_reference = best_time(lambda: reference_analysis(text), args.repeat)
+            t_matcher = best_time(lambda: matcher_analysis(analyzer, text), args.repeat)
+            print(
+                f"{pages:>6} {markers:>10} {t_reference * 1000:>13.2f} "
+                f"{t_matcher * 1000:>13.2f} {t_reference / t_matcher:>6.1f}x"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,126 @@
+"""
+Micro-benchmark du NMS : implémentation Python d'origine vs version NumPy.
+
+Usage (depuis backend/):
+    python benchmarks/bench_nms.py
+    python benchmarks/bench_nms.py --sizes 100 1000 5000 --repeat 5
+"""
+
+import argparse
+import sys
+import time
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.box_ops import nms  # noqa: E402
+
+
+def reference_nms(detections: list, iou_threshold: float) -> list:
+    """Implémentation d'origine (boucle Python, IoU paire par paire)"""
+
+    def iou(box1, box2):
+        x1 = max(box1["x1"], box2["x1"])
+        y1 = max(box1["y1"], box2["y1"])
+        x2 = min(box1["x2"], box2["x2"])
+        y2 = min(box1["y2"], box2["y2"])
+        intersection = max(0, x2 - x1) * max(0, y2 - y1)
+        area1 = (box1["x2"] - box1["x1"]) * (box1["y2"] - box1["y1"])
+        area2 = (box2["x2"] - box2["x1"]) * (box2["y2"] - box2["y1"])
+        union = area1 + area2 - intersection
+        return intersection / union if union > 0 else 0
+
+    detections = sorted(detections, key=lambda x: x["confidence"], reverse=True)
+    kept = []
+    while detections:
+        best = detections.pop(0)
+        kept.append(best)
+        detections = [
+            d for d in detections if iou(best["bbox"], d["bbox"]) < iou_threshold
+        ]
+    return kept
+
+
+def make_detections(count: int, rng: np.random.Generator) -> list:
+    """Détections aléatoires regroupées autour de quelques pièces (cas réaliste)"""
+    centers = rng.uniform(50, 590, size=(max(1, count // 20), 2))
+    detections = []
+    for _ in range(count):
+        cx, cy = centers[rng.integers(len(centers))] + rng.normal(0, 15, size=2)
+        w, h = rng.uniform(20, 120, size=2)
+        detections.append(
+            {
+                "class": f"part_{rng.integers(12)}",
+                "confidence": round(float(rng.uniform(0.1, 1.0)), 3),
+                "bbox": {
+                    "x1": int(cx - w / 2),
+                    "y1": int(cy - h / 2),
+                    "x2": int(cx + w / 2),
+                    "y2": int(cy + h / 2),
+                },
+            }
+        )
+    return detections
+
+
+def vectorized_nms(detections: list, iou_threshold: float, class_agnostic: bool):
+    """Même conversion que ZeroShotDetector._apply_nms"""
+    boxes = np.array(
+        [[d["bbox"][k] for k in ("x1", "y1", "x2", "y2")] for d in detections],
+        dtype=np.float64,
+    )
+    scores = np.array([d["confidence"] for d in detections], dtype=np.float64)
+    classes = None
+    if not class_agnostic:
+        class_ids = {}
+        classes = np.array(
+            [class_ids.setdefault(d["class"], len(class_ids)) for d in detections]
+        )
+    keep = nms(boxes, scores, iou_threshold=iou_threshold, classes=classes)
+    return [detections[i] for i in keep]
+
+
+def best_time(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10, 50, 200, 1000, 3000])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--iou", type=float, default=0.5)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    print(f"{'boxes':>7} {'python (ms)':>12} {'numpy (ms)':>11} {'par classe (ms)':>16} {'gain':>7}")
+
+    for size in args.sizes:
+        detections = make_detections(size, rng)
+
+        # Les deux implémentations doivent garder exactement les mêmes détections
+        expected = reference_nms(detections, args.iou)
+        actual = vectorized_nms(detections, args.iou, class_agnostic=True)
+        assert actual == expected, f"Résultats différents pour {size} boxes"
+
+        t_python = best_time(lambda: reference_nms(detections, args.iou), args.repeat)
+        t_numpy = best_time(
+            lambda: vectorized_nms(detections, args.iou, True), args.repeat
+        )
+        t_per_class = best_time(
+            lambda: vectorized_nms(detections, args.iou, False), args.repeat
+        )
+        print(
+            f"{size:>7} {t_python * 1000:>12.2f} {t_numpy * 1000:>11.2f} "
+            f"{t_per_class * 1000:>16.2f} {t_python / t_numpy:>6.1f}x"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""
+Micro-benchmark du passage d'une photo décodée à un worker : tableau sérialisé
+(pickle) vs descripteur de segment de mémoire partagée.
+
+Usage (depuis backend/):
+    python benchmarks/bench_shared_memory.py
+    python benchmarks/bench_shared_memory.py --sides 640 1280 4000 --repeat 20
+"""
+
+import argparse
+import pickle
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from multiprocessing import resource_tracker
+from pathlib import Path
+
+import numpy as np
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.shared_arrays import SharedArrayStore, attach  # noqa: E402
+
+
+def checksum_array(pixels: np.ndarray) -> int:
+    """Worker : reçoit le tableau entier (copié par pickle dans le pipe)"""
+    return int(pixels[0, 0, 0]) + int(pixels[-1, -1, -1])
+
+
+def checksum_shared(descriptor: dict) -> int:
+    """Worker : reçoit un descripteur et lit les pixels sans copie"""
+    with attach(descriptor) as pixels:
+        return int(pixels[0, 0, 0]) + int(pixels[-1, -1, -1])
+
+
+def best_time(fn, repeat: int) -> float:
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        timings.append(time.perf_counter() - start)
+    return min(timings)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--sides", type=int, nargs="+", default=[640, 1280, 2560, 4000])
+    parser.add_argument("--repeat", type=int, default=10)
+    args = parser.parse_args()
+
+    rng = np.random.default_rng(0)
+    store = SharedArrayStore(max_bytes=0)
+    # Comme InferenceExecutor : les workers partagent le resource tracker
+    resource_tracker.ensure_running()
+
+    print(
+        f"{'photo':>11} {'Mo':>6} {'pickle (ms)':>12} {'partagé (ms)':>13} "
+        f"{'descripteur (o)':>16} {'gain':>7}"
+    )
+    with ProcessPoolExecutor(max_workers=1) as pool:
+        # Worker démarré avant la mesure
+        pool.submit(int).result()
+
+        for side in args.sides:
+            shape = (side * 3 // 4, side, 3)
+            pixels = rng.integers(0, 256, size=shape, dtype=np.uint8)
+            descriptor = store.publish(f"bench:{side}", pixels)
+
+            expected = checksum_array(pixels)
+            assert pool.submit(checksum_array, pixels).result() == expected
+            assert pool.submit(checksum_shared, descriptor).result() == expected
+
+            t_pickle = best_time(
+                lambda: pool.submit(checksum_array, pixels).result(), args.repeat
+            )
+            t_shared = best_time(
+                lambda: pool.submit(checksum_shared, descriptor).result(), args.repeat
+            )
+            print(
+                f"{shape[1]:>5}x{shape[0]:<5} {pixels.nbytes / 1e6:>6.1f} "
+                f"{t_pickle * 1000:>12.2f} {t_shared * 1000:>13.2f} "
+                f"{len(pickle.dumps(descriptor)):>16} {t_pickle / t_shared:>6.1f}x"
+            )
+            store.release(f"bench:{side}")
+
+    store.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -1,370 +1,934 @@
-from fastapi import FastAPI, File, UploadFile, HTTPException
-from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
-from pathlib import Path
-import shutil
-import uuid
-from datetime import datetime
-import traceback
-from services.depth_estimator import get_depth_estimator
-from services.object_detector import get_object_detector
-from services.zero_shot_detector import get_zero_shot_detector
-from services.contract_extractor import get_contract_extractor
-from services.contract_analyzer import get_contract_analyzer
-from services.claim_evaluator import get_claim_evaluator
-
-import os
-
-app = FastAPI(title="DamageControl AI API")
-
-# Configuration CORS pour permettre les requêtes depuis le frontend
-allowed_origins = [
-    "http://localhost:5173",  # Développement local
-    "http://localhost:3000",  # Alternative
-    "https://damage-control-ai.netlify.app",  # Production
-]
-
-# Ajouter l'URL du frontend en production si définie via variable d'environnement
-frontend_url = os.getenv("FRONTEND_URL")
-if frontend_url and frontend_url not in allowed_origins:
-    allowed_origins.append(frontend_url)
-    print(f"✅ CORS: Frontend URL ajoutée: {frontend_url}")
-
-print(f"🔧 CORS: Origines autorisées: {allowed_origins}")
-
-app.add_middleware(
-    CORSMiddleware,
-    allow_origins=allowed_origins,
-    allow_credentials=True,
-    allow_methods=["*"],
-    allow_headers=["*"],
-)
-
-# Créer le dossier uploads s'il n'existe pas
-UPLOAD_DIR = Path("uploads")
-UPLOAD_DIR.mkdir(exist_ok=True)
-
-# Servir les fichiers statiques (images uploadées et depth maps)
-app.mount("/files", StaticFiles(directory=str(UPLOAD_DIR)), name="files")
-
-
-@app.get("/")
-def read_root():
-    return {"message": "DamageControl AI Backend is running"}
-
-
-@app.get("/health")
-def health_check():
-    return {"status": "ok", "upload_dir": str(UPLOAD_DIR.absolute())}
-
-
-@app.post("/upload")
-async def upload_image(file: UploadFile = File(...)):
-    """
-    Upload une image de dégât pour analyse
-    """
-    # Vérifier le type de fichier
-    if not file.content_type.startswith("image/"):
-        raise HTTPException(status_code=400, detail="Le fichier doit être une image")
-
-    # Générer un nom de fichier unique
-    file_extension = Path(file.filename).suffix
-    unique_filename = f"{uuid.uuid4()}{file_extension}"
-    file_path = UPLOAD_DIR / unique_filename
-
-    # Sauvegarder le fichier
-    with file_path.open("wb") as buffer:
-        shutil.copyfileobj(file.file, buffer)
-
-    return {
-        "status": "success",
-        "filename": unique_filename,
-        "url": f"/files/{unique_filename}",
-        "size": file_path.stat().st_size,
-        "uploaded_at": datetime.now().isoformat(),
-    }
-
-
-@app.post("/upload/contract")
-async def upload_contract(file: UploadFile = File(...)):
-    """
-    Upload un contrat d'assurance (PDF ou image) pour extraction de texte
-    """
-    from services.contract_extractor import get_contract_extractor
-
-    # Vérifier le type de fichier
-    allowed_types = ["application/pdf", "image/jpeg", "image/png", "image/jpg"]
-    if file.content_type not in allowed_types:
-        raise HTTPException(
-            status_code=400,
-            detail="Le fichier doit être un PDF ou une image (JPG, PNG)",
-        )
-
-    # Générer un nom de fichier unique
-    file_extension = Path(file.filename).suffix
-    unique_filename = f"contract_{uuid.uuid4()}{file_extension}"
-    file_path = UPLOAD_DIR / unique_filename
-
-    try:
-        # Sauvegarder le fichier
-        with file_path.open("wb") as buffer:
-            shutil.copyfileobj(file.file, buffer)
-
-        print(f"📄 Contrat uploadé: {unique_filename}")
-
-        # Extraire le texte
-        extractor = get_contract_extractor()
-        extraction_result = extractor.extract_text(file_path)
-
-        return {
-            "status": "success",
-            "filename": unique_filename,
-            "url": f"/files/{unique_filename}",
-            "size": file_path.stat().st_size,
-            "uploaded_at": datetime.now().isoformat(),
-            "extraction": extraction_result,
-            "message": "Contrat uploadé et texte extrait avec succès",
-        }
-    except Exception as e:
-        # Supprimer le fichier en cas d'erreur
-        if file_path.exists():
-            file_path.unlink()
-        print(f"❌ Erreur lors de l'upload du contrat: {e}")
-        print(traceback.format_exc())
-        raise HTTPException(
-            status_code=500, detail=f"Erreur lors de l'extraction: {str(e)}"
-        )
-
-
-@app.post("/analyze/contract/{filename}")
-async def analyze_contract(filename: str):
-    """
-    Analyse un contrat uploadé pour extraire franchise, plafond et garanties
-    """
-    from services.contract_extractor import get_contract_extractor
-    from services.contract_analyzer import get_contract_analyzer
-
-    file_path = UPLOAD_DIR / filename
-
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="Contrat non trouvé")
-
-    try:
-        print(f"📋 Début de l'analyse du contrat: {filename}")
-
-        # Extraire le texte
-        extractor = get_contract_extractor()
-        extraction_result = extractor.extract_text(file_path)
-
-        # Analyser le contrat
-        analyzer = get_contract_analyzer()
-        analysis_result = analyzer.analyze_contract(extraction_result["text"])
-
-        print(f"✓ Analyse terminée")
-
-        return {
-            "status": "success",
-            "filename": filename,
-            "extraction": extraction_result,
-            "analysis": analysis_result,
-            "message": "Analyse du contrat terminée",
-        }
-    except Exception as e:
-        print("❌ ERREUR lors de l'analyse du contrat:")
-        print(traceback.format_exc())
-        raise HTTPException(
-            status_code=500, detail=f"Erreur lors de l'analyse: {str(e)}"
-        )
-
-
-@app.post("/analyze/{filename}")
-async def analyze_image(filename: str):
-    """
-    Analyse une image uploadée et génère une depth map
-    """
-    file_path = UPLOAD_DIR / filename
-
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="Image non trouvée")
-
-    try:
-        print(f"📊 Début de l'analyse pour: {filename}")
-
-        # Obtenir l'estimateur de profondeur
-        estimator = get_depth_estimator()
-        print("✓ Estimateur obtenu")
-
-        # Générer la depth map
-        result = estimator.estimate_depth(file_path)
-        print("✓ Depth map générée")
-
-        return {
-            "status": "success",
-            "original_image": f"/files/{filename}",
-            "depth_map": f"/files/{result['depth_map_filename']}",
-            "stats": result["stats"],
-            "device_used": result["device_used"],
-            "message": "Analyse de profondeur terminée",
-        }
-    except Exception as e:
-        # Afficher l'erreur complète dans les logs
-        print("❌ ERREUR lors de l'analyse:")
-        print(traceback.format_exc())
-        raise HTTPException(
-            status_code=500, detail=f"Erreur lors de l'analyse: {str(e)}"
-        )
-
-
-@app.post("/detect/{filename}")
-async def detect_objects(filename: str):
-    """
-    Détecte les objets dans une image uploadée avec YOLO
-    """
-    file_path = UPLOAD_DIR / filename
-
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="Image non trouvée")
-
-    try:
-        print(f"🔍 Début de la détection d'objets pour: {filename}")
-
-        # Obtenir le détecteur d'objets
-        detector = get_object_detector()
-        print("✓ Détecteur obtenu")
-
-        # Détecter les objets
-        result = detector.detect_objects(file_path)
-        print(f"✓ {result['stats']['total_objects']} objets détectés")
-
-        return {
-            "status": "success",
-            "original_image": f"/files/{filename}",
-            "annotated_image": f"/files/{result['annotated_image_filename']}",
-            "detections": result["detections"],
-            "stats": result["stats"],
-            "message": "Détection d'objets terminée",
-        }
-    except Exception as e:
-        # Afficher l'erreur complète dans les logs
-        print("❌ ERREUR lors de la détection:")
-        print(traceback.format_exc())
-        raise HTTPException(
-            status_code=500, detail=f"Erreur lors de la détection: {str(e)}"
-        )
-
-
-@app.post("/detect/parts/{filename}")
-async def detect_parts(filename: str):
-    """
-    Détecte les pièces spécifiques (Zero-Shot) avec OWL-ViT
-    """
-    from services.zero_shot_detector import get_zero_shot_detector
-
-    file_path = UPLOAD_DIR / filename
-
-    if not file_path.exists():
-        raise HTTPException(status_code=404, detail="Image non trouvée")
-
-    try:
-        print(f"🔍 Début de la détection de pièces pour: {filename}")
-
-        # Obtenir le détecteur Zero-Shot
-        detector = get_zero_shot_detector()
-        print("✓ Détecteur OWL-ViT obtenu")
-
-        # Détecter les pièces
-        result = detector.detect_parts(file_path)
-        print(f"✓ {result['stats']['total_objects']} pièces détectées")
-
-        return {
-            "status": "success",
-            "original_image": f"/files/{filename}",
-            "annotated_image": f"/files/{result['annotated_image_filename']}",
-            "detections": result["detections"],
-            "stats": result["stats"],
-            "message": "Détection de pièces terminée",
-        }
-    except Exception as e:
-        print("❌ ERREUR lors de la détection de pièces:")
-        print(traceback.format_exc())
-        raise HTTPException(
-            status_code=500, detail=f"Erreur lors de la détection: {str(e)}"
-        )
-
-
-@app.post("/evaluate/claim")
-async def evaluate_claim(
-    image_filename: str, contract_filename: str, damage_type: str = "accident"
-):
-    """
-    Évalue si un sinistre est couvert par le contrat
-
-    Args:
-        image_filename: Nom du fichier image analysé
-        contract_filename: Nom du fichier contrat analysé
-        damage_type: Type de sinistre (accident, vol, incendie, etc.)
-    """
-    try:
-        print(f"\n🔍 Évaluation du sinistre:")
-        print(f"  - Image: {image_filename}")
-        print(f"  - Contrat: {contract_filename}")
-        print(f"  - Type: {damage_type}")
-
-        # 1. Charger les données d'analyse d'image
-        image_path = UPLOAD_DIR / image_filename
-        if not image_path.exists():
-            raise HTTPException(status_code=404, detail="Image non trouvée")
-
-        # Récupérer les détections de pièces de voiture
-        detector = get_zero_shot_detector()
-        detection_result = detector.detect_parts(image_path)
-
-        # Récupérer les stats de profondeur (si disponibles)
-        depth_estimator = get_depth_estimator()
-        depth_result = depth_estimator.estimate_depth(image_path)
-
-        # Construire les données de dégâts
-        damage_data = {
-            "detected_objects": detection_result.get("detections", []),
-            "depth_stats": depth_result.get("stats", {}),
-        }
-
-        # 2. Charger les données du contrat
-        contract_path = UPLOAD_DIR / contract_filename
-        if not contract_path.exists():
-            raise HTTPException(status_code=404, detail="Contrat non trouvé")
-
-        # Extraire et analyser le contrat
-        extractor = get_contract_extractor()
-        extraction_result = extractor.extract_text(contract_path)
-
-        analyzer = get_contract_analyzer()
-        contract_data = analyzer.analyze_contract(extraction_result["text"])
-
-        # 3. Évaluer le sinistre
-        evaluator = get_claim_evaluator()
-        evaluation = evaluator.evaluate_claim(
-            damage_data=damage_data,
-            contract_data=contract_data,
-            damage_type=damage_type,
-        )
-
-        print(f"✅ Évaluation terminée")
-
-        return {
-            "status": "success",
-            "evaluation": evaluation,
-            "image_filename": image_filename,
-            "contract_filename": contract_filename,
-            "damage_type": damage_type,
-            "message": "Évaluation du sinistre terminée",
-        }
-
-    except HTTPException:
-        raise
-    except Exception as e:
-        print("❌ ERREUR lors de l'évaluation:")
-        print(traceback.format_exc())
-        raise HTTPException(
-            status_code=500, detail=f"Erreur lors de l'évaluation: {str(e)}"
-        )
+from fastapi import FastAPI, File, UploadFile, HTTPException, Request, Query
+from fastapi.middleware.cors import CORSMiddleware
+from fastapi.staticfiles import StaticFiles
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse
+from pydantic import BaseModel
+from pathlib import Path
+from typing import Dict, List, Optional
+import asyncio
+import json
+from datetime import datetime
+import traceback
+from services.depth_estimator import DepthEstimator
+from services.claim_evaluator import get_claim_evaluator
+from services.result_cache import get_result_cache
+from services.claim_dossier import get_claim_dossier
+from services.job_queue import JOB_KINDS, get_job_queue, get_job_workers
+from services.claim_pipeline import (
+    analyze_contract_file,
+    contract_stages,
+    evaluate_claim_files,
+    has_depth_map,
+    run_stage,
+    with_part_depth,
+)
+from services.portfolio_simulator import PortfolioSimulator
+from services.annotation_renderer import AnnotationRenderer, get_annotation_renderer
+from services.inference_executor import get_inference_executor
+from services.registry import get_registry
+from services.upload_store import UploadTooLarge, store_upload
+from services.shared_image import ImageTooLarge, check_image_size, get_shared_image_cache
+from services import inference_tasks
+
+import os
+
+app = FastAPI(title="DamageControl AI API")
+
+# Configuration CORS pour permettre les requêtes depuis le frontend
+allowed_origins = [
+    "http://localhost:5173",  # Développement local
+    "http://localhost:3000",  # Alternative
+    "https://damage-control-ai.netlify.app",  # Production
+]
+
+# Ajouter l'URL du frontend en production si définie via variable d'environnement
+frontend_url = os.getenv("FRONTEND_URL")
+if frontend_url and frontend_url not in allowed_origins:
+    allowed_origins.append(frontend_url)
+    print(f"✅ CORS: Frontend URL ajoutée: {frontend_url}")
+
+print(f"🔧 CORS: Origines autorisées: {allowed_origins}")
+
+app.add_middleware(
+    CORSMiddleware,
+    allow_origins=allowed_origins,
+    allow_credentials=True,
+    allow_methods=["*"],
+    allow_headers=["*"],
+)
+
+# Créer le dossier uploads s'il n'existe pas
+UPLOAD_DIR = Path("uploads")
+UPLOAD_DIR.mkdir(exist_ok=True)
+
+# Servir les fichiers statiques (images uploadées et depth maps)
+app.mount("/files", StaticFiles(directory=str(UPLOAD_DIR)), name="files")
+
+
+# Préchargement des modèles au démarrage (opt-in) et état de disponibilité
+PRELOAD_MODELS = os.getenv("PRELOAD_MODELS", "false").lower() in ("1", "true", "yes")
+readiness = {
+    "ready": not PRELOAD_MODELS,
+    "preload": PRELOAD_MODELS,
+    "warmup_seconds": {},
+    "error": None,
+}
+
+
+async def _preload_models():
+    """Charge et préchauffe tous les modèles, puis marque l'instance comme prête"""
+    print("🔥 Préchargement des modèles...")
+    try:
+        readiness["warmup_seconds"] = await get_inference_executor().run(
+            "warmup", inference_tasks.warmup_models
+        )
+        readiness["ready"] = True
+        print(f"✅ Modèles préchauffés: {readiness['warmup_seconds']}")
+    except Exception as e:
+        readiness["error"] = str(e)
+        print("❌ ERREUR lors du préchargement des modèles:")
+        print(traceback.format_exc())
+
+
+@app.on_event("startup")
+async def preload_models():
+    # En tâche de fond : /health répond pendant le préchauffage
+    if PRELOAD_MODELS:
+        app.state.preload_task = asyncio.create_task(_preload_models())
+
+
+@app.on_event("startup")
+def start_job_workers():
+    # Workers de la file de jobs (remet d'abord en file les jobs interrompus)
+    get_job_workers().start()
+
+
+@app.on_event("shutdown")
+def shutdown_executor():
+    get_inference_executor().shutdown()
+
+
+@app.on_event("shutdown")
+def stop_job_workers():
+    get_job_workers().stop()
+
+
+@app.get("/")
+def read_root():
+    return {"message": "DamageControl AI Backend is running"}
+
+
+@app.get("/health")
+def health_check():
+    return {"status": "ok", "upload_dir": str(UPLOAD_DIR.absolute())}
+
+
+@app.get("/ready")
+def readiness_check():
+    """
+    Sonde de disponibilité : 503 tant que le préchauffage des modèles n'est pas terminé
+    (ou, en mode remote, tant que le serveur d'inférence ne répond pas)
+    """
+    content = dict(readiness)
+    executor = get_inference_executor()
+    if executor.mode == "remote":
+        try:
+            health = executor.health(timeout=5)
+            content["inference_server"] = {"reachable": True, "pid": health["pid"]}
+        except Exception as e:
+            content["ready"] = False
+            content["inference_server"] = {"reachable": False, "error": str(e)}
+    status_code = 200 if content["ready"] else 503
+    return JSONResponse(status_code=status_code, content=content)
+
+
+@app.get("/models")
+def models_report():
+    """
+    Services chargés avec leur temps de chargement et leur empreinte mémoire
+    (en mode remote, les modèles sont chargés par le serveur d'inférence)
+    """
+    report = {"status": "success", "models": get_registry().report()}
+    executor = get_inference_executor()
+    if executor.mode == "remote":
+        try:
+            report["inference_server"] = executor.health(timeout=5)["models"]
+        except Exception as e:
+            report["inference_server"] = {"reachable": False, "error": str(e)}
+    return report
+
+
+@app.get("/executor/stats")
+def executor_stats():
+    """
+    Configuration et occupation du pool d'inférence
+    """
+    return {"status": "success", "executor": get_inference_executor().stats()}
+
+
+@app.get("/resources")
+def resources_report():
+    """
+    Répartition active des cœurs CPU : threads intra-op par worker de chaque
+    modèle, inférences en cours et risque de sur-souscription
+    """
+    stats = get_inference_executor().stats()
+    return {
+        "status": "success",
+        # Serveur d'inférence injoignable (mode remote) : l'erreur à la place
+        "resources": stats.get(
+            "resources", {"reachable": False, "error": stats.get("error")}
+        ),
+        "in_flight": stats["in_flight"],
+    }
+
+
+@app.get("/cache/stats")
+def cache_stats():
+    """
+    Statistiques du cache de résultats (hits, misses, occupation), des rendus
+    et des images décodées partagées
+    """
+    return {
+        "status": "success",
+        "cache": get_result_cache().stats(),
+        "renders": get_annotation_renderer().stats(),
+        "images": get_shared_image_cache().stats(),
+    }
+
+
+# Tailles maximum des uploads
+MAX_IMAGE_UPLOAD_BYTES = int(os.getenv("MAX_IMAGE_UPLOAD_MB", "20")) * 1024 * 1024
+MAX_CONTRACT_UPLOAD_BYTES = int(os.getenv("MAX_CONTRACT_UPLOAD_MB", "50")) * 1024 * 1024
+UPLOAD_SIZE_LIMITS = {
+    "/upload": MAX_IMAGE_UPLOAD_BYTES,
+    "/upload/contract": MAX_CONTRACT_UPLOAD_BYTES,
+}
+
+
+@app.middleware("http")
+async def reject_oversized_uploads(request: Request, call_next):
+    """Rejette un upload trop gros d'après Content-Length, avant de lire le corps"""
+    max_bytes = UPLOAD_SIZE_LIMITS.get(request.url.path)
+    content_length = request.headers.get("content-length")
+    if max_bytes and content_length and content_length.isdigit():
+        # Marge pour l'enveloppe multipart
+        if int(content_length) > max_bytes + 64 * 1024:
+            return JSONResponse(
+                status_code=413,
+                content={"detail": str(UploadTooLarge(max_bytes))},
+            )
+    return await call_next(request)
+
+
+async def _store_upload(file: UploadFile, max_bytes: int, prefix: str = "") -> dict:
+    """Enregistre un upload (adressé par contenu) ou lève une erreur 413"""
+    try:
+        return await store_upload(file, UPLOAD_DIR, max_bytes, prefix=prefix)
+    except UploadTooLarge as e:
+        raise HTTPException(status_code=413, detail=str(e))
+
+
+def _discard_upload(stored: dict):
+    """Supprime un upload refusé, sauf s'il existait déjà avant cette requête"""
+    if not stored["deduplicated"]:
+        stored["path"].unlink(missing_ok=True)
+
+
+@app.post("/upload")
+async def upload_image(file: UploadFile = File(...)):
+    """
+    Upload une image de dégât pour analyse
+    """
+    # Vérifier le type de fichier
+    if not file.content_type.startswith("image/"):
+        raise HTTPException(status_code=400, detail="Le fichier doit être une image")
+
+    # Sauvegarder le fichier (un contenu identique est stocké une seule fois)
+    stored = await _store_upload(file, MAX_IMAGE_UPLOAD_BYTES)
+
+    # Vérifier la résolution (en-tête seulement) avant toute analyse
+    try:
+        check_image_size(stored["path"], get_shared_image_cache().max_pixels)
+    except ImageTooLarge as e:
+        _discard_upload(stored)
+        raise HTTPException(status_code=413, detail=str(e))
+
+    return {
+        "status": "success",
+        "filename": stored["filename"],
+        "url": f"/files/{stored['filename']}",
+        "size": stored["size"],
+        "sha256": stored["sha256"],
+        "deduplicated": stored["deduplicated"],
+        "uploaded_at": datetime.now().isoformat(),
+    }
+
+
+@app.post("/upload/contract")
+async def upload_contract(file: UploadFile = File(...)):
+    """
+    Upload un contrat d'assurance (PDF ou image) pour extraction de texte
+    """
+    # Vérifier le type de fichier
+    allowed_types = ["application/pdf", "image/jpeg", "image/png", "image/jpg"]
+    if file.content_type not in allowed_types:
+        raise HTTPException(
+            status_code=400,
+            detail="Le fichier doit être un PDF ou une image (JPG, PNG)",
+        )
+
+    # Sauvegarder le fichier (un contenu identique est stocké une seule fois)
+    stored = await _store_upload(file, MAX_CONTRACT_UPLOAD_BYTES, prefix="contract_")
+    file_path = stored["path"]
+
+    try:
+        print(
+            f"📄 Contrat uploadé: {stored['filename']}"
+            f"{' (déjà présent)' if stored['deduplicated'] else ''}"
+        )
+
+        # Extraire le texte (réutilisé si ce contenu a déjà été extrait)
+        extraction_result = await run_stage(
+            "extraction",
+            file_path,
+            "contract",
+            inference_tasks.extract_contract_text,
+            file_path,
+            reused_stages=[],
+            timings={},
+        )
+
+        return {
+            "status": "success",
+            "filename": stored["filename"],
+            "url": f"/files/{stored['filename']}",
+            "size": stored["size"],
+            "sha256": stored["sha256"],
+            "deduplicated": stored["deduplicated"],
+            "uploaded_at": datetime.now().isoformat(),
+            "extraction": extraction_result,
+            "message": "Contrat uploadé et texte extrait avec succès",
+        }
+    except Exception as e:
+        # Supprimer le fichier en cas d'erreur (sauf s'il était déjà stocké)
+        if not stored["deduplicated"] and file_path.exists():
+            file_path.unlink()
+        print(f"❌ Erreur lors de l'upload du contrat: {e}")
+        print(traceback.format_exc())
+        raise HTTPException(
+            status_code=500, detail=f"Erreur lors de l'extraction: {str(e)}"
+        )
+
+
+@app.post("/analyze/contract/{filename}")
+async def analyze_contract(filename: str):
+    """
+    Analyse un contrat uploadé pour extraire franchise, plafond et garanties
+    """
+    file_path = UPLOAD_DIR / filename
+
+    if not file_path.exists():
+        raise HTTPException(status_code=404, detail="Contrat non trouvé")
+
+    try:
+        print(f"📋 Début de l'analyse du contrat: {filename}")
+
+        # Extraire puis analyser le texte (résultats conservés dans le dossier)
+        result = await analyze_contract_file(file_path)
+
+        print(f"✓ Analyse terminée")
+
+        return {
+            "status": "success",
+            "filename": filename,
+            **result,
+            "message": "Analyse du contrat terminée",
+        }
+    except Exception as e:
+        print("❌ ERREUR lors de l'analyse du contrat:")
+        print(traceback.format_exc())
+        raise HTTPException(
+            status_code=500, detail=f"Erreur lors de l'analyse: {str(e)}"
+        )
+
+
+@app.post("/analyze/{filename}")
+async def analyze_image(
+    filename: str,
+    outputs: str = "preview",
+    preview_format: Optional[str] = None,
+    quality: Optional[int] = Query(None, ge=1, le=100),
+    regions: Optional[str] = None,
+):
+    """
+    Analyse une image uploadée et génère une depth map.
+    outputs: sorties séparées par des virgules parmi preview (aperçu colorisé),
+    npy (float16 brut) et png16 (PNG 16 bits) ; "stats" pour les statistiques seules.
+    regions: "parts" ou "objects" pour ajouter les statistiques de profondeur
+    dans chaque bounding box détectée (détections déjà en cache).
+    """
+    file_path = UPLOAD_DIR / filename
+
+    if not file_path.exists():
+        raise HTTPException(status_code=404, detail="Image non trouvée")
+
+    requested = [o.strip() for o in outputs.split(",") if o.strip() not in ("", "stats")]
+    unknown = [o for o in requested if o not in DepthEstimator.OUTPUTS]
+    if unknown:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Sortie inconnue: {', '.join(unknown)} (choix: preview, npy, png16, stats)",
+        )
+    if preview_format is not None and preview_format not in DepthEstimator.PREVIEW_FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Format d'aperçu non supporté (choix: {', '.join(DepthEstimator.PREVIEW_FORMATS)})",
+        )
+
+    detections = None
+    if regions is not None:
+        if regions not in ("parts", "objects"):
+            raise HTTPException(
+                status_code=400, detail="regions doit être 'parts' ou 'objects'"
+            )
+        detection_result = get_claim_dossier().get(file_path, regions)
+        if detection_result is None:
+            endpoint = "/detect/parts" if regions == "parts" else "/detect"
+            raise HTTPException(
+                status_code=404,
+                detail=f"Aucune détection en cache pour cette image (appeler {endpoint} d'abord)",
+            )
+        detections = detection_result["detections"]
+
+    try:
+        print(f"📊 Début de l'analyse pour: {filename}")
+
+        # Générer la depth map (hors de la boucle d'événements)
+        result = await get_inference_executor().run(
+            "depth",
+            inference_tasks.estimate_depth,
+            file_path,
+            requested,
+            preview_format=preview_format,
+            quality=quality,
+            boxes=[d["bbox"] for d in detections] if detections is not None else None,
+        )
+        get_claim_dossier().record(file_path, "depth", result)
+        print("✓ Depth map générée")
+
+        files = result.get("files", {})
+        return {
+            "status": "success",
+            "original_image": f"/files/{filename}",
+            "depth_map": f"/files/{files['preview']['filename']}"
+            if "preview" in files
+            else None,
+            "depth_files": {
+                kind: {
+                    "url": f"/files/{f['filename']}",
+                    **({"value_range": f["value_range"]} if "value_range" in f else {}),
+                }
+                for kind, f in files.items()
+            },
+            "region_stats": [
+                dict(detection, depth=stats)
+                for detection, stats in zip(detections, result["region_stats"])
+            ]
+            if detections is not None
+            else None,
+            "stats": result["stats"],
+            "device_used": result["device_used"],
+            "message": "Analyse de profondeur terminée",
+        }
+    except Exception as e:
+        # Afficher l'erreur complète dans les logs
+        print("❌ ERREUR lors de l'analyse:")
+        print(traceback.format_exc())
+        raise HTTPException(
+            status_code=500, detail=f"Erreur lors de l'analyse: {str(e)}"
+        )
+
+
+@app.post("/detect/{filename}")
+async def detect_objects(filename: str):
+    """
+    Détecte les objets dans une image uploadée avec YOLO
+    """
+    file_path = UPLOAD_DIR / filename
+
+    if not file_path.exists():
+        raise HTTPException(status_code=404, detail="Image non trouvée")
+
+    try:
+        print(f"🔍 Début de la détection d'objets pour: {filename}")
+
+        # Détecter les objets (hors de la boucle d'événements)
+        result = await get_inference_executor().run(
+            "yolo", inference_tasks.detect_objects, file_path
+        )
+        get_claim_dossier().record(file_path, "objects", result)
+        print(f"✓ {result['stats']['total_objects']} objets détectés")
+
+        return {
+            "status": "success",
+            "original_image": f"/files/{filename}",
+            "annotated_image": f"/render/{filename}?kind=objects",
+            "detections": result["detections"],
+            "stats": result["stats"],
+            "message": "Détection d'objets terminée",
+        }
+    except Exception as e:
+        # Afficher l'erreur complète dans les logs
+        print("❌ ERREUR lors de la détection:")
+        print(traceback.format_exc())
+        raise HTTPException(
+            status_code=500, detail=f"Erreur lors de la détection: {str(e)}"
+        )
+
+
+@app.post("/detect/parts/{filename}")
+async def detect_parts(filename: str):
+    """
+    Détecte les pièces spécifiques (Zero-Shot) avec OWL-ViT
+    """
+    file_path = UPLOAD_DIR / filename
+
+    if not file_path.exists():
+        raise HTTPException(status_code=404, detail="Image non trouvée")
+
+    try:
+        print(f"🔍 Début de la détection de pièces pour: {filename}")
+
+        # Détecter les pièces (hors de la boucle d'événements)
+        result = await get_inference_executor().run(
+            "zero_shot", inference_tasks.detect_parts, file_path
+        )
+        get_claim_dossier().record(file_path, "parts", result)
+        print(f"✓ {result['stats']['total_objects']} pièces détectées")
+
+        return {
+            "status": "success",
+            "original_image": f"/files/{filename}",
+            "annotated_image": f"/render/{filename}?kind=parts",
+            "detections": result["detections"],
+            "stats": result["stats"],
+            "message": "Détection de pièces terminée",
+        }
+    except Exception as e:
+        print("❌ ERREUR lors de la détection de pièces:")
+        print(traceback.format_exc())
+        raise HTTPException(
+            status_code=500, detail=f"Erreur lors de la détection: {str(e)}"
+        )
+
+
+@app.get("/render/{filename}")
+async def render_annotations(
+    filename: str,
+    kind: str = "parts",
+    format: str = "jpeg",
+    quality: int = Query(AnnotationRenderer.DEFAULT_QUALITY, ge=1, le=100),
+    max_size: Optional[int] = Query(None, ge=16, le=8192),
+):
+    """
+    Image annotée rendue à la demande à partir des détections en cache.
+    kind: "parts" (OWL-ViT) ou "objects" (YOLO) ; format: jpeg, webp ou png ;
+    max_size: plus grand côté du rendu en pixels.
+    """
+    if kind not in ("parts", "objects"):
+        raise HTTPException(status_code=400, detail="kind doit être 'parts' ou 'objects'")
+    if format not in AnnotationRenderer.FORMATS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Format non supporté (choix: {', '.join(AnnotationRenderer.FORMATS)})",
+        )
+
+    file_path = UPLOAD_DIR / filename
+    if not file_path.exists():
+        raise HTTPException(status_code=404, detail="Image non trouvée")
+
+    result = get_claim_dossier().get(file_path, kind)
+    if result is None:
+        endpoint = "/detect/parts" if kind == "parts" else "/detect"
+        raise HTTPException(
+            status_code=404,
+            detail=f"Aucune détection en cache pour cette image (appeler {endpoint} d'abord)",
+        )
+
+    try:
+        output_path = await get_inference_executor().run(
+            "render",
+            inference_tasks.render_annotations,
+            file_path,
+            result["detections"],
+            format,
+            quality,
+            max_size,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=422, detail=str(e))
+
+    return FileResponse(
+        output_path, media_type=AnnotationRenderer.FORMATS[format][2]
+    )
+
+
+@app.post("/evaluate/claim")
+async def evaluate_claim(
+    image_filename: str, contract_filename: str, damage_type: str = "accident"
+):
+    """
+    Évalue si un sinistre est couvert par le contrat
+
+    Args:
+        image_filename: Nom du fichier image analysé
+        contract_filename: Nom du fichier contrat analysé
+        damage_type: Type de sinistre (accident, vol, incendie, etc.)
+    """
+    try:
+        print(f"\n🔍 Évaluation du sinistre:")
+        print(f"  - Image: {image_filename}")
+        print(f"  - Contrat: {contract_filename}")
+        print(f"  - Type: {damage_type}")
+
+        image_path = UPLOAD_DIR / image_filename
+        if not image_path.exists():
+            raise HTTPException(status_code=404, detail="Image non trouvée")
+
+        contract_path = UPLOAD_DIR / contract_filename
+        if not contract_path.exists():
+            raise HTTPException(status_code=404, detail="Contrat non trouvé")
+
+        result = await evaluate_claim_files(image_path, contract_path, damage_type)
+
+        print(
+            f"✅ Évaluation terminée en {result['timings']['total']}s "
+            f"(étapes réutilisées: {result['reused_stages']})"
+        )
+
+        return {
+            "status": "success",
+            "evaluation": result["evaluation"],
+            "image_filename": image_filename,
+            "contract_filename": contract_filename,
+            "damage_type": damage_type,
+            "reused_stages": result["reused_stages"],
+            "timings": result["timings"],
+            "message": "Évaluation du sinistre terminée",
+        }
+
+    except HTTPException:
+        raise
+    except Exception as e:
+        print("❌ ERREUR lors de l'évaluation:")
+        print(traceback.format_exc())
+        raise HTTPException(
+            status_code=500, detail=f"Erreur lors de l'évaluation: {str(e)}"
+        )
+
+
+class ClaimRequest(BaseModel):
+    """Sinistre à évaluer dans un lot"""
+
+    image_filename: str
+    contract_filename: str
+    damage_type: str = "accident"
+
+
+# Nombre de sinistres dont les images passent ensemble dans les modèles
+BATCH_CLAIM_CHUNK_SIZE = int(os.getenv("BATCH_CLAIM_CHUNK_SIZE", "8"))
+
+
+async def _image_stages_batch(image_paths: List[Path]) -> tuple:
+    """
+    Branche image pour plusieurs photos : les détections et depth maps absentes
+    du dossier sont calculées en un appel batché par modèle.
+
+    Returns:
+        Tuple (détections par chemin, profondeur par chemin)
+    """
+    dossier = get_claim_dossier()
+    executor = get_inference_executor()
+    parts = {path: dossier.get(path, "parts") for path in image_paths}
+    # Une estimation sans profondeur brute (ex: /analyze en aperçu seul) est refaite
+    depth = {}
+    for path in image_paths:
+        output = dossier.get(path, "depth")
+        depth[path] = output if has_depth_map(output) else None
+
+    async def run_batch(stage: str, model: str, task, outputs: dict, *args):
+        missing = [path for path, output in outputs.items() if output is None]
+        if not missing:
+            return
+        for path, output in zip(
+            missing, await executor.run(model, task, missing, *args)
+        ):
+            dossier.record(path, stage, output)
+            outputs[path] = output
+
+    await asyncio.gather(
+        run_batch("parts", "zero_shot", inference_tasks.detect_parts_batch, parts),
+        # Seule la profondeur brute est écrite (statistiques par pièce)
+        run_batch(
+            "depth", "depth", inference_tasks.estimate_depth_batch, depth, ("npy",)
+        ),
+    )
+    return parts, depth
+
+
+async def _evaluate_claims_stream(claims: List[ClaimRequest]):
+    """
+    Évalue les sinistres par paquets et produit une ligne NDJSON par sinistre,
+    dès que son évaluation est terminée.
+    """
+    evaluator = get_claim_evaluator()
+
+    def line(index: int, claim: ClaimRequest, **fields) -> str:
+        return (
+            json.dumps(
+                {
+                    "index": index,
+                    "image_filename": claim.image_filename,
+                    "contract_filename": claim.contract_filename,
+                    "damage_type": claim.damage_type,
+                    **fields,
+                },
+                default=float,
+            )
+            + "\n"
+        )
+
+    indexed_claims = list(enumerate(claims))
+    for chunk_start in range(0, len(indexed_claims), BATCH_CLAIM_CHUNK_SIZE):
+        chunk = indexed_claims[chunk_start : chunk_start + BATCH_CLAIM_CHUNK_SIZE]
+
+        # Vérifier l'existence des fichiers
+        valid = []
+        for index, claim in chunk:
+            image_path = UPLOAD_DIR / claim.image_filename
+            contract_path = UPLOAD_DIR / claim.contract_filename
+            if not image_path.exists():
+                yield line(index, claim, status="error", detail="Image non trouvée")
+            elif not contract_path.exists():
+                yield line(index, claim, status="error", detail="Contrat non trouvé")
+            else:
+                valid.append((index, claim, image_path, contract_path))
+        if not valid:
+            continue
+
+        # Branche contrat (une tâche par contrat distinct) en parallèle des images
+        contract_tasks = {}
+        for _, _, _, contract_path in valid:
+            if contract_path not in contract_tasks:
+                contract_tasks[contract_path] = asyncio.ensure_future(
+                    contract_stages(contract_path, [], {})
+                )
+
+        try:
+            try:
+                parts, depth = await _image_stages_batch(
+                    list(dict.fromkeys(image_path for _, _, image_path, _ in valid))
+                )
+            except Exception as e:
+                print("❌ ERREUR lors de l'analyse batchée des images:")
+                print(traceback.format_exc())
+                for index, claim, _, _ in valid:
+                    yield line(index, claim, status="error", detail=str(e))
+                continue
+
+            async def evaluate_one(index, claim, image_path, contract_path):
+                try:
+                    contract_data = await contract_tasks[contract_path]
+                    damage_data = {
+                        "detected_objects": await with_part_depth(
+                            parts[image_path].get("detections", []), depth[image_path]
+                        ),
+                        "depth_stats": depth[image_path].get("stats", {}),
+                    }
+                    get_claim_dossier().record(image_path, "damage", damage_data)
+                    evaluation = evaluator.evaluate_claim(
+                        damage_data=damage_data,
+                        contract_data=contract_data,
+                        damage_type=claim.damage_type,
+                    )
+                    return line(index, claim, status="success", evaluation=evaluation)
+                except Exception as e:
+                    print(f"❌ ERREUR lors de l'évaluation du sinistre {index}: {e}")
+                    return line(index, claim, status="error", detail=str(e))
+
+            for evaluated in asyncio.as_completed(
+                [evaluate_one(*claim_files) for claim_files in valid]
+            ):
+                yield await evaluated
+        finally:
+            # Échec des images ou client déconnecté : ne pas laisser les analyses
+            # de contrat tourner sans personne pour les attendre
+            for task in contract_tasks.values():
+                task.cancel()
+            await asyncio.gather(*contract_tasks.values(), return_exceptions=True)
+
+
+@app.post("/evaluate/claims/batch")
+async def evaluate_claims_batch(claims: List[ClaimRequest]):
+    """
+    Évalue un lot de sinistres et renvoie les résultats en NDJSON (une ligne par
+    sinistre, dans l'ordre de fin d'évaluation, avec son index dans le lot)
+
+    Args:
+        claims: Liste de (image_filename, contract_filename, damage_type)
+    """
+    print(f"\n📦 Évaluation batch de {len(claims)} sinistres")
+    return StreamingResponse(
+        _evaluate_claims_stream(claims), media_type="application/x-ndjson"
+    )
+
+
+class PortfolioScenario(BaseModel):
+    """Variante des termes de contrat appliquée à tout le portefeuille"""
+
+    name: Optional[str] = None
+    # Franchise imposée à tous les contrats, ou variation de la franchise actuelle
+    franchise: Optional[float] = None
+    franchise_delta: float = 0
+    # Plafond imposé à tous les contrats, ou variation des plafonds existants
+    plafond: Optional[float] = None
+    plafond_delta: float = 0
+    # Règles garantie -> types de sinistre couverts (remplacent celles de l'évaluateur)
+    coverage: Optional[Dict[str, List[str]]] = None
+
+
+class PortfolioSimulationRequest(BaseModel):
+    """Portefeuille de sinistres déjà analysés et scénarios à simuler"""
+
+    claims: List[ClaimRequest]
+    scenarios: List[PortfolioScenario] = []
+    # Grille : chaque scénario est combiné à chaque variation de franchise et de plafond
+    franchise_deltas: List[float] = []
+    plafond_deltas: List[float] = []
+    # Tirages Monte Carlo sur la confiance des détections (0 = coût estimé seul)
+    samples: int = 0
+    seed: Optional[int] = None
+
+
+@app.post("/simulate/portfolio")
+async def simulate_portfolio(request: PortfolioSimulationRequest):
+    """
+    Simulation what-if sur un portefeuille : couverture, remboursement et reste à
+    charge totaux pour chaque scénario, à partir des sorties enregistrées dans le
+    dossier de sinistre (les sinistres jamais analysés sont ignorés)
+    """
+    print(
+        f"\n📈 Simulation de portefeuille: {len(request.claims)} sinistres, "
+        f"{request.samples} tirages"
+    )
+    scenarios = PortfolioSimulator.sweep(
+        [
+            {key: value for key, value in vars(scenario).items() if value is not None}
+            for scenario in request.scenarios
+        ],
+        request.franchise_deltas,
+        request.plafond_deltas,
+    )
+    claims = [
+        (
+            UPLOAD_DIR / claim.image_filename,
+            UPLOAD_DIR / claim.contract_filename,
+            claim.damage_type,
+        )
+        for claim in request.claims
+    ]
+
+    try:
+        result = await get_inference_executor().run(
+            "simulation",
+            inference_tasks.simulate_portfolio,
+            claims,
+            scenarios,
+            request.samples,
+            request.seed,
+        )
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
+        print("❌ ERREUR lors de la simulation:")
+        print(traceback.format_exc())
+        raise HTTPException(
+            status_code=500, detail=f"Erreur lors de la simulation: {str(e)}"
+        )
+
+    print(
+        f"✅ Simulation terminée: {result['claims']} sinistres, "
+        f"{len(result['scenarios'])} scénarios en {result['timings']['simulation']}s"
+    )
+    return {"status": "success", **result}
+
+
+class JobRequest(BaseModel):
+    """Analyse longue exécutée par un worker de la file de jobs"""
+
+    # "evaluate_claim" (image + contrat) ou "analyze_contract" (contrat seul)
+    kind: str
+    image_filename: Optional[str] = None
+    contract_filename: Optional[str] = None
+    damage_type: str = "accident"
+
+
+@app.post("/jobs", status_code=202)
+def create_job(request: JobRequest):
+    """
+    Met en file une évaluation de sinistre ou une analyse de contrat et répond
+    immédiatement ; l'avancement et le résultat sont consultables sur /jobs/{id}
+    """
+    if request.kind not in JOB_KINDS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"kind doit être parmi {sorted(JOB_KINDS)}",
+        )
+    if request.contract_filename is None:
+        raise HTTPException(status_code=400, detail="contract_filename est requis")
+
+    contract_path = UPLOAD_DIR / request.contract_filename
+    if not contract_path.exists():
+        raise HTTPException(status_code=404, detail="Contrat non trouvé")
+
+    if request.kind == "evaluate_claim":
+        if request.image_filename is None:
+            raise HTTPException(status_code=400, detail="image_filename est requis")
+        image_path = UPLOAD_DIR / request.image_filename
+        if not image_path.exists():
+            raise HTTPException(status_code=404, detail="Image non trouvée")
+        params = {
+            "image_path": str(image_path),
+            "contract_path": str(contract_path),
+            "damage_type": request.damage_type,
+        }
+    else:
+        params = {"file_path": str(contract_path)}
+
+    job_id = get_job_queue().enqueue(request.kind, params)
+    print(f"📥 Job {job_id} ({request.kind}) mis en file")
+    return {
+        "status": "queued",
+        "job_id": job_id,
+        "url": f"/jobs/{job_id}",
+        "message": "Job mis en file",
+    }
+
+
+@app.get("/jobs")
+def jobs_stats():
+    """Nombre de jobs par statut et workers lancés avec l'API"""
+    return {"jobs": get_job_queue().stats(), "workers": get_job_workers().stats()}
+
+
+@app.get("/jobs/{job_id}")
+def job_status(job_id: str):
+    """
+    Statut d'un job (queued, running, succeeded, failed), avancement de chaque
+    étape et résultat une fois terminé
+    """
+    job = get_job_queue().get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job non trouvé")
+    return job
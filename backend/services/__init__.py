@@ -1 +1 @@
-# Services module
+# Services module
@@ -0,0 +1,164 @@
+"""
+Rendu à la demande des images annotées (bounding boxes).
+La détection ne dessine plus rien : les annotations sont produites par
+GET /render/{filename} à partir des détections en cache, puis le rendu encodé
+est lui-même mis en cache sur disque (clé = image + détections + options).
+"""
+
+import os
+import threading
+import uuid
+import zlib
+from pathlib import Path
+from typing import Dict, List, Optional
+import cv2
+from services.result_cache import ResultCache, hash_file
+from services.registry import get_registry
+
+
+class AnnotationRenderer:
+    """Dessine les détections sur une image et met le rendu en cache"""
+
+    # Format -> (extension, paramètre de qualité OpenCV, type MIME)
+    FORMATS = {
+        "jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY, "image/jpeg"),
+        "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY, "image/webp"),
+        "png": (".png", None, "image/png"),
+    }
+    DEFAULT_QUALITY = 85
+
+    def __init__(self, cache_dir: Path):
+        """
+        Args:
+            cache_dir: Dossier des rendus encodés
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "renders": 0}
+
+    def render(
+        self,
+        image_path: Path,
+        detections: List[Dict],
+        fmt: str = "jpeg",
+        quality: int = DEFAULT_QUALITY,
+        max_size: Optional[int] = None,
+    ) -> Path:
+        """
+        Retourne le chemin de l'image annotée, en la dessinant si besoin.
+
+        Args:
+            image_path: Image source
+            detections: Détections (class, confidence, bbox)
+            fmt: Format de sortie (voir FORMATS)
+            quality: Qualité d'encodage 1-100 (ignorée pour PNG)
+            max_size: Plus grand côté du rendu en pixels (None = taille d'origine)
+
+        Returns:
+            Chemin du rendu encodé
+        """
+        if fmt not in self.FORMATS:
+            raise ValueError(f"Format non supporté: {fmt}")
+        extension, quality_flag, _ = self.FORMATS[fmt]
+
+        key = ResultCache.make_key(
+            hash_file(image_path),
+            "annotations",
+            {
+                "detections": detections,
+                "format": fmt,
+                "quality": quality if quality_flag is not None else None,
+                "max_size": max_size,
+                # Pixels non tournés selon l'EXIF, comme l'image vue par les modèles
+                "orientation": "ignored",
+            },
+        )
+        output_path = self.cache_dir / key[:2] / f"{key}{extension}"
+        if output_path.exists():
+            with self._lock:
+                self.counters["hits"] += 1
+            return output_path
+
+        # Les détections sont calculées sur l'image PIL, qui n'applique pas
+        # l'orientation EXIF : OpenCV ne doit pas la tourner non plus
+        image = cv2.imread(
+            str(image_path), cv2.IMREAD_COLOR | cv2.IMREAD_IGNORE_ORIENTATION
+        )
+        if image is None:
+            raise ValueError(f"Image illisible: {image_path.name}")
+
+        # Réduire avant de dessiner : moins de pixels à dessiner et à encoder
+        scale = 1.0
+        height, width = image.shape[:2]
+        if max_size and max(height, width) > max_size:
+            scale = max_size / max(height, width)
+            image = cv2.resize(
+                image,
+                (max(1, round(width * scale)), max(1, round(height * scale))),
+                interpolation=cv2.INTER_AREA,
+            )
+
+        self._draw(image, detections, scale)
+
+        params = [quality_flag, int(quality)] if quality_flag is not None else []
+        ok, encoded = cv2.imencode(extension, image, params)
+        if not ok:
+            raise ValueError(f"Encodage {fmt} impossible")
+
+        # Écriture atomique : un rendu concurrent du même fichier reste valide
+        output_path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = output_path.with_name(f".{uuid.uuid4()}.tmp")
+        tmp_path.write_bytes(encoded.tobytes())
+        os.replace(tmp_path, output_path)
+
+        with self._lock:
+            self.counters["renders"] += 1
+        return output_path
+
+    @staticmethod
+    def _draw(image, detections: List[Dict], scale: float = 1.0):
+        """Dessine les bounding boxes et leurs labels (image BGR modifiée sur place)"""
+        for det in detections:
+            label_text = det["class"]
+            bbox = det["bbox"]
+            x1, y1, x2, y2 = (
+                int(bbox[k] * scale) for k in ("x1", "y1", "x2", "y2")
+            )
+
+            # Couleur stable pour chaque classe (crc32 du label)
+            color_seed = zlib.crc32(label_text.encode("utf-8")) % 255
+            color = (color_seed, (color_seed * 2) % 255, (color_seed * 3) % 255)
+
+            cv2.rectangle(image, (x1, y1), (x2, y2), color, 2)
+
+            # Ajouter le label
+            label_display = f"{label_text} {det['confidence']:.2f}"
+            (w, h), _ = cv2.getTextSize(label_display, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
+            cv2.rectangle(image, (x1, y1 - 20), (x1 + w, y1), color, -1)
+            cv2.putText(
+                image,
+                label_display,
+                (x1, y1 - 5),
+                cv2.FONT_HERSHEY_SIMPLEX,
+                0.5,
+                (255, 255, 255),
+                1,
+            )
+
+    def stats(self) -> Dict:
+        """Retourne les compteurs du cache de rendus"""
+        with self._lock:
+            return {**self.counters, "cache_dir": str(self.cache_dir)}
+
+
+def _create_annotation_renderer() -> AnnotationRenderer:
+    return AnnotationRenderer(
+        cache_dir=Path(os.getenv("RENDER_CACHE_DIR", "cache/renders"))
+    )
+
+
+# Instance globale
+def get_annotation_renderer() -> AnnotationRenderer:
+    """Retourne l'instance singleton de l'AnnotationRenderer"""
+    return get_registry().get("annotation_renderer", _create_annotation_renderer)
@@ -0,0 +1,118 @@
+"""
+Ordonnanceur de micro-batchs dynamiques.
+Regroupe les requêtes arrivant dans une fenêtre de temps (taille max, attente max)
+pour les traiter en un seul appel de modèle, puis redistribue les résultats
+à chaque appelant.
+"""
+
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional
+
+
+class MicroBatchScheduler:
+    """Collecte des requêtes concurrentes et les exécute par lots"""
+
+    def __init__(
+        self,
+        process_batch: Callable[[List[Any]], List[Any]],
+        max_batch_size: int = 4,
+        max_wait_ms: float = 10.0,
+        name: str = "batch",
+        initializer: Optional[Callable[[], None]] = None,
+    ):
+        """
+        Args:
+            process_batch: Fonction traitant une liste d'éléments et retournant
+                une liste de résultats dans le même ordre
+            max_batch_size: Nombre maximum d'éléments par lot
+            max_wait_ms: Attente maximum après le premier élément d'un lot
+                (plus long = meilleur débit, plus court = meilleure latence)
+            name: Nom du thread de traitement
+            initializer: Appelée une fois au démarrage du thread de traitement
+                (ex: budget de threads du modèle)
+        """
+        self.process_batch = process_batch
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait_ms = max(0.0, max_wait_ms)
+        self.name = name
+        self.initializer = initializer
+
+        self._queue: "queue.Queue[tuple]" = queue.Queue()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.counters = {"batches": 0, "items": 0, "largest_batch": 0}
+
+    def submit(self, item: Any) -> Future:
+        """
+        Ajoute un élément à la file et retourne un Future sur son résultat.
+        """
+        future: Future = Future()
+        self._ensure_worker()
+        self._queue.put((item, future))
+        return future
+
+    def run(self, item: Any) -> Any:
+        """Soumet un élément et attend son résultat (appel bloquant)"""
+        return self.submit(item).result()
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive():
+                self._thread = threading.Thread(
+                    target=self._worker, name=self.name, daemon=True
+                )
+                self._thread.start()
+
+    def _collect_batch(self) -> List[tuple]:
+        """Attend un premier élément puis complète le lot jusqu'à la limite"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait_ms / 1000
+
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining > 0:
+                    batch.append(self._queue.get(timeout=remaining))
+                else:
+                    batch.append(self._queue.get_nowait())
+            except queue.Empty:
+                break
+        return batch
+
+    def _worker(self):
+        if self.initializer is not None:
+            self.initializer()
+        while True:
+            batch = self._collect_batch()
+            items = [item for item, _ in batch]
+            futures = [future for _, future in batch]
+
+            try:
+                results = self.process_batch(items)
+            except Exception as e:
+                for future in futures:
+                    future.set_exception(e)
+                continue
+
+            self.counters["batches"] += 1
+            self.counters["items"] += len(items)
+            self.counters["largest_batch"] = max(
+                self.counters["largest_batch"], len(items)
+            )
+            for future, result in zip(futures, results):
+                future.set_result(result)
+
+    def stats(self) -> Dict:
+        """Retourne la configuration et la taille moyenne des lots"""
+        batches = self.counters["batches"]
+        return {
+            "max_batch_size": self.max_batch_size,
+            "max_wait_ms": self.max_wait_ms,
+            **self.counters,
+            "avg_batch_size": round(self.counters["items"] / batches, 2)
+            if batches
+            else 0,
+        }
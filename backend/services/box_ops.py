@@ -0,0 +1,135 @@
+"""
+Opérations vectorisées (NumPy) sur les bounding boxes.
+"""
+
+from typing import Dict, List, Optional
+import numpy as np
+
+
+def nms(
+    boxes: np.ndarray,
+    scores: np.ndarray,
+    iou_threshold: float = 0.5,
+    classes: Optional[np.ndarray] = None,
+) -> np.ndarray:
+    """
+    Non-Maximum Suppression glouton, vectorisé avec NumPy.
+    Une box est supprimée si son IoU avec une box mieux notée est >= iou_threshold.
+
+    Args:
+        boxes: Array [N, 4] de coordonnées (x1, y1, x2, y2)
+        scores: Array [N] des confiances
+        iou_threshold: Seuil IoU de suppression
+        classes: Array [N] d'identifiants de classe. Si fourni, la suppression
+            ne s'applique qu'entre boxes de la même classe (mode par classe) ;
+            sinon toutes les boxes sont comparées (mode agnostique)
+
+    Returns:
+        Indices des boxes conservées, par confiance décroissante
+    """
+    if len(boxes) == 0:
+        return np.empty(0, dtype=np.int64)
+
+    boxes = np.asarray(boxes, dtype=np.float64)
+    if classes is not None:
+        # Décaler chaque classe dans une zone disjointe : deux boxes de classes
+        # différentes n'ont alors jamais d'intersection
+        span = boxes.max() - min(boxes.min(), 0) + 1
+        boxes = boxes + (np.asarray(classes, dtype=np.float64) * span)[:, None]
+
+    x1, y1, x2, y2 = boxes[:, 0], boxes[:, 1], boxes[:, 2], boxes[:, 3]
+    areas = (x2 - x1) * (y2 - y1)
+
+    # Tri stable : à confiance égale, l'ordre d'origine est conservé
+    order = np.argsort(-np.asarray(scores), kind="stable")
+    keep = []
+
+    while order.size > 0:
+        best = order[0]
+        keep.append(best)
+        rest = order[1:]
+
+        # IoU de la meilleure box avec toutes les restantes
+        inter_w = np.maximum(0, np.minimum(x2[best], x2[rest]) - np.maximum(x1[best], x1[rest]))
+        inter_h = np.maximum(0, np.minimum(y2[best], y2[rest]) - np.maximum(y1[best], y1[rest]))
+        intersection = inter_w * inter_h
+        union = areas[best] + areas[rest] - intersection
+        iou = np.divide(
+            intersection, union, out=np.zeros_like(intersection), where=union > 0
+        )
+
+        order = rest[iou < iou_threshold]
+
+    return np.asarray(keep, dtype=np.int64)
+
+
+# Rapport (aire totale des boxes / pixels de la carte) au-delà duquel les tables de
+# sommes cumulées coûtent moins cher que mean/std calculés sur chaque zone
+# (voir benchmarks/bench_box_stats.py)
+SUMMED_AREA_MIN_RATIO = 8
+
+
+def box_region_stats(values: np.ndarray, boxes: np.ndarray) -> List[Optional[Dict]]:
+    """
+    Statistiques (mean, std, min, max) d'une carte 2D à l'intérieur de chaque box.
+
+    Coût : min et max sont lus sur la zone de chaque box, en O(aire de la box).
+    Mean et std aussi, sauf quand les boxes couvrent ensemble bien plus que la
+    carte (nombreuses boxes, grandes ou superposées) : ils viennent alors de tables
+    de sommes cumulées de values et values² (O(H x W) pour les construire, puis
+    O(1) par box) et seuls min et max restent proportionnels à l'aire.
+
+    Args:
+        values: Carte 2D [H, W] (ex: depth map)
+        boxes: Array [N, 4] de coordonnées (x1, y1, x2, y2) en pixels
+
+    Returns:
+        Liste (une entrée par box) de dicts mean, std, min, max, pixels,
+        ou None si la box ne recouvre aucun pixel de la carte
+    """
+    values = np.asarray(values, dtype=np.float64)
+    height, width = values.shape
+    if len(boxes) == 0:
+        return []
+
+    boxes = np.asarray(boxes, dtype=np.float64)
+    x1 = np.clip(np.floor(boxes[:, 0]), 0, width).astype(np.int64)
+    y1 = np.clip(np.floor(boxes[:, 1]), 0, height).astype(np.int64)
+    x2 = np.clip(np.ceil(boxes[:, 2]), 0, width).astype(np.int64)
+    y2 = np.clip(np.ceil(boxes[:, 3]), 0, height).astype(np.int64)
+    x2 = np.maximum(x2, x1)
+    y2 = np.maximum(y2, y1)
+    pixels = (x2 - x1) * (y2 - y1)
+
+    means = stds = None
+    if pixels.sum() > SUMMED_AREA_MIN_RATIO * values.size:
+        # Tables de sommes cumulées avec une ligne/colonne de zéros en tête
+        sums = np.zeros((height + 1, width + 1))
+        sums[1:, 1:] = values.cumsum(axis=0).cumsum(axis=1)
+        sq_sums = np.zeros((height + 1, width + 1))
+        sq_sums[1:, 1:] = (values * values).cumsum(axis=0).cumsum(axis=1)
+
+        def box_sum(table):
+            return table[y2, x2] - table[y1, x2] - table[y2, x1] + table[y1, x1]
+
+        safe_pixels = np.maximum(pixels, 1)
+        means = box_sum(sums) / safe_pixels
+        variances = np.maximum(box_sum(sq_sums) / safe_pixels - means * means, 0)
+        stds = np.sqrt(variances)
+
+    stats = []
+    for i in range(len(boxes)):
+        if pixels[i] == 0:
+            stats.append(None)
+            continue
+        region = values[y1[i] : y2[i], x1[i] : x2[i]]
+        stats.append(
+            {
+                "mean": float(region.mean() if means is None else means[i]),
+                "std": float(region.std() if stds is None else stds[i]),
+                "min": float(region.min()),
+                "max": float(region.max()),
+                "pixels": int(pixels[i]),
+            }
+        )
+    return stats
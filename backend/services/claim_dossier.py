@@ -0,0 +1,150 @@
+"""
+Dossier de sinistre persistant (SQLite).
+Enregistre la sortie de chaque étape d'analyse (détection de pièces et d'objets,
+profondeur, extraction et analyse de contrat) pour un fichier uploadé, afin que
+/evaluate/claim réutilise les résultats déjà calculés. Les dégâts d'une photo
+(pièces avec leur profondeur locale) y sont aussi gardés pour la simulation de
+portefeuille.
+"""
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+from services.result_cache import hash_file
+from services.registry import get_registry
+
+
+class ClaimDossier:
+    """Stockage des sorties d'étapes par fichier uploadé"""
+
+    # Étapes connues du pipeline d'évaluation
+    STAGES = ("parts", "objects", "depth", "extraction", "analysis", "damage")
+    # Nombre de fichiers par requête de get_many (limite de paramètres SQLite)
+    BULK_QUERY_SIZE = 500
+
+    def __init__(self, db_path: Path):
+        """
+        Args:
+            db_path: Chemin vers la base SQLite
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self._lock = threading.Lock()
+
+        with self._connect() as conn:
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS stage_outputs (
+                    filename TEXT NOT NULL,
+                    stage TEXT NOT NULL,
+                    content_hash TEXT NOT NULL,
+                    output TEXT NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (filename, stage)
+                )
+                """
+            )
+        print(f"🗂️ ClaimDossier prêt ({self.db_path})")
+
+    @contextmanager
+    def _connect(self):
+        """Ouvre une connexion, valide la transaction puis la ferme"""
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def record(self, file_path: Path, stage: str, output: Dict):
+        """
+        Enregistre la sortie d'une étape pour un fichier.
+
+        Args:
+            file_path: Chemin du fichier uploadé analysé
+            stage: Nom de l'étape (voir STAGES)
+            output: Résultat de l'étape (sérialisable en JSON)
+        """
+        if stage not in self.STAGES:
+            raise ValueError(f"Étape inconnue: {stage}")
+
+        with self._lock, self._connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO stage_outputs VALUES (?, ?, ?, ?, ?)",
+                (
+                    file_path.name,
+                    stage,
+                    hash_file(file_path),
+                    json.dumps(output, default=float),
+                    time.time(),
+                ),
+            )
+
+    def get(self, file_path: Path, stage: str) -> Optional[Dict]:
+        """
+        Retourne la sortie enregistrée d'une étape, ou None si absente.
+        Une sortie est ignorée si le contenu du fichier a changé depuis.
+        """
+        with self._lock, self._connect() as conn:
+            row = conn.execute(
+                "SELECT content_hash, output FROM stage_outputs "
+                "WHERE filename = ? AND stage = ?",
+                (file_path.name, stage),
+            ).fetchone()
+
+        if row is None or row[0] != hash_file(file_path):
+            return None
+        return json.loads(row[1])
+
+    def get_many(self, file_paths: List[Path], stage: str) -> Dict[Path, Dict]:
+        """
+        Sorties valides d'une étape pour plusieurs fichiers, lues par paquets
+        (une requête par paquet plutôt qu'une connexion par fichier).
+
+        Returns:
+            Dict chemin -> sortie (fichiers sans sortie valide ou supprimés absents)
+        """
+        by_name: Dict[str, List[Path]] = {}
+        for file_path in dict.fromkeys(file_paths):
+            by_name.setdefault(file_path.name, []).append(file_path)
+
+        names = list(by_name)
+        rows = []
+        with self._lock, self._connect() as conn:
+            for start in range(0, len(names), self.BULK_QUERY_SIZE):
+                chunk = names[start : start + self.BULK_QUERY_SIZE]
+                rows.extend(
+                    conn.execute(
+                        "SELECT filename, content_hash, output FROM stage_outputs "
+                        f"WHERE stage = ? AND filename IN ({', '.join('?' * len(chunk))})",
+                        (stage, *chunk),
+                    ).fetchall()
+                )
+
+        outputs = {}
+        for filename, content_hash, output in rows:
+            for file_path in by_name[filename]:
+                if file_path.exists() and hash_file(file_path) == content_hash:
+                    outputs[file_path] = json.loads(output)
+        return outputs
+
+    def get_all(self, file_path: Path) -> Dict[str, Dict]:
+        """Retourne toutes les sorties valides enregistrées pour un fichier"""
+        outputs = {}
+        for stage in self.STAGES:
+            output = self.get(file_path, stage)
+            if output is not None:
+                outputs[stage] = output
+        return outputs
+
+
+# Instance globale
+def get_claim_dossier() -> ClaimDossier:
+    """Retourne l'instance singleton du ClaimDossier"""
+    db_path = Path(os.getenv("CLAIM_DOSSIER_DB", "cache/claims.sqlite3"))
+    return get_registry().get("claim_dossier", lambda: ClaimDossier(db_path))
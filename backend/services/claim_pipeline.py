@@ -0,0 +1,276 @@
+"""
+Pipeline d'évaluation d'un sinistre (photo + contrat), partagé par l'API et les
+workers de la file de jobs. Chaque étape réutilise sa sortie si le dossier de
+sinistre la contient, sinon l'exécute via l'InferenceExecutor. L'avancement
+peut être suivi étape par étape (callback progress).
+"""
+
+import asyncio
+import time
+from pathlib import Path
+from typing import Callable, Dict, List, Optional
+from services.claim_dossier import get_claim_dossier
+from services.claim_evaluator import get_claim_evaluator
+from services.inference_executor import get_inference_executor
+from services import inference_tasks
+
+# progress(étape, état, durée) : état "running", "done" ou "reused"
+ProgressCallback = Callable[[str, str, Optional[float]], None]
+
+# Étapes de chaque pipeline, dans l'ordre où elles sont rapportées
+EVALUATE_CLAIM_STAGES = (
+    "parts",
+    "depth",
+    "extraction",
+    "analysis",
+    "part_depth",
+    "evaluation",
+)
+ANALYZE_CONTRACT_STAGES = ("extraction", "analysis")
+
+
+def _report(progress: Optional[ProgressCallback], stage: str, state: str, seconds=None):
+    if progress is not None:
+        progress(stage, state, seconds)
+
+
+def has_depth_map(depth_result: Optional[dict]) -> bool:
+    """La profondeur brute (npy) d'une estimation est-elle disponible ?"""
+    npy = (depth_result or {}).get("files", {}).get("npy")
+    return npy is not None and Path(npy["path"]).exists()
+
+
+async def run_stage(
+    stage: str,
+    file_path: Path,
+    model: str,
+    task,
+    *args,
+    reused_stages: list,
+    timings: dict,
+    lookup: bool = True,
+    reusable: Optional[Callable[[dict], bool]] = None,
+    progress: Optional[ProgressCallback] = None,
+):
+    """
+    Exécute une étape du pipeline, ou réutilise sa sortie si le dossier la contient
+    (et qu'elle satisfait reusable, ex: sorties demandées présentes)
+    """
+    start = time.perf_counter()
+    dossier = get_claim_dossier()
+
+    output = dossier.get(file_path, stage) if lookup else None
+    if output is not None and reusable is not None and not reusable(output):
+        output = None
+    if output is None:
+        _report(progress, stage, "running")
+        output = await get_inference_executor().run(model, task, *args)
+        dossier.record(file_path, stage, output)
+        state = "done"
+    else:
+        reused_stages.append(stage)
+        state = "reused"
+
+    timings[stage] = round(time.perf_counter() - start, 3)
+    _report(progress, stage, state, timings[stage])
+    return output
+
+
+async def with_part_depth(detections: list, depth_result: dict) -> list:
+    """
+    Ajoute à chaque détection les statistiques de profondeur de sa bounding box
+    (clé "depth"), sans nouvel appel au modèle. Les détections sont retournées
+    telles quelles si la depth map brute (npy) n'est pas disponible.
+    """
+    if not detections or not has_depth_map(depth_result):
+        return detections
+
+    region_stats = await get_inference_executor().run(
+        "regions",
+        inference_tasks.depth_region_stats,
+        depth_result,
+        [d["bbox"] for d in detections],
+    )
+    return [
+        dict(detection, depth=stats) if stats is not None else detection
+        for detection, stats in zip(detections, region_stats)
+    ]
+
+
+async def contract_stages(
+    contract_path: Path,
+    reused_stages: list,
+    timings: dict,
+    progress: Optional[ProgressCallback] = None,
+) -> dict:
+    """
+    Branche contrat du pipeline : extraction du texte puis analyse
+    """
+    contract_data = get_claim_dossier().get(contract_path, "analysis")
+    if contract_data is not None:
+        reused_stages.extend(["extraction", "analysis"])
+        _report(progress, "extraction", "reused", 0.0)
+        _report(progress, "analysis", "reused", 0.0)
+        return contract_data
+
+    extraction_result = await run_stage(
+        "extraction",
+        contract_path,
+        "contract",
+        inference_tasks.extract_contract_text,
+        contract_path,
+        reused_stages=reused_stages,
+        timings=timings,
+        progress=progress,
+    )
+    return await run_stage(
+        "analysis",
+        contract_path,
+        "contract",
+        inference_tasks.analyze_contract_text,
+        extraction_result["text"],
+        reused_stages=reused_stages,
+        timings=timings,
+        lookup=False,
+        progress=progress,
+    )
+
+
+async def evaluate_claim_files(
+    image_path: Path,
+    contract_path: Path,
+    damage_type: str,
+    progress: Optional[ProgressCallback] = None,
+) -> dict:
+    """
+    Pipeline complet d'évaluation d'un sinistre.
+    La branche image (pièces + profondeur) et la branche contrat
+    (extraction puis analyse) s'exécutent en parallèle.
+
+    Returns:
+        dict contenant l'évaluation, les étapes réutilisées et les temps par étape
+    """
+    reused_stages = []
+    timings = {}
+    branch_timings = {}
+    start = time.perf_counter()
+
+    async def image_branch():
+        branch_start = time.perf_counter()
+        # Détections de pièces et profondeur sont indépendantes
+        detection_result, depth_result = await asyncio.gather(
+            run_stage(
+                "parts",
+                image_path,
+                "zero_shot",
+                inference_tasks.detect_parts,
+                image_path,
+                reused_stages=reused_stages,
+                timings=timings,
+                progress=progress,
+            ),
+            run_stage(
+                "depth",
+                image_path,
+                "depth",
+                inference_tasks.estimate_depth,
+                image_path,
+                # Seule la profondeur brute est écrite (statistiques par pièce)
+                ("npy",),
+                reused_stages=reused_stages,
+                timings=timings,
+                # Une estimation sans npy (ex: /analyze en aperçu seul) est refaite
+                reusable=has_depth_map,
+                progress=progress,
+            ),
+        )
+        branch_timings["image"] = round(time.perf_counter() - branch_start, 3)
+        return detection_result, depth_result
+
+    async def contract_branch():
+        branch_start = time.perf_counter()
+        contract_data = await contract_stages(
+            contract_path, reused_stages, timings, progress=progress
+        )
+        branch_timings["contract"] = round(time.perf_counter() - branch_start, 3)
+        return contract_data
+
+    (detection_result, depth_result), contract_data = await asyncio.gather(
+        image_branch(), contract_branch()
+    )
+
+    # Profondeur locale de chaque pièce, lue sur la depth map déjà calculée
+    _report(progress, "part_depth", "running")
+    part_depth_start = time.perf_counter()
+    detected_objects = await with_part_depth(
+        detection_result.get("detections", []), depth_result
+    )
+    timings["part_depth"] = round(time.perf_counter() - part_depth_start, 3)
+    _report(progress, "part_depth", "done", timings["part_depth"])
+
+    # Construire les données de dégâts
+    damage_data = {
+        "detected_objects": detected_objects,
+        "depth_stats": depth_result.get("stats", {}),
+    }
+    # Gardé pour la simulation de portefeuille
+    get_claim_dossier().record(image_path, "damage", damage_data)
+
+    # Évaluer le sinistre
+    _report(progress, "evaluation", "running")
+    evaluation_start = time.perf_counter()
+    evaluator = get_claim_evaluator()
+    evaluation = evaluator.evaluate_claim(
+        damage_data=damage_data,
+        contract_data=contract_data,
+        damage_type=damage_type,
+    )
+    timings["evaluation"] = round(time.perf_counter() - evaluation_start, 3)
+    _report(progress, "evaluation", "done", timings["evaluation"])
+
+    return {
+        "evaluation": evaluation,
+        "reused_stages": reused_stages,
+        "timings": {
+            "stages": timings,
+            "branches": branch_timings,
+            "total": round(time.perf_counter() - start, 3),
+        },
+    }
+
+
+async def analyze_contract_file(
+    file_path: Path, progress: Optional[ProgressCallback] = None
+) -> Dict:
+    """
+    Extraction du texte puis analyse d'un contrat (franchise, plafond, garanties),
+    enregistrées dans le dossier de sinistre
+
+    Returns:
+        dict extraction, analysis
+    """
+    timings: Dict[str, float] = {}
+    reused_stages: List[str] = []
+    extraction_result = await run_stage(
+        "extraction",
+        file_path,
+        "contract",
+        inference_tasks.extract_contract_text,
+        file_path,
+        reused_stages=reused_stages,
+        timings=timings,
+        lookup=False,
+        progress=progress,
+    )
+    analysis_result = await run_stage(
+        "analysis",
+        file_path,
+        "contract",
+        inference_tasks.analyze_contract_text,
+        extraction_result["text"],
+        reused_stages=reused_stages,
+        timings=timings,
+        lookup=False,
+        progress=progress,
+    )
+    return {"extraction": extraction_result, "analysis": analysis_result}
@@ -1,154 +1,199 @@
-"""
-Service d'analyse de contrat d'assurance.
-Extrait les informations clés (franchise, plafond, garanties) via regex.
-"""
-
-import re
-from typing import Dict, Optional
-
-
-class ContractAnalyzer:
-    def __init__(self):
-        """
-        Initialise l'analyseur de contrat.
-        """
-        print("🔧 Initialisation du ContractAnalyzer...")
-        print("✅ ContractAnalyzer prêt")
-
-    def extract_franchise(self, text: str) -> Optional[Dict]:
-        """
-        Extrait la franchise du contrat.
-
-        Args:
-            text: Texte du contrat
-
-        Returns:
-            Dict avec la franchise trouvée ou None
-        """
-        # Patterns pour détecter la franchise
-        patterns = [
-            r"franchise[:\s]+(\d+[\s,.]?\d*)\s*€",
-            r"franchise[:\s]+(\d+[\s,.]?\d*)\s*euros?",
-            r"montant de la franchise[:\s]+(\d+[\s,.]?\d*)\s*€",
-        ]
-
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                amount = match.group(1).replace(" ", "").replace(",", ".")
-                return {"amount": float(amount), "currency": "EUR", "found": True}
-
-        return {"found": False, "amount": None}
-
-    def extract_plafond(self, text: str) -> Optional[Dict]:
-        """
-        Extrait le plafond de garantie du contrat.
-
-        Args:
-            text: Texte du contrat
-
-        Returns:
-            Dict avec le plafond trouvé ou None
-        """
-        # Patterns pour détecter le plafond
-        patterns = [
-            r"plafond[:\s]+(\d+[\s,.]?\d*)\s*€",
-            r"plafond de garantie[:\s]+(\d+[\s,.]?\d*)\s*€",
-            r"limite de garantie[:\s]+(\d+[\s,.]?\d*)\s*€",
-            r"montant maximum[:\s]+(\d+[\s,.]?\d*)\s*€",
-        ]
-
-        for pattern in patterns:
-            match = re.search(pattern, text, re.IGNORECASE)
-            if match:
-                amount = match.group(1).replace(" ", "").replace(",", ".")
-                return {"amount": float(amount), "currency": "EUR", "found": True}
-
-        return {"found": False, "amount": None}
-
-    def extract_garanties(self, text: str) -> Dict:
-        """
-        Détecte le type de garanties présentes dans le contrat.
-
-        Args:
-            text: Texte du contrat
-
-        Returns:
-            Dict avec les garanties détectées
-        """
-        garanties = {
-            "tous_risques": False,
-            "tiers": False,
-            "vol": False,
-            "incendie": False,
-            "bris_de_glace": False,
-            "assistance": False,
-        }
-
-        text_lower = text.lower()
-
-        if "tous risques" in text_lower or "tout risque" in text_lower:
-            garanties["tous_risques"] = True
-
-        if "responsabilité civile" in text_lower or "au tiers" in text_lower:
-            garanties["tiers"] = True
-
-        if "vol" in text_lower:
-            garanties["vol"] = True
-
-        if "incendie" in text_lower:
-            garanties["incendie"] = True
-
-        if "bris de glace" in text_lower or "brise de glace" in text_lower:
-            garanties["bris_de_glace"] = True
-
-        if "assistance" in text_lower or "dépannage" in text_lower:
-            garanties["assistance"] = True
-
-        return garanties
-
-    def analyze_contract(self, text: str) -> Dict:
-        """
-        Analyse complète du contrat.
-
-        Args:
-            text: Texte extrait du contrat
-
-        Returns:
-            Dict avec toutes les informations extraites
-        """
-        print("📋 Analyse du contrat en cours...")
-
-        franchise = self.extract_franchise(text)
-        plafond = self.extract_plafond(text)
-        garanties = self.extract_garanties(text)
-
-        # Compter les garanties actives
-        garanties_actives = [k for k, v in garanties.items() if v]
-
-        result = {
-            "franchise": franchise,
-            "plafond": plafond,
-            "garanties": garanties,
-            "summary": {
-                "franchise_found": franchise["found"],
-                "plafond_found": plafond["found"],
-                "garanties_count": len(garanties_actives),
-                "garanties_actives": garanties_actives,
-            },
-        }
-
-        print(f"✓ Analyse terminée: {len(garanties_actives)} garanties détectées")
-        return result
-
-
-# Instance globale
-_contract_analyzer = None
-
-
-def get_contract_analyzer() -> ContractAnalyzer:
-    """Retourne l'instance singleton du ContractAnalyzer"""
-    global _contract_analyzer
-    if _contract_analyzer is None:
-        _contract_analyzer = ContractAnalyzer()
-    return _contract_analyzer
+"""
+Service d'analyse de contrat d'assurance.
+Extrait les informations clés (franchise, plafond, garanties) via regex.
+Tous les marqueurs sont cherchés sur un même texte en minuscules (ContractMatcher).
+"""
+
+import re
+from typing import Dict, List, Optional
+from services.registry import get_registry
+
+AMOUNT = r"(\d+[\s,.]?\d*)"
+
+# Patterns de montant : (mot-clé d'ancrage, pattern), par ordre de priorité.
+# Le premier pattern trouvé n'importe où dans le texte l'emporte, puis sa
+# première occurrence. "montant de la franchise[:\s]+… €" n'a pas d'entrée :
+# toute occurrence contient "franchise[:\s]+… €", déjà prioritaire.
+FRANCHISE_PATTERNS = [
+    ("franchise", rf"franchise[:\s]+{AMOUNT}\s*€"),
+    ("franchise", rf"franchise[:\s]+{AMOUNT}\s*euros?"),
+]
+PLAFOND_PATTERNS = [
+    ("plafond", rf"plafond[:\s]+{AMOUNT}\s*€"),
+    ("plafond", rf"plafond de garantie[:\s]+{AMOUNT}\s*€"),
+    ("limite de garantie", rf"limite de garantie[:\s]+{AMOUNT}\s*€"),
+    ("montant maximum", rf"montant maximum[:\s]+{AMOUNT}\s*€"),
+]
+
+# Garantie -> expressions recherchées (sous-chaînes, insensibles à la casse)
+GARANTIE_KEYWORDS = {
+    "tous_risques": ("tous risques", "tout risque"),
+    "tiers": ("responsabilité civile", "au tiers"),
+    "vol": ("vol",),
+    "incendie": ("incendie",),
+    "bris_de_glace": ("bris de glace", "brise de glace"),
+    "assistance": ("assistance", "dépannage"),
+}
+
+
+class ContractMatcher:
+    """
+    Recherche de tous les marqueurs d'un contrat sur un seul texte en minuscules.
+    Les mots-clés sont localisés par recherche de sous-chaîne (str.find, en C),
+    puis les patterns de montant, précompilés, ne sont vérifiés qu'à ces
+    positions au lieu de parcourir tout le texte en IGNORECASE.
+    """
+
+    FIELDS = {"franchise": FRANCHISE_PATTERNS, "plafond": PLAFOND_PATTERNS}
+
+    def __init__(self):
+        self._patterns = {
+            field: [
+                (keyword, re.compile(pattern, re.IGNORECASE))
+                for keyword, pattern in patterns
+            ]
+            for field, patterns in self.FIELDS.items()
+        }
+
+    @staticmethod
+    def _positions(text: str, keyword: str) -> List[int]:
+        """Toutes les positions d'un mot-clé (y compris chevauchantes)"""
+        positions = []
+        position = text.find(keyword)
+        while position != -1:
+            positions.append(position)
+            position = text.find(keyword, position + 1)
+        return positions
+
+    def scan(self, text: str) -> Dict:
+        """
+        Args:
+            text: Texte du contrat
+
+        Returns:
+            dict franchise et plafond (match retenu ou None) et garanties (booléens)
+        """
+        # Un seul lower() partagé par tous les marqueurs ; les mots-clés et
+        # montants recherchés ne contiennent que des minuscules
+        text = text.lower()
+        positions: Dict[str, List[int]] = {}
+
+        markers = {}
+        for field, patterns in self._patterns.items():
+            markers[field] = None
+            for keyword, pattern in patterns:
+                if keyword not in positions:
+                    positions[keyword] = self._positions(text, keyword)
+                # Première occurrence du pattern = premier ancrage qui correspond
+                markers[field] = next(
+                    (
+                        match
+                        for match in (pattern.match(text, p) for p in positions[keyword])
+                        if match
+                    ),
+                    None,
+                )
+                if markers[field] is not None:
+                    break
+
+        markers["garanties"] = {
+            garantie: any(keyword in text for keyword in keywords)
+            for garantie, keywords in GARANTIE_KEYWORDS.items()
+        }
+        return markers
+
+
+class ContractAnalyzer:
+    def __init__(self):
+        """
+        Initialise l'analyseur de contrat.
+        """
+        print("🔧 Initialisation du ContractAnalyzer...")
+        self.matcher = ContractMatcher()
+        print("✅ ContractAnalyzer prêt")
+
+    @staticmethod
+    def _amount(match: Optional[re.Match]) -> Dict:
+        """Montant d'un match de franchise ou de plafond"""
+        if match is None:
+            return {"found": False, "amount": None}
+        amount = match.group(1).replace(" ", "").replace(",", ".")
+        return {"amount": float(amount), "currency": "EUR", "found": True}
+
+    def extract_franchise(self, text: str) -> Optional[Dict]:
+        """
+        Extrait la franchise du contrat.
+
+        Args:
+            text: Texte du contrat
+
+        Returns:
+            Dict avec la franchise trouvée ou None
+        """
+        return self._amount(self.matcher.scan(text)["franchise"])
+
+    def extract_plafond(self, text: str) -> Optional[Dict]:
+        """
+        Extrait le plafond de garantie du contrat.
+
+        Args:
+            text: Texte du contrat
+
+        Returns:
+            Dict avec le plafond trouvé ou None
+        """
+        return self._amount(self.matcher.scan(text)["plafond"])
+
+    def extract_garanties(self, text: str) -> Dict:
+        """
+        Détecte le type de garanties présentes dans le contrat.
+
+        Args:
+            text: Texte du contrat
+
+        Returns:
+            Dict avec les garanties détectées
+        """
+        return self.matcher.scan(text)["garanties"]
+
+    def analyze_contract(self, text: str) -> Dict:
+        """
+        Analyse complète du contrat.
+
+        Args:
+            text: Texte extrait du contrat
+
+        Returns:
+            Dict avec toutes les informations extraites
+        """
+        print("📋 Analyse du contrat en cours...")
+
+        # Une seule recherche des marqueurs pour la franchise, le plafond et les garanties
+        markers = self.matcher.scan(text)
+        franchise = self._amount(markers["franchise"])
+        plafond = self._amount(markers["plafond"])
+        garanties = markers["garanties"]
+
+        # Compter les garanties actives
+        garanties_actives = [k for k, v in garanties.items() if v]
+
+        result = {
+            "franchise": franchise,
+            "plafond": plafond,
+            "garanties": garanties,
+            "summary": {
+                "franchise_found": franchise["found"],
+                "plafond_found": plafond["found"],
+                "garanties_count": len(garanties_actives),
+                "garanties_actives": garanties_actives,
+            },
+        }
+
+        print(f"✓ Analyse terminée: {len(garanties_actives)} garanties détectées")
+        return result
+
+
+# Instance globale
+def get_contract_analyzer() -> ContractAnalyzer:
+    """Retourne l'instance singleton du ContractAnalyzer"""
+    return get_registry().get("contract_analyzer", ContractAnalyzer)
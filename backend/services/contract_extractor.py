@@ -1,115 +1,321 @@
-"""
-Service d'extraction de texte depuis des contrats (PDF ou images).
-Utilise PyPDF2 pour les PDF et pytesseract pour l'OCR sur images.
-"""
-
-from pathlib import Path
-from PyPDF2 import PdfReader
-import pytesseract
-from PIL import Image
-
-
-class ContractExtractor:
-    def __init__(self):
-        """
-        Initialise le service d'extraction de contrat.
-        """
-        print("🔧 Initialisation du ContractExtractor...")
-        # Tesseract path (Windows uniquement, à ajuster si installé)
-        # pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
-        print("✅ ContractExtractor prêt")
-
-    def extract_text_from_pdf(self, pdf_path: Path) -> str:
-        """
-        Extrait le texte d'un fichier PDF.
-
-        Args:
-            pdf_path: Chemin vers le fichier PDF
-
-        Returns:
-            Texte extrait du PDF
-        """
-        try:
-            reader = PdfReader(str(pdf_path))
-            text = ""
-
-            for page in reader.pages:
-                text += page.extract_text() + "\n"
-
-            return text.strip()
-        except Exception as e:
-            print(f"❌ Erreur lors de l'extraction PDF: {e}")
-            raise e
-
-    def extract_text_from_image(self, image_path: Path) -> str:
-        """
-        Extrait le texte d'une image via OCR (Tesseract).
-
-        Args:
-            image_path: Chemin vers l'image
-
-        Returns:
-            Texte extrait de l'image
-        """
-        try:
-            image = Image.open(image_path)
-            text = pytesseract.image_to_string(image, lang="fra")
-            return text.strip()
-        except Exception as e:
-            print(f"❌ Erreur lors de l'OCR: {e}")
-            # Si Tesseract n'est pas installé, retourner un message d'erreur explicite
-            if "tesseract is not installed" in str(e).lower():
-                raise Exception(
-                    "Tesseract OCR n'est pas installé. Veuillez utiliser un PDF ou installer Tesseract."
-                )
-            raise e
-
-    def extract_text(self, file_path: Path) -> dict:
-        """
-        Extrait le texte d'un fichier (PDF ou image).
-        Détecte automatiquement le type de fichier.
-
-        Args:
-            file_path: Chemin vers le fichier
-
-        Returns:
-            dict contenant le texte extrait et des métadonnées
-        """
-        file_extension = file_path.suffix.lower()
-
-        if file_extension == ".pdf":
-            print(f"📄 Extraction de texte depuis PDF: {file_path.name}")
-            text = self.extract_text_from_pdf(file_path)
-            method = "PDF"
-        elif file_extension in [".jpg", ".jpeg", ".png", ".bmp", ".tiff"]:
-            print(f"🖼️ Extraction de texte depuis image (OCR): {file_path.name}")
-            text = self.extract_text_from_image(file_path)
-            method = "OCR"
-        else:
-            raise ValueError(f"Type de fichier non supporté: {file_extension}")
-
-        # Statistiques
-        word_count = len(text.split())
-        char_count = len(text)
-
-        return {
-            "text": text,
-            "method": method,
-            "stats": {
-                "word_count": word_count,
-                "char_count": char_count,
-                "file_type": file_extension,
-            },
-        }
-
-
-# Instance globale
-_contract_extractor = None
-
-
-def get_contract_extractor() -> ContractExtractor:
-    """Retourne l'instance singleton du ContractExtractor"""
-    global _contract_extractor
-    if _contract_extractor is None:
-        _contract_extractor = ContractExtractor()
-    return _contract_extractor
+"""
+Service d'extraction de texte depuis des contrats (PDF ou images).
+Utilise PyPDF2 pour les PDF et pytesseract pour l'OCR sur images.
+Les PDF sont traités page par page : texte natif si la page en a un, sinon
+rendu de la page en image puis OCR (PDF scannés). Les pages sont réparties sur
+un pool de processus et rassemblées dans l'ordre du document.
+Le texte extrait (page par page) est mis en cache par hash du fichier :
+un contrat n'est analysé qu'une fois.
+"""
+
+import io
+import math
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, Iterator, List, Optional
+from PyPDF2 import PdfReader
+import pytesseract
+from PIL import Image
+from services.registry import get_registry
+from services.resource_governor import get_resource_governor
+from services.result_cache import get_result_cache, hash_file
+
+# En dessous de ce nombre de caractères, une page est considérée comme scannée
+MIN_TEXT_CHARS = 16
+# Pages traitées par tâche du pool (petit : les pages OCR sont lentes)
+MAX_PAGES_PER_TASK = 8
+
+
+def _render_page_images(reader: PdfReader, index: int, pdf_path: str, dpi: int) -> List:
+    """
+    Images à passer à l'OCR pour une page sans texte natif.
+    Avec pypdfium2 (optionnel) la page entière est rendue à la résolution dpi ;
+    sinon, ce sont les images intégrées à la page (cas des scans) qui sont lues.
+    """
+    try:
+        import pypdfium2
+    except ImportError:
+        pypdfium2 = None
+
+    if pypdfium2 is not None:
+        document = pypdfium2.PdfDocument(pdf_path)
+        try:
+            return [document[index].render(scale=dpi / 72).to_pil()]
+        finally:
+            document.close()
+
+    try:
+        embedded = reader.pages[index].images
+    except KeyError:
+        # Page sans ressources
+        return []
+    return [Image.open(io.BytesIO(image.data)) for image in embedded]
+
+
+def _init_page_process():
+    """
+    Un seul thread tesseract par processus du pool : les pages parallèles
+    se partagent déjà le budget "contract" du gouverneur
+    """
+    os.environ["OMP_THREAD_LIMIT"] = "1"
+
+
+def _extract_page_range(
+    pdf_path: str, start: int, stop: int, lang: str, dpi: int
+) -> List[Dict]:
+    """
+    Extrait les pages [start, stop) d'un PDF (exécuté dans un processus du pool).
+
+    Returns:
+        Une entrée par page : page, text, method ("OCR" si le texte vient de
+        l'OCR, sinon "PDF") et, si l'OCR a échoué, error
+    """
+    reader = PdfReader(pdf_path)
+    pages = []
+    for index in range(start, stop):
+        text = reader.pages[index].extract_text() or ""
+        entry = {"page": index + 1, "text": text, "method": "PDF"}
+
+        if len(text.strip()) < MIN_TEXT_CHARS:
+            # Page scannée : rendu en image puis OCR
+            try:
+                images = _render_page_images(reader, index, pdf_path, dpi)
+                ocr_texts = [
+                    pytesseract.image_to_string(image, lang=lang).strip()
+                    for image in images
+                ]
+                # Garder le texte natif (méthode "PDF") si l'OCR ne trouve rien de plus
+                if sum(len(t) for t in ocr_texts) > len(text.strip()):
+                    entry["text"] = "\n".join(ocr_texts)
+                    entry["method"] = "OCR"
+            except Exception as e:
+                entry["error"] = str(e)
+
+        pages.append(entry)
+    return pages
+
+
+class ContractExtractor:
+    # Identifiant de l'extraction dans la clé de cache (à changer si le format évolue)
+    MODEL_ID = "contract-text-v2"
+    OCR_LANG = "fra"
+    IMAGE_EXTENSIONS = [".jpg", ".jpeg", ".png", ".bmp", ".tiff"]
+
+    def __init__(self, workers: Optional[int] = None, ocr_dpi: int = 300):
+        """
+        Initialise le service d'extraction de contrat.
+
+        Args:
+            workers: Processus du pool d'extraction des pages (défaut: budget de
+                threads "contract" du gouverneur, 1 = extraction dans le processus
+                courant)
+            ocr_dpi: Résolution du rendu des pages scannées avant OCR
+        """
+        print("🔧 Initialisation du ContractExtractor...")
+        # Tesseract path (Windows uniquement, à ajuster si installé)
+        # pytesseract.pytesseract.tesseract_cmd = r'C:\Program Files\Tesseract-OCR\tesseract.exe'
+        # Chaque worker d'inférence "contract" a son propre pool : borné par son
+        # budget de threads, pour que (workers x pages) reste dans les cœurs
+        self.workers = max(1, workers or get_resource_governor().threads("contract"))
+        self.ocr_dpi = ocr_dpi
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
+        print(f"✅ ContractExtractor prêt ({self.workers} processus pour les pages)")
+
+    @property
+    def pool(self) -> ProcessPoolExecutor:
+        """Crée le pool à la première utilisation"""
+        with self._pool_lock:
+            if self._pool is None:
+                # "spawn" : pas de fork d'un processus qui a déjà lancé les
+                # threads de torch
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.workers,
+                    mp_context=multiprocessing.get_context("spawn"),
+                    initializer=_init_page_process,
+                )
+            return self._pool
+
+    def iter_pdf_pages(self, pdf_path: Path) -> Iterator[Dict]:
+        """
+        Extrait les pages d'un PDF, réparties sur le pool de processus.
+        Les pages sont produites dans l'ordre du document, dès que disponibles.
+
+        Args:
+            pdf_path: Chemin vers le fichier PDF
+
+        Yields:
+            dict page, text, method ("PDF" ou "OCR") et error si l'OCR a échoué
+        """
+        try:
+            page_count = len(PdfReader(str(pdf_path)).pages)
+        except Exception as e:
+            print(f"❌ Erreur lors de l'extraction PDF: {e}")
+            raise e
+
+        # Découpage en plages de pages : environ une tâche par processus,
+        # plus petites pour équilibrer la charge sur les longs documents
+        pages_per_task = max(
+            1, min(MAX_PAGES_PER_TASK, math.ceil(page_count / self.workers))
+        )
+        tasks = [
+            (str(pdf_path), start, min(start + pages_per_task, page_count))
+            for start in range(0, page_count, pages_per_task)
+        ]
+        options = (self.OCR_LANG, self.ocr_dpi)
+
+        if self.workers == 1 or len(tasks) <= 1:
+            for task in tasks:
+                yield from _extract_page_range(*task, *options)
+            return
+
+        futures = [self.pool.submit(_extract_page_range, *task, *options) for task in tasks]
+        try:
+            for future in futures:
+                yield from future.result()
+        finally:
+            for future in futures:
+                future.cancel()
+
+    def extract_pages_from_pdf(self, pdf_path: Path) -> List[str]:
+        """
+        Extrait le texte de chaque page d'un fichier PDF.
+
+        Args:
+            pdf_path: Chemin vers le fichier PDF
+
+        Returns:
+            Texte de chaque page, dans l'ordre du document
+        """
+        return [page["text"] for page in self.iter_pdf_pages(pdf_path)]
+
+    def extract_text_from_pdf(self, pdf_path: Path) -> str:
+        """
+        Extrait le texte d'un fichier PDF.
+
+        Args:
+            pdf_path: Chemin vers le fichier PDF
+
+        Returns:
+            Texte extrait du PDF
+        """
+        # Un seul join : coût linéaire quel que soit le nombre de pages
+        return "\n".join(self.extract_pages_from_pdf(pdf_path)).strip()
+
+    def extract_text_from_image(self, image_path: Path) -> str:
+        """
+        Extrait le texte d'une image via OCR (Tesseract).
+
+        Args:
+            image_path: Chemin vers l'image
+
+        Returns:
+            Texte extrait de l'image
+        """
+        try:
+            image = Image.open(image_path)
+            text = pytesseract.image_to_string(image, lang=self.OCR_LANG)
+            return text.strip()
+        except Exception as e:
+            print(f"❌ Erreur lors de l'OCR: {e}")
+            # Si Tesseract n'est pas installé, retourner un message d'erreur explicite
+            if "tesseract is not installed" in str(e).lower():
+                raise Exception(
+                    "Tesseract OCR n'est pas installé. Veuillez utiliser un PDF ou installer Tesseract."
+                )
+            raise e
+
+    def extract_text(self, file_path: Path) -> dict:
+        """
+        Extrait le texte d'un fichier (PDF ou image).
+        Détecte automatiquement le type de fichier.
+
+        Args:
+            file_path: Chemin vers le fichier
+
+        Returns:
+            dict contenant le texte extrait, les métadonnées de chaque page (page,
+            method, word_count, char_count, error si l'OCR a échoué) et des statistiques
+        """
+        file_extension = file_path.suffix.lower()
+        if file_extension != ".pdf" and file_extension not in self.IMAGE_EXTENSIONS:
+            raise ValueError(f"Type de fichier non supporté: {file_extension}")
+
+        # Texte déjà extrait pour ce contenu ?
+        cache = get_result_cache()
+        cache_key = cache.make_key(
+            hash_file(file_path),
+            self.MODEL_ID,
+            {"file_type": file_extension, "lang": self.OCR_LANG, "ocr_dpi": self.ocr_dpi},
+        )
+        cached = cache.get(cache_key)
+        if cached is not None:
+            return cached
+
+        ocr_errors = []
+        if file_extension == ".pdf":
+            print(f"📄 Extraction de texte depuis PDF: {file_path.name}")
+            pages = list(self.iter_pdf_pages(file_path))
+            text = "\n".join(page["text"] for page in pages).strip()
+            methods = {page["method"] for page in pages}
+            # "PDF", "OCR" (PDF scanné) ou "PDF+OCR" (document mixte)
+            method = "+".join(m for m in ("PDF", "OCR") if m in methods) or "PDF"
+            ocr_errors = [page for page in pages if "error" in page]
+            if ocr_errors:
+                print(
+                    f"⚠️ OCR impossible sur {len(ocr_errors)} page(s) scannée(s): "
+                    f"{ocr_errors[0]['error']}"
+                )
+        else:
+            print(f"🖼️ Extraction de texte depuis image (OCR): {file_path.name}")
+            text = self.extract_text_from_image(file_path)
+            pages = [{"page": 1, "text": text, "method": "OCR"}]
+            method = "OCR"
+
+        # Statistiques
+        word_count = len(text.split())
+        char_count = len(text)
+
+        result = {
+            "text": text,
+            "method": method,
+            # Métadonnées seules : le texte des pages est déjà dans "text"
+            "pages": [
+                {
+                    **{key: value for key, value in page.items() if key != "text"},
+                    "word_count": len(page["text"].split()),
+                    "char_count": len(page["text"]),
+                }
+                for page in pages
+            ],
+            "stats": {
+                "word_count": word_count,
+                "char_count": char_count,
+                "page_count": len(pages),
+                "ocr_pages": sum(1 for page in pages if page["method"] == "OCR"),
+                "file_type": file_extension,
+            },
+        }
+        # Échec d'OCR (souvent transitoire : tesseract absent, mémoire) : pas de
+        # mise en cache, la prochaine analyse retentera les pages concernées
+        if not ocr_errors:
+            cache.set(cache_key, result)
+
+        return result
+
+
+def _create_contract_extractor() -> ContractExtractor:
+    workers = os.getenv("CONTRACT_EXTRACT_WORKERS")
+    return ContractExtractor(
+        workers=int(workers) if workers else None,
+        ocr_dpi=int(os.getenv("CONTRACT_OCR_DPI", "300")),
+    )
+
+
+# Instance globale
+def get_contract_extractor() -> ContractExtractor:
+    """Retourne l'instance singleton du ContractExtractor (configurée par variables d'environnement)"""
+    return get_registry().get("contract_extractor", _create_contract_extractor)
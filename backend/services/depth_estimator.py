@@ -1,97 +1,378 @@
-"""
-Service de Depth Estimation utilisant Depth Anything de Hugging Face
-"""
-
-from pathlib import Path
-from PIL import Image
-import torch
-from transformers import pipeline
-import numpy as np
-import cv2
-
-
-class DepthEstimator:
-    def __init__(self):
-        """
-        Initialise le service de depth estimation.
-        Le modèle sera chargé à la première utilisation (lazy loading).
-        """
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        self.pipe = None
-        print(f"🔧 DepthEstimator initialisé (modèle sera chargé à la demande)")
-
-    def _load_model(self):
-        """Charge le modèle si pas encore chargé (lazy loading)"""
-        if self.pipe is None:
-            print(f"📥 Chargement du modèle Depth Estimation sur {self.device}...")
-            self.pipe = pipeline(
-                task="depth-estimation",
-                model="LiheYoung/depth-anything-small-hf",
-                device=0 if self.device == "cuda" else -1,
-            )
-            print("✅ Modèle Depth Estimation chargé avec succès")
-
-    def estimate_depth(self, image_path: Path) -> dict:
-        """
-        Génère une depth map à partir d'une image.
-
-        Args:
-            image_path: Chemin vers l'image source
-
-        Returns:
-            dict contenant:
-                - depth_map_path: Chemin vers la depth map générée
-                - depth_array: Array numpy de la profondeur
-                - stats: Statistiques (min, max, mean)
-        """
-        # Charger le modèle si pas encore fait
-        self._load_model()
-
-        # Charger l'image
-        image = Image.open(image_path).convert("RGB")
-
-        # Générer la depth map
-        result = self.pipe(image)
-        depth_map = result["depth"]
-
-        # Convertir en numpy array pour traitement
-        depth_array = np.array(depth_map)
-
-        # Normaliser pour visualisation (0-255)
-        depth_normalized = cv2.normalize(
-            depth_array, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U
-        )
-
-        # Appliquer une colormap pour meilleure visualisation
-        depth_colored = cv2.applyColorMap(depth_normalized, cv2.COLORMAP_INFERNO)
-
-        # Sauvegarder la depth map
-        output_path = image_path.parent / f"depth_{image_path.name}"
-        cv2.imwrite(str(output_path), depth_colored)
-
-        # Calculer des statistiques
-        stats = {
-            "min_depth": float(depth_array.min()),
-            "max_depth": float(depth_array.max()),
-            "mean_depth": float(depth_array.mean()),
-            "std_depth": float(depth_array.std()),
-        }
-
-        return {
-            "depth_map_path": str(output_path),
-            "depth_map_filename": output_path.name,
-            "stats": stats,
-            "device_used": self.device,
-        }
-
-
-# Instance globale (singleton pattern)
-_depth_estimator = None
-
-
-def get_depth_estimator() -> DepthEstimator:
-    """Retourne l'instance singleton du DepthEstimator"""
-    global _depth_estimator
-    if _depth_estimator is None:
-        _depth_estimator = DepthEstimator()
-    return _depth_estimator
+"""
+Service de Depth Estimation utilisant Depth Anything de Hugging Face
+"""
+
+import hashlib
+import json
+import os
+import threading
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+from PIL import Image
+import torch
+from transformers import pipeline
+import numpy as np
+import cv2
+from services.result_cache import get_result_cache, hash_file
+from services.registry import get_registry
+from services.box_ops import box_region_stats
+from services.shared_image import get_shared_image_cache
+from services.resource_governor import get_resource_governor
+from services.onnx_backend import (
+    DEPTH_GRAPH,
+    OnnxDepthPipeline,
+    get_inference_backend,
+    onnx_model_path,
+)
+
+
+class DepthEstimator:
+    MODEL_ID = "LiheYoung/depth-anything-small-hf"
+    # Fichiers produits à la demande (les statistiques sont toujours calculées) :
+    # aperçu colorisé, profondeur brute float16 (.npy) ou PNG 16 bits
+    OUTPUTS = ("preview", "npy", "png16")
+    DEFAULT_OUTPUTS = ("preview",)
+    # Format d'aperçu -> (extension, paramètre de qualité OpenCV)
+    PREVIEW_FORMATS = {
+        "jpeg": (".jpg", cv2.IMWRITE_JPEG_QUALITY),
+        "webp": (".webp", cv2.IMWRITE_WEBP_QUALITY),
+        "png": (".png", None),
+    }
+
+    def __init__(self, backend: str = None):
+        """
+        Initialise le service de depth estimation.
+        Le modèle sera chargé à la première utilisation (lazy loading).
+
+        Args:
+            backend: "torch" ou "onnx" (défaut: variable INFERENCE_BACKEND)
+        """
+        self.backend = backend or get_inference_backend()
+        # Variante du modèle (fait partie de la clé de cache) : fp32 ou int8 en ONNX
+        self.model_variant = (
+            onnx_model_path(DEPTH_GRAPH).name if self.backend == "onnx" else self.backend
+        )
+        self.device = (
+            "cuda" if torch.cuda.is_available() and self.backend == "torch" else "cpu"
+        )
+        self.pipe = None
+        self._load_lock = threading.Lock()
+        self.preview_format = os.getenv("DEPTH_PREVIEW_FORMAT", "jpeg").lower()
+        self.preview_quality = int(os.getenv("DEPTH_PREVIEW_QUALITY", "90"))
+        print(f"🔧 DepthEstimator initialisé (modèle sera chargé à la demande)")
+
+    def _load_model(self):
+        """Charge le modèle si pas encore chargé (lazy loading, une seule fois)"""
+        if self.pipe is not None:
+            return
+
+        with self._load_lock:
+            if self.pipe is None:
+                print(
+                    f"📥 Chargement du modèle Depth Estimation sur {self.device} "
+                    f"({self.model_variant})..."
+                )
+                with get_registry().measure("depth_pipeline"):
+                    if self.backend == "onnx":
+                        self.pipe = OnnxDepthPipeline(
+                            self.MODEL_ID,
+                            onnx_model_path(DEPTH_GRAPH),
+                            threads=get_resource_governor().threads("depth"),
+                        )
+                    else:
+                        self.pipe = pipeline(
+                            task="depth-estimation",
+                            model=self.MODEL_ID,
+                            device=0 if self.device == "cuda" else -1,
+                        )
+                print("✅ Modèle Depth Estimation chargé avec succès")
+
+    def warmup(self):
+        """Charge le modèle et exécute une inférence sur une image synthétique"""
+        self._load_model()
+        self.pipe(Image.new("RGB", (640, 480)))
+        print("🔥 Depth Estimation préchauffé")
+
+    def estimate_depth(
+        self,
+        image_path: Path,
+        outputs: Optional[Iterable[str]] = None,
+        preview_format: Optional[str] = None,
+        quality: Optional[int] = None,
+        boxes: Optional[List[Dict]] = None,
+        raw_depths: Optional[Dict[str, np.ndarray]] = None,
+    ) -> dict:
+        """
+        Génère une depth map à partir d'une image.
+
+        Args:
+            image_path: Chemin vers l'image source
+            outputs: Fichiers à produire parmi OUTPUTS (défaut: DEFAULT_OUTPUTS).
+                Une séquence vide ne calcule que les statistiques (aucun fichier écrit)
+            preview_format: Format de l'aperçu colorisé (jpeg, webp ou png)
+            quality: Qualité d'encodage de l'aperçu (1-100)
+            boxes: Bounding boxes (dicts x1, y1, x2, y2) dont on veut les
+                statistiques de profondeur locales (ajoute la sortie npy)
+            raw_depths: Voir estimate_depth_batch
+
+        Returns:
+            dict contenant:
+                - stats: Statistiques (min, max, mean, std)
+                - files: Fichiers produits par type de sortie
+                - depth_map_path / depth_map_filename: Aperçu colorisé (si demandé)
+                - region_stats: Statistiques par box (si boxes est fourni)
+        """
+        if boxes is not None:
+            outputs = set(self.DEFAULT_OUTPUTS if outputs is None else outputs) | {"npy"}
+
+        result = self.estimate_depth_batch(
+            [image_path],
+            outputs,
+            preview_format=preview_format,
+            quality=quality,
+            raw_depths=raw_depths,
+        )[0]
+
+        if boxes is not None:
+            result = dict(result, region_stats=self.region_stats(result, boxes))
+        return result
+
+    def estimate_depth_batch(
+        self,
+        image_paths: list,
+        outputs: Optional[Iterable[str]] = None,
+        preview_format: Optional[str] = None,
+        quality: Optional[int] = None,
+        raw_depths: Optional[Dict[str, np.ndarray]] = None,
+    ) -> list:
+        """
+        Génère les depth maps de plusieurs images.
+        Les images absentes du cache passent ensemble dans le pipeline.
+
+        Args:
+            image_paths: Chemins vers les images sources
+            outputs, preview_format, quality: Voir estimate_depth
+            raw_depths: Rempli avec la profondeur brute écrite dans chaque sortie npy
+                (chemin du fichier -> tableau float16), pour la partager sans relire le fichier
+
+        Returns:
+            Liste de dicts (voir estimate_depth), dans l'ordre des chemins
+        """
+        options = self._output_options(outputs, preview_format, quality)
+
+        # Résultats déjà calculés pour ces contenus et ces sorties ?
+        cache = get_result_cache()
+        results = [None] * len(image_paths)
+        cache_keys = {}
+        for index, image_path in enumerate(image_paths):
+            cache_key = cache.make_key(hash_file(image_path), self.MODEL_ID, options)
+            cached = cache.get(cache_key)
+            if cached is not None and all(
+                Path(f["path"]).exists() for f in cached.get("files", {}).values()
+            ):
+                results[index] = cached
+            else:
+                cache_keys[index] = cache_key
+
+        if not cache_keys:
+            return results
+
+        # Charger le modèle si pas encore fait
+        self._load_model()
+
+        # Images décodées une seule fois, partagées avec les autres modèles
+        missing = list(cache_keys)
+        image_cache = get_shared_image_cache()
+        shared_images = [image_cache.get(image_paths[i]) for i in missing]
+        images = [shared.rgb for shared in shared_images]
+
+        # Générer les depth maps : le processeur conserve le ratio d'aspect,
+        # seules les images de même taille peuvent partager un batch
+        groups = {}
+        for position, image in enumerate(images):
+            groups.setdefault(image.size, []).append(position)
+
+        for positions in groups.values():
+            outputs_batch = self.pipe(
+                [images[p] for p in positions], batch_size=len(positions)
+            )
+            for position, output in zip(positions, outputs_batch):
+                index = missing[position]
+                results[index] = self._save_depth(
+                    image_paths[index], output, options, raw_depths
+                )
+                results[index]["image_size"] = list(shared_images[position].original_size)
+                cache.set(cache_keys[index], results[index])
+
+        return results
+
+    def _output_options(
+        self,
+        outputs: Optional[Iterable[str]],
+        preview_format: Optional[str],
+        quality: Optional[int],
+    ) -> dict:
+        """Valide et normalise les options de sortie (elles font partie de la clé de cache)"""
+        outputs = sorted(set(self.DEFAULT_OUTPUTS if outputs is None else outputs))
+        unknown = [o for o in outputs if o not in self.OUTPUTS]
+        if unknown:
+            raise ValueError(f"Sortie de profondeur inconnue: {', '.join(unknown)}")
+
+        options = {"outputs": outputs, "backend": self.model_variant}
+        if "preview" in outputs:
+            preview_format = preview_format or self.preview_format
+            if preview_format not in self.PREVIEW_FORMATS:
+                raise ValueError(f"Format d'aperçu non supporté: {preview_format}")
+            options["preview_format"] = preview_format
+            if self.PREVIEW_FORMATS[preview_format][1] is not None:
+                options["quality"] = int(quality or self.preview_quality)
+        return options
+
+    def _save_depth(
+        self,
+        image_path: Path,
+        output: dict,
+        options: dict,
+        raw_depths: Optional[Dict[str, np.ndarray]] = None,
+    ) -> dict:
+        """Écrit les sorties demandées et calcule les statistiques de la depth map"""
+        # Depth map normalisée 0-255 du pipeline (échelle des statistiques)
+        depth_array = np.array(output["depth"])
+        outputs = options["outputs"]
+        files = {}
+
+        if "preview" in outputs:
+            extension, quality_flag = self.PREVIEW_FORMATS[options["preview_format"]]
+
+            # Normaliser pour visualisation (0-255)
+            depth_normalized = cv2.normalize(
+                depth_array, None, 0, 255, cv2.NORM_MINMAX, dtype=cv2.CV_8U
+            )
+
+            # Appliquer une colormap pour meilleure visualisation
+            depth_colored = cv2.applyColorMap(depth_normalized, cv2.COLORMAP_INFERNO)
+
+            params = [quality_flag, options["quality"]] if quality_flag is not None else []
+            tag = self._file_tag(options, ("backend", "preview_format", "quality"))
+            output_path = image_path.parent / f"depth_{image_path.stem}_{tag}{extension}"
+            cv2.imwrite(str(output_path), depth_colored, params)
+            files["preview"] = {"path": str(output_path), "filename": output_path.name}
+
+        if "npy" in outputs or "png16" in outputs:
+            raw = self._raw_depth(output, depth_array.shape)
+            # La profondeur brute ne dépend que du modèle (pas de la qualité d'aperçu)
+            tag = self._file_tag(options, ("backend",))
+
+            if "npy" in outputs:
+                # float16 non compressé : lisible avec np.load(path, mmap_mode="r")
+                output_path = image_path.parent / f"depth_{image_path.stem}_{tag}.npy"
+                raw16 = raw.astype(np.float16)
+                np.save(output_path, raw16)
+                if raw_depths is not None:
+                    raw_depths[str(output_path)] = raw16
+                files["npy"] = {"path": str(output_path), "filename": output_path.name}
+
+            if "png16" in outputs:
+                # Quantification 16 bits : valeur = min + pixel / 65535 * (max - min)
+                low, high = float(raw.min()), float(raw.max())
+                scaled = (raw - low) / (high - low) if high > low else np.zeros_like(raw)
+                output_path = image_path.parent / f"depth16_{image_path.stem}_{tag}.png"
+                cv2.imwrite(
+                    str(output_path),
+                    np.round(scaled * 65535).astype(np.uint16),
+                    [cv2.IMWRITE_PNG_COMPRESSION, 3],
+                )
+                files["png16"] = {
+                    "path": str(output_path),
+                    "filename": output_path.name,
+                    "value_range": [low, high],
+                }
+
+        # Calculer des statistiques
+        stats = {
+            "min_depth": float(depth_array.min()),
+            "max_depth": float(depth_array.max()),
+            "mean_depth": float(depth_array.mean()),
+            "std_depth": float(depth_array.std()),
+        }
+
+        result = {
+            "stats": stats,
+            "files": files,
+            "device_used": self.device,
+        }
+        if "preview" in files:
+            result["depth_map_path"] = files["preview"]["path"]
+            result["depth_map_filename"] = files["preview"]["filename"]
+        return result
+
+    @staticmethod
+    def _file_tag(options: dict, keys: tuple) -> str:
+        """
+        Suffixe court des fichiers produits, dérivé des options qui changent leur
+        contenu : deux réglages différents n'écrivent jamais le même fichier
+        """
+        params = {key: options.get(key) for key in keys}
+        return hashlib.sha256(json.dumps(params, sort_keys=True).encode()).hexdigest()[:8]
+
+    @staticmethod
+    def region_stats(
+        depth_result: dict, boxes: List[Dict], raw: Optional[np.ndarray] = None
+    ) -> List[Optional[Dict]]:
+        """
+        Statistiques de profondeur (mean, std, min, max) à l'intérieur de chaque box,
+        calculées sur la sortie npy d'une estimation précédente (sans appel au modèle).
+        Les valeurs sont ramenées à l'échelle 0-255 des statistiques globales, et les
+        boxes (coordonnées de l'image source) à la taille de la depth map.
+
+        Args:
+            depth_result: Résultat de estimate_depth contenant la sortie npy
+            boxes: Bounding boxes (dicts x1, y1, x2, y2)
+            raw: Contenu de la sortie npy déjà en mémoire (ex: mémoire partagée)
+
+        Returns:
+            Liste de dicts (ou None si la box sort de l'image), dans l'ordre des boxes
+        """
+        npy = depth_result.get("files", {}).get("npy")
+        if npy is None:
+            raise ValueError("La sortie npy est nécessaire aux statistiques par box")
+
+        if raw is None:
+            raw = np.load(npy["path"], mmap_mode="r")
+        raw = raw.astype(np.float32)
+        low, high = float(raw.min()), float(raw.max())
+        depth = (raw - low) * (255.0 / (high - low)) if high > low else np.zeros_like(raw)
+
+        coords = np.array(
+            [[b["x1"], b["y1"], b["x2"], b["y2"]] for b in boxes], dtype=np.float64
+        ).reshape(-1, 4)
+
+        # Image décodée à échelle réduite : depth map plus petite que la source
+        if "image_size" in depth_result:
+            width, height = depth_result["image_size"]
+            coords *= [
+                depth.shape[1] / width,
+                depth.shape[0] / height,
+                depth.shape[1] / width,
+                depth.shape[0] / height,
+            ]
+        return box_region_stats(depth, coords)
+
+    @staticmethod
+    def _raw_depth(output: dict, shape: tuple) -> np.ndarray:
+        """Profondeur brute du modèle (float32) à la taille de l'image"""
+        raw = output["predicted_depth"]
+        if isinstance(raw, torch.Tensor):
+            raw = raw.detach().float().cpu().numpy()
+        raw = np.squeeze(np.asarray(raw, dtype=np.float32))
+
+        # Selon la version de transformers, la sortie est à la résolution du modèle
+        if raw.shape != shape:
+            raw = cv2.resize(raw, (shape[1], shape[0]), interpolation=cv2.INTER_CUBIC)
+        return raw
+
+
+# Instance globale (singleton pattern)
+def get_depth_estimator() -> DepthEstimator:
+    """Retourne l'instance singleton du DepthEstimator"""
+    return get_registry().get("depth_estimator", DepthEstimator)
@@ -0,0 +1,354 @@
+"""
+Exécution des inférences hors de la boucle d'événements.
+Les appels synchrones (torch, ultralytics, tesseract) sont envoyés dans un pool
+de threads ou de processus borné, avec une limite de concurrence par modèle,
+pour que /health et /files restent réactifs pendant une inférence.
+Chaque appel s'exécute avec le budget de threads de son modèle (ResourceGovernor).
+En mode "process", photos et profondeurs brutes passent par mémoire partagée ;
+en mode "remote", les appels sont envoyés au serveur d'inférence partagé
+(services/inference_server.py).
+"""
+
+import asyncio
+import os
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
+from multiprocessing import resource_tracker
+from typing import Callable, Dict, List, Optional, Tuple
+from services import inference_tasks
+from services.resource_governor import (
+    ResourceGovernor,
+    apply_thread_budget,
+    configure_process,
+    parse_thread_budgets,
+)
+from services.shared_arrays import SharedArrayStore
+from services.shared_image import get_shared_image_cache, segment_key
+
+# Limites de concurrence par défaut (nombre d'inférences simultanées par modèle)
+DEFAULT_MODEL_LIMITS = {
+    # Plusieurs appels simultanés pour alimenter le micro-batching d'OWL-ViT
+    "zero_shot": 4,
+    "depth": 1,
+    "yolo": 1,
+    "contract": 2,
+    # Rendu des annotations (OpenCV, sans modèle)
+    "render": 2,
+}
+
+
+def parse_model_limits(value: Optional[str]) -> Dict[str, int]:
+    """
+    Parse une configuration de la forme "zero_shot=1,depth=2".
+
+    Args:
+        value: Chaîne de configuration (None = valeurs par défaut)
+
+    Returns:
+        Dict modèle -> nombre d'inférences simultanées
+    """
+    limits = dict(DEFAULT_MODEL_LIMITS)
+    if not value:
+        return limits
+
+    for item in value.split(","):
+        if not item.strip():
+            continue
+        name, _, limit = item.partition("=")
+        limits[name.strip()] = max(1, int(limit))
+    return limits
+
+
+class InferenceExecutor:
+    """Pool borné pour les appels d'inférence synchrones"""
+
+    def __init__(
+        self,
+        mode: str = "thread",
+        max_workers: Optional[int] = None,
+        model_limits: Optional[Dict[str, int]] = None,
+        governor: Optional[ResourceGovernor] = None,
+        shared_arrays: Optional[SharedArrayStore] = None,
+    ):
+        """
+        Args:
+            mode: "thread" ou "process"
+            max_workers: Taille du pool (défaut: somme des limites par modèle en
+                mode thread, nombre de cœurs en mode process)
+            model_limits: Nombre d'inférences simultanées autorisées par modèle
+            governor: Budgets de threads par modèle (défaut: répartition
+                automatique des cœurs selon model_limits)
+            shared_arrays: Segments de mémoire partagée transmis aux workers en
+                mode process (None = les workers lisent et décodent les fichiers)
+        """
+        if mode not in ("thread", "process"):
+            raise ValueError(f"Mode d'exécution inconnu: {mode}")
+
+        self.mode = mode
+        self.model_limits = model_limits or dict(DEFAULT_MODEL_LIMITS)
+        if max_workers is None:
+            # En mode thread, chaque modèle doit pouvoir atteindre sa limite
+            # (les threads attendent surtout torch, qui libère le GIL)
+            if mode == "thread":
+                max_workers = sum(self.model_limits.values())
+            else:
+                max_workers = os.cpu_count() or 1
+        self.max_workers = max_workers
+        self.governor = governor or ResourceGovernor(self.model_limits)
+        self.governor.configure_process()
+        # En mode thread, les modèles partagent déjà la mémoire du processus
+        self.shared_arrays = shared_arrays if mode == "process" else None
+        self._pool: Optional[Executor] = None
+        self._semaphores: Dict[str, asyncio.Semaphore] = {}
+        self._in_flight: Dict[str, int] = {}
+
+        print(
+            f"🔧 InferenceExecutor: mode={self.mode}, workers={self.max_workers}, "
+            f"limites={self.model_limits}, "
+            f"threads={self.governor.budgets} sur {self.governor.cores} cœurs"
+        )
+
+    @property
+    def pool(self) -> Executor:
+        """Crée le pool à la première utilisation"""
+        if self._pool is None:
+            if self.mode == "process":
+                if self.shared_arrays is not None:
+                    # Les workers héritent du resource tracker du processus principal :
+                    # sinon chacun supprimerait à sa sortie les segments qu'il a ouverts
+                    resource_tracker.ensure_running()
+                # Chaque processus reçoit les mêmes réglages globaux
+                self._pool = ProcessPoolExecutor(
+                    max_workers=self.max_workers,
+                    initializer=configure_process,
+                    initargs=(
+                        self.governor.interop_threads,
+                        self.governor.threads("contract"),
+                        self.governor.threads("render"),
+                    ),
+                )
+            else:
+                self._pool = ThreadPoolExecutor(
+                    max_workers=self.max_workers, thread_name_prefix="inference"
+                )
+        return self._pool
+
+    def _semaphore(self, model: str) -> asyncio.Semaphore:
+        if model not in self._semaphores:
+            limit = self.model_limits.get(model, self.max_workers)
+            self._semaphores[model] = asyncio.Semaphore(limit)
+        return self._semaphores[model]
+
+    async def run(self, model: str, fn: Callable, *args, **kwargs):
+        """
+        Exécute fn(*args, **kwargs) dans le pool en respectant la limite du modèle.
+        En mode "process", fn doit être une fonction de module (picklable).
+
+        Args:
+            model: Nom du modèle utilisé (clé des limites de concurrence)
+            fn: Fonction synchrone à exécuter
+        """
+        loop = asyncio.get_running_loop()
+        threads = self.governor.threads(model)
+        async with self._semaphore(model):
+            self._in_flight[model] = self._in_flight.get(model, 0) + 1
+            try:
+                if self.shared_arrays is None or _shared_task(fn) is None:
+                    return await loop.run_in_executor(
+                        self.pool, _call, fn, args, kwargs, threads
+                    )
+
+                # Photos décodées une seule fois, passées au worker par descripteur
+                shared = loop.run_in_executor(None, self._share_inputs, fn, args, kwargs)
+                try:
+                    args, kwargs, keys = await asyncio.shield(shared)
+                except asyncio.CancelledError:
+                    shared.add_done_callback(self._abandon_inputs)
+                    raise
+
+                future = self.pool.submit(_call, fn, args, kwargs, threads)
+                try:
+                    result = await asyncio.wrap_future(future)
+                except asyncio.CancelledError:
+                    # Requête annulée pendant la tâche : le worker peut encore publier
+                    # des segments, adoptés à la fin de la tâche pour être libérables
+                    future.add_done_callback(lambda done: self._abandon_task(done, keys))
+                    raise
+                except BaseException:
+                    self._release(keys)
+                    raise
+                self._release(keys)
+                return self._collect_outputs(result)
+            finally:
+                self._in_flight[model] -= 1
+
+    def _share_inputs(self, fn: Callable, args: tuple, kwargs: dict) -> Tuple:
+        """
+        Remplace les photos par des descripteurs (avec leur segment si un worker les a
+        déjà décodées, sans décodage ici : un résultat en cache n'en a pas besoin),
+        et donne aux statistiques par box la depth map encore en mémoire partagée.
+
+        Returns:
+            (args, kwargs, clés des segments à libérer après l'appel)
+        """
+        keys: List[str] = []
+        try:
+            if _shared_task(fn) == "image":
+                image_cache = get_shared_image_cache()
+
+                def share(image_path):
+                    key, descriptor = image_cache.share(image_path, self.shared_arrays)
+                    if key is not None:
+                        keys.append(key)
+                    return descriptor
+
+                images = args[0]
+                if isinstance(images, (list, tuple)):
+                    shared = [share(image_path) for image_path in images]
+                else:
+                    shared = share(images)
+                return (shared, *args[1:]), kwargs, keys
+
+            npy = args[0].get("files", {}).get("npy")
+            key = _depth_key(npy["path"]) if npy is not None else None
+            descriptor = self.shared_arrays.acquire(key) if key is not None else None
+            if descriptor is None:
+                return args, kwargs, keys
+            keys.append(key)
+            return args, dict(kwargs, depth=descriptor), keys
+        except OSError as e:
+            # Fichier illisible, /dev/shm plein... : le worker lit les fichiers lui-même
+            self._release(keys)
+            print(f"⚠️ Mémoire partagée indisponible ({e}), transmission des chemins")
+            return args, kwargs, []
+
+    def _release(self, keys: List[str]):
+        for key in keys:
+            self.shared_arrays.release(key)
+
+    def _abandon_inputs(self, shared: asyncio.Future):
+        """Requête annulée pendant le partage des entrées : rend les références prises"""
+        if not shared.cancelled() and shared.exception() is None:
+            self._release(shared.result()[2])
+
+    def _abandon_task(self, future: Future, keys: List[str]):
+        """
+        Fin d'une tâche dont la requête a été annulée : rend les références et adopte
+        les segments publiés par le worker, qui restent sinon en mémoire partagée
+        """
+        self._release(keys)
+        if not future.cancelled() and future.exception() is None:
+            self._collect_outputs(future.result())
+
+    def _collect_outputs(self, result):
+        """
+        Adopte les photos décodées et les profondeurs brutes publiées par le worker
+        (clés "shared_image" et "shared_depth")
+        """
+        if isinstance(result, list):
+            return [self._collect_outputs(item) for item in result]
+        if not isinstance(result, dict) or not (
+            "shared_image" in result or "shared_depth" in result
+        ):
+            return result
+
+        result = dict(result)
+        image = result.pop("shared_image", None)
+        if image is not None:
+            try:
+                self.shared_arrays.adopt(segment_key(image["hash"]), image["array"])
+            except OSError as e:
+                print(f"⚠️ Photo partagée perdue: {e}")
+        depth = result.pop("shared_depth", None)
+        if depth is not None:
+            try:
+                self.shared_arrays.adopt(_depth_key(result["files"]["npy"]["path"]), depth)
+            except OSError as e:
+                print(f"⚠️ Profondeur partagée perdue: {e}")
+        return result
+
+    def stats(self) -> Dict:
+        """Retourne la configuration et l'occupation courante du pool"""
+        return {
+            "mode": self.mode,
+            "max_workers": self.max_workers,
+            "model_limits": self.model_limits,
+            "in_flight": dict(self._in_flight),
+            "resources": self.governor.stats(),
+            "shared_memory": self.shared_arrays.stats() if self.shared_arrays else None,
+        }
+
+    def shutdown(self):
+        """Arrête le pool (appelé à l'arrêt de l'application)"""
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+        if self.shared_arrays is not None:
+            self.shared_arrays.close()
+
+
+def _shared_task(fn: Callable) -> Optional[str]:
+    """
+    "image" si la tâche reçoit des photos, "depth" si elle lit une depth map :
+    leurs entrées passent par mémoire partagée en mode process
+    """
+    if getattr(fn, "__module__", None) != inference_tasks.__name__:
+        return None
+    if fn.__name__ in inference_tasks.IMAGE_TASKS:
+        return "image"
+    if fn.__name__ == "depth_region_stats":
+        return "depth"
+    return None
+
+
+def _depth_key(npy_path: str) -> str:
+    """Clé du segment d'une depth map : chemin et date d'écriture de sa sortie npy"""
+    return f"depth:{npy_path}:{os.stat(npy_path).st_mtime_ns}"
+
+
+def _call(fn: Callable, args: tuple, kwargs: dict, threads: int):
+    """
+    Adaptateur pour run_in_executor (qui n'accepte pas de kwargs), appliquant
+    le budget de threads du modèle au worker avant l'appel
+    """
+    apply_thread_budget(threads)
+    return fn(*args, **kwargs)
+
+
+def _create_shared_arrays() -> Optional[SharedArrayStore]:
+    if os.getenv("INFERENCE_SHARED_MEMORY", "true").lower() not in ("1", "true", "yes"):
+        return None
+    return SharedArrayStore(int(os.getenv("INFERENCE_SHARED_MEMORY_MB", "32")) * 1024 * 1024)
+
+
+# Instance globale
+_inference_executor = None
+
+
+def get_inference_executor() -> InferenceExecutor:
+    """Retourne l'instance singleton de l'InferenceExecutor"""
+    global _inference_executor
+    if _inference_executor is None and os.getenv("INFERENCE_EXECUTOR") == "remote":
+        # Inférences déléguées au serveur d'inférence partagé (socket Unix)
+        from services.inference_server import _create_remote_executor
+
+        _inference_executor = _create_remote_executor()
+    if _inference_executor is None:
+        max_workers = os.getenv("INFERENCE_MAX_WORKERS")
+        cores = os.getenv("INFERENCE_CPU_CORES")
+        model_limits = parse_model_limits(os.getenv("INFERENCE_MODEL_LIMITS"))
+        # Avec le micro-batching, un seul thread calcule les inférences OWL-ViT
+        batched = int(os.getenv("ZERO_SHOT_BATCH_SIZE", "4")) > 1
+        _inference_executor = InferenceExecutor(
+            mode=os.getenv("INFERENCE_EXECUTOR", "thread"),
+            max_workers=int(max_workers) if max_workers else None,
+            model_limits=model_limits,
+            governor=ResourceGovernor(
+                model_limits,
+                cores=int(cores) if cores else None,
+                thread_budgets=parse_thread_budgets(os.getenv("INFERENCE_THREADS")),
+                compute_workers={"zero_shot": 1} if batched else None,
+                interop_threads=int(os.getenv("INFERENCE_INTEROP_THREADS", "1")),
+            ),
+            shared_arrays=_create_shared_arrays(),
+        )
+    return _inference_executor
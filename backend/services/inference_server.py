@@ -0,0 +1,451 @@
+"""
+Serveur d'inférence partagé par plusieurs workers de l'API.
+Avec uvicorn --workers N, chaque processus charge sinon ses propres modèles
+(OWL-ViT, Depth Anything, YOLOv8) : la mémoire croît avec le nombre de workers.
+En mode INFERENCE_EXECUTOR=remote, les workers HTTP restent légers et envoient
+leurs appels d'inférence par socket Unix à un seul processus par machine, qui
+héberge les modèles et les exécute avec son propre InferenceExecutor (mêmes
+limites par modèle et budgets de threads, communs à tous les workers).
+
+Chaque connexion est multiplexée : plusieurs requêtes d'un même worker sont en
+cours en même temps, les réponses reviennent dans l'ordre de fin, identifiées
+par leur numéro de requête.
+
+Lancement (depuis backend/, même dossier de travail que l'API) :
+    python -m services.inference_server --preload
+"""
+
+import argparse
+import asyncio
+import itertools
+import os
+import pickle
+import secrets
+import signal
+import threading
+import time
+from concurrent.futures import Future
+from multiprocessing.connection import Client, Connection, Listener
+from pathlib import Path
+from typing import Callable, Dict, Optional
+
+# Seules les tâches de ce module peuvent être appelées à distance
+TASKS_MODULE = "services.inference_tasks"
+
+
+def _authkey() -> Optional[bytes]:
+    """Clé configurée, partagée entre le serveur et les workers (None = clé générée)"""
+    value = os.getenv("INFERENCE_SERVER_AUTHKEY")
+    return value.encode() if value else None
+
+
+def key_file(address: Path) -> Path:
+    """Fichier (0600) de la clé générée par le serveur, à côté du socket"""
+    address = Path(address)
+    return address.with_name(f"{address.name}.key")
+
+
+def _picklable_error(error: BaseException) -> BaseException:
+    """L'exception elle-même si elle peut être renvoyée, sinon son message"""
+    try:
+        pickle.dumps(error)
+        return error
+    except Exception:
+        return RuntimeError(f"{type(error).__name__}: {error}")
+
+
+class InferenceServer:
+    """Processus hébergeant les modèles, à l'écoute sur un socket Unix"""
+
+    def __init__(self, address: Path, authkey: Optional[bytes] = None):
+        """
+        Args:
+            address: Chemin du socket Unix
+            authkey: Clé d'authentification des connexions (défaut: clé aléatoire
+                écrite dans key_file(address), lisible par le seul utilisateur courant)
+        """
+        # Import local : le serveur force un pool local (jamais "remote")
+        from services.inference_executor import get_inference_executor
+
+        self.address = Path(address)
+        self.authkey = authkey
+        self.executor = get_inference_executor()
+        self.started_at = time.time()
+        self.connections = 0
+        self.requests = {"served": 0, "failed": 0, "in_flight": 0}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._listener: Optional[Listener] = None
+
+    def health(self) -> Dict:
+        """État du serveur, de son pool d'inférence et des modèles chargés"""
+        from services.registry import get_registry
+
+        return {
+            "pid": os.getpid(),
+            "address": str(self.address),
+            "uptime_seconds": round(time.time() - self.started_at, 1),
+            "connections": self.connections,
+            "requests": dict(self.requests),
+            "executor": self.executor.stats(),
+            "models": get_registry().report(),
+        }
+
+    async def _handle(self, message: tuple):
+        """Exécute une requête et retourne (ok, résultat ou exception)"""
+        kind = message[0]
+        if kind == "health":
+            return True, self.health()
+        if kind != "run":
+            return False, ValueError(f"Requête inconnue: {kind}")
+
+        _, model, task_name, args, kwargs = message
+        from services import inference_tasks
+
+        task = getattr(inference_tasks, task_name, None)
+        if not callable(task):
+            return False, ValueError(f"Tâche d'inférence inconnue: {task_name}")
+
+        self.requests["in_flight"] += 1
+        try:
+            result = await self.executor.run(model, task, *args, **kwargs)
+            self.requests["served"] += 1
+            return True, result
+        except Exception as e:
+            self.requests["failed"] += 1
+            return False, _picklable_error(e)
+        finally:
+            self.requests["in_flight"] -= 1
+
+    def _serve_connection(self, conn: Connection):
+        """Lit les requêtes d'un worker ; chacune est traitée sans attendre les autres"""
+        send_lock = threading.Lock()
+        self.connections += 1
+
+        def reply(request_id: int, future: asyncio.Future):
+            ok, payload = future.result()
+            with send_lock:
+                try:
+                    conn.send((request_id, ok, payload))
+                except Exception as e:
+                    if isinstance(e, (OSError, EOFError)):
+                        return
+                    # Résultat non sérialisable : renvoyer l'erreur à la place
+                    conn.send((request_id, False, _picklable_error(e)))
+
+        try:
+            while True:
+                try:
+                    request_id, *message = conn.recv()
+                except (EOFError, OSError):
+                    break
+                future = asyncio.run_coroutine_threadsafe(
+                    self._handle(tuple(message)), self._loop
+                )
+                future.add_done_callback(
+                    lambda done, request_id=request_id: reply(request_id, done)
+                )
+        finally:
+            self.connections -= 1
+            conn.close()
+
+    def _accept(self):
+        """Accepte les connexions des workers (un thread de lecture par connexion)"""
+        while True:
+            try:
+                conn = self._listener.accept()
+            except OSError:
+                # Listener fermé (arrêt du serveur)
+                return
+            except Exception as e:
+                # Authentification refusée : la connexion suivante est acceptée
+                print(f"⚠️ Connexion refusée: {e}")
+                continue
+            threading.Thread(
+                target=self._serve_connection, args=(conn,), daemon=True
+            ).start()
+
+    def serve_forever(self, preload: bool = False):
+        """Écoute jusqu'à SIGINT / SIGTERM"""
+        self.address.parent.mkdir(parents=True, exist_ok=True)
+        # Socket et clé créés directement en 0600 : aucun autre utilisateur ne peut
+        # se connecter entre la création du socket et le début de l'écoute
+        previous_umask = os.umask(0o077)
+        try:
+            for path in (self.address, key_file(self.address)):
+                if path.exists() or path.is_symlink():
+                    # Laissé par un serveur précédent
+                    path.unlink()
+            if self.authkey is None:
+                # Les connexions sont toujours authentifiées (les messages sont des pickles)
+                self.authkey = secrets.token_hex(32).encode()
+                fd = os.open(
+                    key_file(self.address), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600
+                )
+                with os.fdopen(fd, "wb") as f:
+                    f.write(self.authkey)
+            self._listener = Listener(
+                str(self.address), family="AF_UNIX", authkey=self.authkey
+            )
+        finally:
+            os.umask(previous_umask)
+
+        self._loop = asyncio.new_event_loop()
+        stop = asyncio.Event()
+        for sig in (signal.SIGINT, signal.SIGTERM):
+            self._loop.add_signal_handler(sig, stop.set)
+
+        async def main():
+            if preload:
+                from services import inference_tasks
+
+                durations = await self.executor.run("warmup", inference_tasks.warmup_models)
+                print(f"✅ Modèles préchauffés: {durations}")
+            threading.Thread(target=self._accept, daemon=True).start()
+            print(f"🛰️ Serveur d'inférence à l'écoute sur {self.address} (pid {os.getpid()})")
+            await stop.wait()
+
+        try:
+            self._loop.run_until_complete(main())
+        finally:
+            print("🛰️ Arrêt du serveur d'inférence")
+            self._listener.close()
+            for path in (self.address, key_file(self.address)):
+                if path.exists():
+                    path.unlink()
+            self.executor.shutdown()
+            self._loop.close()
+
+
+class RemoteInferenceExecutor:
+    """
+    Client du serveur d'inférence, même interface que InferenceExecutor.
+    Une connexion par processus, partagée par toutes les requêtes en cours.
+    """
+
+    mode = "remote"
+
+    def __init__(
+        self,
+        address: Path,
+        authkey: Optional[bytes] = None,
+        connect_timeout: float = 30.0,
+    ):
+        """
+        Args:
+            address: Chemin du socket Unix du serveur
+            authkey: Clé d'authentification (défaut: clé générée par le serveur,
+                relue dans key_file(address) à chaque connexion)
+            connect_timeout: Attente maximum du serveur (démarrage en cours)
+        """
+        self.address = Path(address)
+        self.authkey = authkey
+        self.connect_timeout = connect_timeout
+        self._conn: Optional[Connection] = None
+        self._lock = threading.Lock()
+        self._connect_lock = threading.Lock()
+        self._pending: Dict[int, Future] = {}
+        self._request_ids = itertools.count()
+        self._in_flight: Dict[str, int] = {}
+        self._governor = None
+        print(f"🔧 InferenceExecutor: mode=remote, serveur={self.address}")
+
+    @property
+    def governor(self):
+        """
+        Budgets de threads du serveur (relus une fois dans health()), ou
+        répartition locale par défaut tant que le serveur ne répond pas
+        """
+        from services.inference_executor import parse_model_limits
+        from services.resource_governor import ResourceGovernor
+
+        if self._governor is None:
+            try:
+                resources = self.health(timeout=5)["executor"]["resources"]
+            except Exception as e:
+                print(f"⚠️ Budgets du serveur d'inférence indisponibles ({e})")
+                limits = parse_model_limits(os.getenv("INFERENCE_MODEL_LIMITS"))
+                return ResourceGovernor(limits)
+            self._governor = ResourceGovernor.from_stats(resources)
+        return self._governor
+
+    def _connection(self, timeout: float) -> Connection:
+        """
+        Connexion au serveur, ouverte à la première requête (ou après une coupure)
+
+        Args:
+            timeout: Attente maximum du serveur, attente d'une autre connexion comprise
+        """
+        conn = self._conn
+        if conn is not None:
+            return conn
+
+        unreachable = ConnectionError(f"Serveur d'inférence injoignable sur {self.address}")
+        deadline = time.monotonic() + timeout
+        if not self._connect_lock.acquire(timeout=timeout):
+            raise unreachable
+        try:
+            while self._conn is None:
+                try:
+                    authkey = self.authkey or key_file(self.address).read_bytes()
+                    conn = Client(str(self.address), family="AF_UNIX", authkey=authkey)
+                except (FileNotFoundError, ConnectionRefusedError):
+                    if time.monotonic() > deadline:
+                        raise unreachable
+                    time.sleep(0.2)
+                    continue
+                self._conn = conn
+                threading.Thread(
+                    target=self._read_responses, args=(conn,), daemon=True
+                ).start()
+            return self._conn
+        finally:
+            self._connect_lock.release()
+
+    def _read_responses(self, conn: Connection):
+        """Transmet chaque réponse à la requête qui l'attend"""
+        while True:
+            try:
+                request_id, ok, payload = conn.recv()
+            except (EOFError, OSError):
+                break
+            with self._lock:
+                future = self._pending.pop(request_id, None)
+            if future is None:
+                continue
+            if ok:
+                future.set_result(payload)
+            else:
+                future.set_exception(payload)
+
+        # Serveur arrêté : échec des requêtes en cours, reconnexion à la suivante
+        with self._lock:
+            if self._conn is conn:
+                self._conn = None
+            pending, self._pending = self._pending, {}
+        for future in pending.values():
+            future.set_exception(ConnectionError("Connexion au serveur d'inférence perdue"))
+
+    def _request(self, *message, connect_timeout: Optional[float] = None) -> Future:
+        """Envoie une requête au serveur et retourne le Future de sa réponse"""
+        future: Future = Future()
+        conn = self._connection(
+            self.connect_timeout if connect_timeout is None else connect_timeout
+        )
+        with self._lock:
+            if self._conn is not conn:
+                # Connexion perdue entre-temps : ses requêtes ont déjà échoué
+                raise ConnectionError("Connexion au serveur d'inférence perdue")
+            request_id = next(self._request_ids)
+            self._pending[request_id] = future
+            try:
+                conn.send((request_id, *message))
+            except (OSError, EOFError) as e:
+                self._pending.pop(request_id, None)
+                self._conn = None
+                raise ConnectionError(f"Serveur d'inférence injoignable: {e}")
+        return future
+
+    async def run(self, model: str, fn: Callable, *args, **kwargs):
+        """
+        Exécute fn(*args, **kwargs) dans le serveur d'inférence.
+        fn doit être une tâche de services.inference_tasks.
+
+        Args:
+            model: Nom du modèle utilisé (clé des limites de concurrence du serveur)
+            fn: Tâche d'inférence à exécuter
+        """
+        if fn.__module__ != TASKS_MODULE:
+            raise ValueError(f"Seules les tâches de {TASKS_MODULE} sont exécutables à distance")
+
+        loop = asyncio.get_running_loop()
+        # Connexion et envoi hors de la boucle d'événements
+        future = await loop.run_in_executor(
+            None, lambda: self._request("run", model, fn.__name__, args, kwargs)
+        )
+        self._in_flight[model] = self._in_flight.get(model, 0) + 1
+        try:
+            return await asyncio.wrap_future(future)
+        finally:
+            self._in_flight[model] -= 1
+
+    def health(self, timeout: float = 10.0) -> Dict:
+        """
+        État du serveur d'inférence (lève une exception s'il ne répond pas).
+        timeout borne aussi la connexion : un serveur arrêté est signalé sans
+        attendre connect_timeout.
+        """
+        deadline = time.monotonic() + timeout
+        future = self._request("health", connect_timeout=timeout)
+        return future.result(timeout=max(deadline - time.monotonic(), 0.0))
+
+    def stats(self, timeout: float = 5.0) -> Dict:
+        """
+        Configuration et occupation du pool du serveur, vues par ce worker.
+        Un serveur injoignable est signalé (reachable False) sans lever d'exception.
+        """
+        try:
+            health = self.health(timeout=timeout)
+        except Exception as e:
+            return {
+                "mode": "remote",
+                "address": str(self.address),
+                "reachable": False,
+                "error": str(e),
+                "in_flight": dict(self._in_flight),
+                "worker_in_flight": dict(self._in_flight),
+            }
+        return {
+            **health["executor"],
+            "mode": "remote",
+            "reachable": True,
+            "server_mode": health["executor"]["mode"],
+            "address": str(self.address),
+            "worker_in_flight": dict(self._in_flight),
+            "server": {
+                key: health[key]
+                for key in ("pid", "uptime_seconds", "connections", "requests")
+            },
+        }
+
+    def shutdown(self):
+        """Ferme la connexion au serveur (le serveur continue de tourner)"""
+        with self._lock:
+            conn, self._conn = self._conn, None
+        if conn is not None:
+            conn.close()
+
+
+def server_address() -> Path:
+    """Chemin du socket du serveur d'inférence"""
+    return Path(os.getenv("INFERENCE_SERVER_SOCKET", "cache/inference.sock"))
+
+
+def _create_remote_executor() -> RemoteInferenceExecutor:
+    return RemoteInferenceExecutor(
+        server_address(),
+        authkey=_authkey(),
+        connect_timeout=float(os.getenv("INFERENCE_SERVER_CONNECT_TIMEOUT", "30")),
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serveur d'inférence (socket Unix)")
+    parser.add_argument("--address", type=Path, default=None, help="Chemin du socket")
+    parser.add_argument(
+        "--preload", action="store_true", help="Charger et préchauffer les modèles au démarrage"
+    )
+    args = parser.parse_args()
+
+    # Le serveur exécute lui-même les inférences (pool de threads ou de processus),
+    # y compris dans les processus de son pool qui héritent de l'environnement
+    server_mode = os.getenv("INFERENCE_SERVER_EXECUTOR")
+    if server_mode or os.getenv("INFERENCE_EXECUTOR") == "remote":
+        os.environ["INFERENCE_EXECUTOR"] = server_mode or "thread"
+
+    InferenceServer(args.address or server_address(), authkey=_authkey()).serve_forever(
+        preload=args.preload
+    )
+
+
+if __name__ == "__main__":
+    main()
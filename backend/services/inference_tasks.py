@@ -0,0 +1,237 @@
+"""
+Tâches d'inférence exécutées par l'InferenceExecutor.
+Fonctions de module (picklables) pour fonctionner aussi bien dans un thread que
+dans un processus séparé : chaque processus obtient ses propres singletons.
+
+En mode process, les photos arrivent sous forme de descripteurs de mémoire
+partagée (voir services/shared_arrays.py). Une photo décodée par la tâche et les
+profondeurs brutes repartent de la même façon (clés "shared_image" et
+"shared_depth", retirées du résultat par l'executor).
+"""
+
+import time
+from pathlib import Path
+from typing import Dict, List, Optional, Union
+
+# Tâches dont le premier argument est une photo (ou une liste de photos)
+IMAGE_TASKS = (
+    "detect_parts",
+    "detect_parts_batch",
+    "estimate_depth",
+    "estimate_depth_batch",
+    "detect_objects",
+)
+
+# Photo : chemin, ou descripteur de mémoire partagée (SharedImageCache.share)
+ImageInput = Union[Path, Dict]
+
+
+def _image_path(image: ImageInput) -> Path:
+    """
+    Chemin de la photo ; une photo reçue par mémoire partagée est placée dans le
+    cache d'images du processus, où le modèle la retrouve sans la décoder
+    """
+    if isinstance(image, dict):
+        from services.shared_image import get_shared_image_cache
+
+        return get_shared_image_cache().adopt(image)
+    return image
+
+
+def _with_shared_images(results: List[Dict], images: List[ImageInput]) -> List[Dict]:
+    """
+    Ajoute à chaque résultat le descripteur de sa photo si la tâche l'a décodée,
+    copiée en mémoire partagée (une seule fois par photo)
+    """
+    from services.shared_image import get_shared_image_cache
+
+    image_cache = get_shared_image_cache()
+    published = set()
+    outputs = []
+    for result, image in zip(results, images):
+        if isinstance(image, dict) and image["hash"] not in published:
+            array = image_cache.publish(image)
+            if array is not None:
+                published.add(image["hash"])
+                result = dict(result, shared_image={"hash": image["hash"], "array": array})
+        outputs.append(result)
+    return outputs
+
+
+def _with_shared_depth(result: Dict, raw_depths: Optional[Dict]) -> Dict:
+    """Ajoute le descripteur de la profondeur brute, copiée en mémoire partagée"""
+    npy = result.get("files", {}).get("npy")
+    if not raw_depths or npy is None or npy["path"] not in raw_depths:
+        return result
+    from services.shared_arrays import publish_array
+
+    return dict(result, shared_depth=publish_array(raw_depths[npy["path"]]))
+
+
+def detect_parts(image: ImageInput, text_queries: Optional[List[str]] = None) -> Dict:
+    """Détection de pièces (OWL-ViT)"""
+    from services.zero_shot_detector import get_zero_shot_detector
+
+    result = get_zero_shot_detector().detect_parts(_image_path(image), text_queries)
+    return _with_shared_images([result], [image])[0]
+
+
+def detect_parts_batch(
+    images: List[ImageInput], text_queries: Optional[List[str]] = None
+) -> List[Dict]:
+    """Détection de pièces sur plusieurs images en un seul forward (OWL-ViT)"""
+    from services.zero_shot_detector import get_zero_shot_detector
+
+    results = get_zero_shot_detector().detect_parts_batch(
+        [_image_path(image) for image in images], text_queries
+    )
+    return _with_shared_images(results, images)
+
+
+def estimate_depth(
+    image: ImageInput,
+    outputs: Optional[List[str]] = None,
+    preview_format: Optional[str] = None,
+    quality: Optional[int] = None,
+    boxes: Optional[List[Dict]] = None,
+) -> Dict:
+    """Estimation de profondeur (Depth Anything)"""
+    from services.depth_estimator import get_depth_estimator
+
+    estimator = get_depth_estimator()
+    if not isinstance(image, dict):
+        return estimator.estimate_depth(
+            image, outputs, preview_format=preview_format, quality=quality, boxes=boxes
+        )
+
+    raw_depths = {}
+    result = estimator.estimate_depth(
+        _image_path(image),
+        outputs,
+        preview_format=preview_format,
+        quality=quality,
+        boxes=boxes,
+        raw_depths=raw_depths,
+    )
+    return _with_shared_images([_with_shared_depth(result, raw_depths)], [image])[0]
+
+
+def estimate_depth_batch(
+    images: List[ImageInput], outputs: Optional[List[str]] = None
+) -> List[Dict]:
+    """Estimation de profondeur sur plusieurs images (Depth Anything)"""
+    from services.depth_estimator import get_depth_estimator
+
+    shared = any(isinstance(image, dict) for image in images)
+    raw_depths = {} if shared else None
+    results = get_depth_estimator().estimate_depth_batch(
+        [_image_path(image) for image in images], outputs, raw_depths=raw_depths
+    )
+    return _with_shared_images(
+        [_with_shared_depth(result, raw_depths) for result in results], images
+    )
+
+
+def depth_region_stats(
+    depth_result: Dict, boxes: List[Dict], depth: Optional[Dict] = None
+) -> List[Optional[Dict]]:
+    """
+    Statistiques de profondeur par box, à partir d'une depth map déjà calculée
+    (lue en mémoire partagée si depth est fourni, sinon dans le fichier npy)
+    """
+    from services.depth_estimator import DepthEstimator
+
+    if depth is None:
+        return DepthEstimator.region_stats(depth_result, boxes)
+
+    from services.shared_arrays import attach
+
+    with attach(depth) as raw:
+        return DepthEstimator.region_stats(depth_result, boxes, raw=raw)
+
+
+def detect_objects(image: ImageInput) -> Dict:
+    """Détection d'objets (YOLO)"""
+    from services.object_detector import get_object_detector
+
+    result = get_object_detector().detect_objects(_image_path(image))
+    return _with_shared_images([result], [image])[0]
+
+
+def render_annotations(
+    image_path: Path,
+    detections: List[Dict],
+    fmt: str,
+    quality: int,
+    max_size: Optional[int] = None,
+) -> Path:
+    """Rendu d'une image annotée à partir de détections (OpenCV)"""
+    from services.annotation_renderer import get_annotation_renderer
+
+    return get_annotation_renderer().render(
+        image_path, detections, fmt=fmt, quality=quality, max_size=max_size
+    )
+
+
+def warmup_models() -> Dict[str, float]:
+    """
+    Charge tous les services et préchauffe les modèles sur une image synthétique.
+
+    Returns:
+        Durée de préchauffage (secondes) par service
+    """
+    from services.depth_estimator import get_depth_estimator
+    from services.object_detector import get_object_detector
+    from services.zero_shot_detector import get_zero_shot_detector
+    from services.contract_extractor import get_contract_extractor
+    from services.contract_analyzer import get_contract_analyzer
+    from services.claim_evaluator import get_claim_evaluator
+
+    durations = {}
+    for name, warmup in [
+        ("depth", lambda: get_depth_estimator().warmup()),
+        ("yolo", lambda: get_object_detector().warmup()),
+        ("zero_shot", lambda: get_zero_shot_detector().warmup()),
+        ("contract_extractor", get_contract_extractor),
+        ("contract_analyzer", get_contract_analyzer),
+        ("claim_evaluator", get_claim_evaluator),
+    ]:
+        start = time.perf_counter()
+        warmup()
+        durations[name] = round(time.perf_counter() - start, 3)
+    return durations
+
+
+def extract_contract_text(file_path: Path) -> Dict:
+    """Extraction du texte d'un contrat (PyPDF2 / Tesseract)"""
+    from services.contract_extractor import get_contract_extractor
+
+    return get_contract_extractor().extract_text(file_path)
+
+
+def analyze_contract_text(text: str) -> Dict:
+    """Analyse du texte d'un contrat (franchise, plafond, garanties)"""
+    from services.contract_analyzer import get_contract_analyzer
+
+    return get_contract_analyzer().analyze_contract(text)
+
+
+def simulate_portfolio(
+    claims: List[tuple], scenarios: List[Dict], samples: int = 0, seed: Optional[int] = None
+) -> Dict:
+    """Simulation what-if sur les sinistres enregistrés dans le dossier"""
+    from services.portfolio_simulator import get_portfolio_simulator
+
+    simulator = get_portfolio_simulator()
+    start = time.perf_counter()
+    portfolio, skipped = simulator.load_from_dossier(claims)
+    load_seconds = time.perf_counter() - start
+    result = simulator.simulate(portfolio, scenarios, samples=samples, seed=seed)
+    return {
+        **result,
+        "skipped": skipped,
+        "timings": {
+            "load": round(load_seconds, 3),
+            "simulation": round(time.perf_counter() - start - load_seconds, 3),
+        },
+    }
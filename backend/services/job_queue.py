@@ -0,0 +1,546 @@
+"""
+File de jobs persistante (SQLite) pour les analyses longues.
+POST /jobs enregistre un job et répond immédiatement ; des processus workers
+prennent les jobs dans l'ordre d'arrivée, exécutent le pipeline (mêmes services
+que les endpoints synchrones) et publient l'avancement de chaque étape.
+Les jobs survivent à un redémarrage : un job "running" dont le worker a disparu
+(processus mort ou plus de heartbeat) est remis dans la file.
+
+Les workers tournent à part, sur la même base et le même dossier uploads :
+    python -m services.job_queue worker --workers 2
+(JOB_WORKERS > 0 en lance aussi avec chaque processus de l'API : chacun charge
+alors ses propres modèles)
+"""
+
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import socket
+import sqlite3
+import threading
+import time
+import traceback
+import uuid
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List, Optional
+from services.claim_pipeline import (
+    ANALYZE_CONTRACT_STAGES,
+    EVALUATE_CLAIM_STAGES,
+    analyze_contract_file,
+    evaluate_claim_files,
+)
+from services.registry import get_registry
+
+# Étapes rapportées par type de job
+JOB_KINDS = {
+    "evaluate_claim": EVALUATE_CLAIM_STAGES,
+    "analyze_contract": ANALYZE_CONTRACT_STAGES,
+}
+JOB_STATUSES = ("queued", "running", "succeeded", "failed")
+
+
+class JobQueue:
+    """Jobs, leur avancement par étape et leur résultat"""
+
+    def __init__(
+        self,
+        db_path: Path,
+        stale_seconds: float = 60.0,
+        max_attempts: int = 3,
+    ):
+        """
+        Args:
+            db_path: Chemin vers la base SQLite
+            stale_seconds: Délai sans heartbeat après lequel un job "running" est
+                considéré abandonné par son worker
+            max_attempts: Nombre d'exécutions d'un job avant de le marquer en échec
+                (un job qui fait tomber son worker ne boucle pas indéfiniment)
+        """
+        self.db_path = Path(db_path)
+        self.db_path.parent.mkdir(parents=True, exist_ok=True)
+        self.stale_seconds = stale_seconds
+        self.max_attempts = max_attempts
+
+        with self._connect() as conn:
+            # WAL : les lectures (GET /jobs/{id}) ne bloquent pas les workers
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    kind TEXT NOT NULL,
+                    params TEXT NOT NULL,
+                    status TEXT NOT NULL,
+                    progress TEXT NOT NULL,
+                    result TEXT,
+                    error TEXT,
+                    worker TEXT,
+                    attempts INTEGER NOT NULL DEFAULT 0,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL,
+                    heartbeat_at REAL
+                )
+                """
+            )
+            conn.execute(
+                "CREATE INDEX IF NOT EXISTS jobs_status ON jobs (status, created_at)"
+            )
+
+    @contextmanager
+    def _connect(self):
+        """Ouvre une connexion, valide la transaction puis la ferme"""
+        conn = sqlite3.connect(str(self.db_path), timeout=30)
+        try:
+            with conn:
+                yield conn
+        finally:
+            conn.close()
+
+    def enqueue(self, kind: str, params: Dict) -> str:
+        """
+        Ajoute un job à la file.
+
+        Args:
+            kind: Type de job (voir JOB_KINDS)
+            params: Paramètres du job (sérialisables en JSON)
+
+        Returns:
+            Identifiant du job
+        """
+        if kind not in JOB_KINDS:
+            raise ValueError(f"Type de job inconnu: {kind}")
+
+        job_id = uuid.uuid4().hex
+        progress = {stage: {"state": "pending"} for stage in JOB_KINDS[kind]}
+        with self._connect() as conn:
+            conn.execute(
+                "INSERT INTO jobs (id, kind, params, status, progress, created_at) "
+                "VALUES (?, ?, ?, 'queued', ?, ?)",
+                (job_id, kind, json.dumps(params), json.dumps(progress), time.time()),
+            )
+        return job_id
+
+    def get(self, job_id: str) -> Optional[Dict]:
+        """Retourne l'état d'un job (None si inconnu)"""
+        with self._connect() as conn:
+            conn.row_factory = sqlite3.Row
+            row = conn.execute("SELECT * FROM jobs WHERE id = ?", (job_id,)).fetchone()
+            if row is None:
+                return None
+            position = None
+            if row["status"] == "queued":
+                position = conn.execute(
+                    "SELECT COUNT(*) FROM jobs WHERE status = 'queued' AND created_at < ?",
+                    (row["created_at"],),
+                ).fetchone()[0]
+
+        return {
+            "id": row["id"],
+            "kind": row["kind"],
+            "params": json.loads(row["params"]),
+            "status": row["status"],
+            "queue_position": position,
+            "progress": json.loads(row["progress"]),
+            "result": json.loads(row["result"]) if row["result"] else None,
+            "error": row["error"],
+            "attempts": row["attempts"],
+            "created_at": row["created_at"],
+            "started_at": row["started_at"],
+            "finished_at": row["finished_at"],
+        }
+
+    def claim(self, worker: str) -> Optional[Dict]:
+        """
+        Attribue au worker le plus ancien job en attente (après avoir remis dans
+        la file les jobs abandonnés).
+
+        Returns:
+            dict id, kind, params du job attribué, ou None si la file est vide
+        """
+        self.requeue_stale()
+        now = time.time()
+        with self._connect() as conn:
+            # Verrou d'écriture dès la lecture : deux workers ne prennent jamais le
+            # même job, et c'est bien le job lu (par son id) qui est attribué
+            conn.execute("BEGIN IMMEDIATE")
+            row = conn.execute(
+                """
+                SELECT id, kind, params FROM jobs WHERE status = 'queued'
+                ORDER BY created_at LIMIT 1
+                """
+            ).fetchone()
+            if row is None:
+                return None
+            # Job remis en file : l'avancement de l'exécution interrompue est effacé
+            progress = {stage: {"state": "pending"} for stage in JOB_KINDS[row[1]]}
+            conn.execute(
+                """
+                UPDATE jobs SET status = 'running', worker = ?, attempts = attempts + 1,
+                    started_at = ?, heartbeat_at = ?, progress = ?
+                WHERE id = ?
+                """,
+                (worker, now, now, json.dumps(progress), row[0]),
+            )
+        return {"id": row[0], "kind": row[1], "params": json.loads(row[2])}
+
+    def update_progress(
+        self, job_id: str, worker: str, stage: str, state: str, seconds: Optional[float]
+    ):
+        """Met à jour l'état d'une étape (et le heartbeat du job)"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT progress FROM jobs WHERE id = ? AND worker = ?", (job_id, worker)
+            ).fetchone()
+            if row is None:
+                return
+            progress = json.loads(row[0])
+            progress[stage] = {"state": state}
+            if seconds is not None:
+                progress[stage]["seconds"] = seconds
+            conn.execute(
+                "UPDATE jobs SET progress = ?, heartbeat_at = ? WHERE id = ? AND worker = ?",
+                (json.dumps(progress), time.time(), job_id, worker),
+            )
+
+    def heartbeat(self, job_id: str, worker: str):
+        """Signale que le worker traite toujours le job"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET heartbeat_at = ? WHERE id = ? AND worker = ?",
+                (time.time(), job_id, worker),
+            )
+
+    def finish(
+        self,
+        job_id: str,
+        worker: str,
+        result: Optional[Dict] = None,
+        error: Optional[str] = None,
+    ):
+        """Enregistre le résultat (ou l'erreur) d'un job"""
+        with self._connect() as conn:
+            conn.execute(
+                "UPDATE jobs SET status = ?, result = ?, error = ?, finished_at = ? "
+                "WHERE id = ? AND worker = ?",
+                (
+                    "failed" if error is not None else "succeeded",
+                    json.dumps(result, default=float) if result is not None else None,
+                    error,
+                    time.time(),
+                    job_id,
+                    worker,
+                ),
+            )
+
+    def _requeue(self, conn, condition: str, args: tuple, reason: str) -> int:
+        """Remet en file les jobs "running" sélectionnés (échec après max_attempts)"""
+        return conn.execute(
+            f"""
+            UPDATE jobs SET
+                status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'queued' END,
+                error = CASE WHEN attempts >= ? THEN ? ELSE error END,
+                finished_at = CASE WHEN attempts >= ? THEN ? ELSE NULL END,
+                worker = NULL
+            WHERE status = 'running' AND ({condition})
+            """,
+            (
+                self.max_attempts,
+                self.max_attempts,
+                f"{reason} ({self.max_attempts} tentatives)",
+                self.max_attempts,
+                time.time(),
+                *args,
+            ),
+        ).rowcount
+
+    def requeue_stale(self) -> int:
+        """Remet en file les jobs dont le worker n'envoie plus de heartbeat"""
+        with self._connect() as conn:
+            return self._requeue(
+                conn,
+                "heartbeat_at < ?",
+                (time.time() - self.stale_seconds,),
+                "Worker sans heartbeat",
+            )
+
+    def requeue_workers(self, workers: List[str]) -> int:
+        """Remet en file les jobs des workers arrêtés"""
+        if not workers:
+            return 0
+        with self._connect() as conn:
+            return self._requeue(
+                conn,
+                f"worker IN ({', '.join('?' * len(workers))})",
+                tuple(workers),
+                "Worker arrêté",
+            )
+
+    def requeue_orphans(self) -> int:
+        """
+        Remet en file les jobs des workers morts de cette machine (redémarrage
+        après un arrêt brutal), sans attendre l'expiration du heartbeat
+        """
+        hostname = socket.gethostname()
+        with self._connect() as conn:
+            workers = [
+                row[0]
+                for row in conn.execute(
+                    "SELECT DISTINCT worker FROM jobs WHERE status = 'running'"
+                )
+            ]
+        dead = [
+            worker
+            for worker in workers
+            if worker.startswith(f"{hostname}:") and not _pid_alive(worker)
+        ]
+        return self.requeue_workers(dead)
+
+    def stats(self) -> Dict:
+        """Nombre de jobs par statut"""
+        with self._connect() as conn:
+            counts = dict(conn.execute("SELECT status, COUNT(*) FROM jobs GROUP BY status"))
+        return {status: counts.get(status, 0) for status in JOB_STATUSES}
+
+
+def _pid_alive(worker: str) -> bool:
+    """Le processus d'un worker "hôte:pid" de cette machine tourne-t-il encore ?"""
+    try:
+        os.kill(int(worker.split(":")[1]), 0)
+    except ProcessLookupError:
+        return False
+    except (PermissionError, ValueError, IndexError):
+        pass
+    return True
+
+
+async def _run_job(kind: str, params: Dict, progress) -> Dict:
+    """Exécute un job avec les services de l'API"""
+    if kind == "evaluate_claim":
+        result = await evaluate_claim_files(
+            Path(params["image_path"]),
+            Path(params["contract_path"]),
+            params.get("damage_type", "accident"),
+            progress=progress,
+        )
+        return {
+            "evaluation": result["evaluation"],
+            "image_filename": Path(params["image_path"]).name,
+            "contract_filename": Path(params["contract_path"]).name,
+            "damage_type": params.get("damage_type", "accident"),
+            "reused_stages": result["reused_stages"],
+            "timings": result["timings"],
+        }
+    if kind == "analyze_contract":
+        result = await analyze_contract_file(Path(params["file_path"]), progress=progress)
+        return {"filename": Path(params["file_path"]).name, **result}
+    raise ValueError(f"Type de job inconnu: {kind}")
+
+
+def run_worker(
+    queue: JobQueue,
+    poll_interval: float = 0.5,
+    stop: Optional[threading.Event] = None,
+    parent_pid: Optional[int] = None,
+):
+    """
+    Boucle d'un worker : prend un job, l'exécute, enregistre son résultat.
+    Un thread envoie le heartbeat pendant les étapes longues. Tous les jobs
+    tournent sur la même boucle d'événements : les sémaphores de l'executor
+    (et la connexion au serveur d'inférence) restent liés à cette boucle.
+
+    Args:
+        queue: File de jobs
+        poll_interval: Attente entre deux consultations d'une file vide
+        stop: Événement d'arrêt (testé entre deux jobs)
+        parent_pid: Processus de l'API ; le worker s'arrête s'il disparaît
+    """
+    worker = f"{socket.gethostname()}:{os.getpid()}"
+    stop = stop or threading.Event()
+    print(f"👷 Worker de jobs démarré ({worker})")
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    try:
+        _worker_loop(queue, worker, loop, poll_interval, stop, parent_pid)
+    finally:
+        asyncio.set_event_loop(None)
+        loop.close()
+
+
+def _worker_loop(
+    queue: JobQueue,
+    worker: str,
+    loop: asyncio.AbstractEventLoop,
+    poll_interval: float,
+    stop: threading.Event,
+    parent_pid: Optional[int],
+):
+    while not stop.is_set():
+        if parent_pid is not None and os.getppid() != parent_pid:
+            print(f"👷 Processus parent disparu, arrêt du worker {worker}")
+            return
+
+        job = queue.claim(worker)
+        if job is None:
+            stop.wait(poll_interval)
+            continue
+
+        print(f"👷 Job {job['id']} ({job['kind']}) pris par {worker}")
+        done = threading.Event()
+
+        def beat(job_id=job["id"], done=done):
+            while not done.wait(queue.stale_seconds / 4):
+                queue.heartbeat(job_id, worker)
+
+        def progress(stage, state, seconds=None, job_id=job["id"]):
+            queue.update_progress(job_id, worker, stage, state, seconds)
+
+        heartbeat = threading.Thread(target=beat, daemon=True)
+        heartbeat.start()
+        try:
+            result = loop.run_until_complete(
+                _run_job(job["kind"], job["params"], progress)
+            )
+            queue.finish(job["id"], worker, result=result)
+            print(f"✅ Job {job['id']} terminé")
+        except Exception as e:
+            print(f"❌ Job {job['id']} en échec: {e}")
+            print(traceback.format_exc())
+            queue.finish(job["id"], worker, error=str(e))
+        finally:
+            done.set()
+            heartbeat.join()
+
+
+def _worker_process(
+    db_path: str,
+    stale_seconds: float,
+    max_attempts: int,
+    poll_interval: float,
+    parent_pid: int,
+):
+    """Point d'entrée d'un processus worker"""
+    run_worker(
+        JobQueue(Path(db_path), stale_seconds, max_attempts),
+        poll_interval,
+        parent_pid=parent_pid,
+    )
+
+
+class JobWorkers:
+    """Processus workers lancés avec l'API"""
+
+    def __init__(self, queue: JobQueue, workers: int, poll_interval: float = 0.5):
+        """
+        Args:
+            queue: File de jobs
+            workers: Nombre de processus (0 = workers lancés à part)
+            poll_interval: Attente entre deux consultations d'une file vide
+        """
+        self.queue = queue
+        self.workers = workers
+        self.poll_interval = poll_interval
+        self._processes: List[multiprocessing.Process] = []
+
+    def start(self):
+        """Remet en file les jobs interrompus puis lance les workers"""
+        requeued = self.queue.requeue_orphans()
+        if requeued:
+            print(f"♻️ {requeued} job(s) interrompu(s) remis dans la file")
+
+        # "spawn" : chaque worker charge ses propres modèles, sans hériter des
+        # threads de torch du processus de l'API. Pas de processus "daemon" :
+        # l'extraction des contrats lance son propre pool de processus
+        context = multiprocessing.get_context("spawn")
+        for _ in range(self.workers):
+            process = context.Process(
+                target=_worker_process,
+                args=(
+                    str(self.queue.db_path),
+                    self.queue.stale_seconds,
+                    self.queue.max_attempts,
+                    self.poll_interval,
+                    os.getpid(),
+                ),
+            )
+            process.start()
+            self._processes.append(process)
+
+    def stop(self):
+        """Arrête les workers ; leurs jobs en cours sont remis dans la file"""
+        hostname = socket.gethostname()
+        for process in self._processes:
+            process.terminate()
+        for process in self._processes:
+            process.join(timeout=10)
+        self.queue.requeue_workers(
+            [f"{hostname}:{process.pid}" for process in self._processes]
+        )
+        self._processes = []
+
+    def join(self):
+        """Attend la fin des workers"""
+        for process in self._processes:
+            process.join()
+
+    def stats(self) -> Dict:
+        """Nombre de workers lancés et en vie"""
+        return {
+            "workers": self.workers,
+            "alive": sum(1 for process in self._processes if process.is_alive()),
+        }
+
+
+def _create_job_queue() -> JobQueue:
+    return JobQueue(
+        Path(os.getenv("JOB_QUEUE_DB", "cache/jobs.sqlite3")),
+        stale_seconds=float(os.getenv("JOB_STALE_SECONDS", "60")),
+        max_attempts=int(os.getenv("JOB_MAX_ATTEMPTS", "3")),
+    )
+
+
+def _create_job_workers() -> JobWorkers:
+    return JobWorkers(
+        get_job_queue(),
+        workers=int(os.getenv("JOB_WORKERS", "0")),
+        poll_interval=float(os.getenv("JOB_POLL_INTERVAL", "0.5")),
+    )
+
+
+# Instances globales
+def get_job_queue() -> JobQueue:
+    """Retourne l'instance singleton de la JobQueue (configurée par variables d'environnement)"""
+    return get_registry().get("job_queue", _create_job_queue)
+
+
+def get_job_workers() -> JobWorkers:
+    """Retourne les workers de jobs lancés avec l'API"""
+    return get_registry().get("job_workers", _create_job_workers)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Workers de la file de jobs")
+    subparsers = parser.add_subparsers(dest="command", required=True)
+    worker_parser = subparsers.add_parser("worker", help="Lancer des workers")
+    worker_parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args()
+
+    queue = get_job_queue()
+    if args.workers == 1:
+        queue.requeue_orphans()
+        run_worker(queue, float(os.getenv("JOB_POLL_INTERVAL", "0.5")))
+        return
+
+    workers = JobWorkers(queue, args.workers)
+    workers.start()
+    try:
+        workers.join()
+    except KeyboardInterrupt:
+        workers.stop()
+
+
+if __name__ == "__main__":
+    main()
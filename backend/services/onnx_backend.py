@@ -0,0 +1,435 @@
+"""
+Backend d'inférence ONNX Runtime (CPU) pour Depth Anything et OWL-ViT.
+Sélectionné par INFERENCE_BACKEND=onnx ; les graphes sont exportés une fois
+depuis les modèles PyTorch, avec quantification dynamique int8 optionnelle.
+
+Usage (depuis backend/):
+    python -m services.onnx_backend export [--quantize]
+    python -m services.onnx_backend parity photo1.jpg [photo2.jpg ...] [--quantized]
+"""
+
+import argparse
+import json
+import os
+import sys
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from PIL import Image
+
+BACKENDS = ("torch", "onnx")
+
+# Noms des graphes exportés (dans ONNX_MODEL_DIR)
+DEPTH_GRAPH = "depth_anything"
+OWLVIT_IMAGE_GRAPH = "owlvit_image"
+OWLVIT_TEXT_GRAPH = "owlvit_text"
+
+# Résolution fixe du graphe de profondeur (multiple de 14) : l'export ne conserve
+# pas les tailles dynamiques, les images sont donc redimensionnées en carré
+DEPTH_INPUT_SIZE = 518
+OPSET_VERSION = 17
+
+
+def get_inference_backend() -> str:
+    """Backend d'inférence configuré (INFERENCE_BACKEND, défaut: torch)"""
+    backend = os.getenv("INFERENCE_BACKEND", "torch").lower()
+    if backend not in BACKENDS:
+        raise ValueError(f"INFERENCE_BACKEND inconnu: {backend} (choix: torch, onnx)")
+    return backend
+
+
+def onnx_model_path(name: str, quantized: Optional[bool] = None) -> Path:
+    """
+    Chemin d'un graphe exporté.
+
+    Args:
+        name: Nom du graphe (ex: "depth_anything")
+        quantized: Version int8 (défaut: variable ONNX_QUANTIZED)
+    """
+    if quantized is None:
+        quantized = os.getenv("ONNX_QUANTIZED", "0") == "1"
+    model_dir = Path(os.getenv("ONNX_MODEL_DIR", "models/onnx"))
+    return model_dir / (f"{name}.int8.onnx" if quantized else f"{name}.onnx")
+
+
+class OnnxSession:
+    """Session ONNX Runtime sur CPU (import de onnxruntime à la demande)"""
+
+    def __init__(self, path: Path, threads: Optional[int] = None):
+        """
+        Args:
+            path: Graphe ONNX
+            threads: Threads intra-op de la session (défaut: tous les cœurs)
+        """
+        try:
+            import onnxruntime as ort
+        except ImportError:
+            raise RuntimeError(
+                "INFERENCE_BACKEND=onnx nécessite onnxruntime (pip install onnxruntime)"
+            )
+        if not path.exists():
+            raise FileNotFoundError(
+                f"Graphe ONNX introuvable: {path} "
+                "(exporter avec: python -m services.onnx_backend export)"
+            )
+
+        options = ort.SessionOptions()
+        options.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+        if threads:
+            options.intra_op_num_threads = threads
+        self.path = path
+        self.session = ort.InferenceSession(
+            str(path), sess_options=options, providers=["CPUExecutionProvider"]
+        )
+        print(f"✓ Session ONNX chargée: {path.name}")
+
+    @property
+    def input_shape(self) -> list:
+        """Forme de la première entrée (dimensions dynamiques = noms)"""
+        return self.session.get_inputs()[0].shape
+
+    def run(self, **inputs: np.ndarray) -> List[np.ndarray]:
+        return self.session.run(
+            None, {name: np.ascontiguousarray(value) for name, value in inputs.items()}
+        )
+
+
+def format_depth_output(predicted_depth, size: Tuple[int, int]) -> Dict:
+    """
+    Même sortie que le pipeline transformers "depth-estimation" : profondeur
+    brute interpolée à la taille de l'image et image normalisée 0-255.
+
+    Args:
+        predicted_depth: Tensor [H', W'] produit par le modèle
+        size: Taille (largeur, hauteur) de l'image
+    """
+    import torch
+
+    width, height = size
+    predicted = torch.nn.functional.interpolate(
+        predicted_depth[None, None],
+        size=(height, width),
+        mode="bicubic",
+        align_corners=False,
+    )[0, 0]
+
+    depth = predicted.numpy()
+    # Carte constante (image uniforme) : pas d'étendue à normaliser
+    low, high = float(depth.min()), float(depth.max())
+    depth = (depth - low) / (high - low) if high > low else np.zeros_like(depth)
+    return {
+        "predicted_depth": predicted,
+        "depth": Image.fromarray((depth * 255).astype("uint8")),
+    }
+
+
+class OnnxDepthPipeline:
+    """Remplaçant ONNX Runtime du pipeline "depth-estimation" (mêmes appels et sorties)"""
+
+    def __init__(self, model_id: str, path: Path, threads: Optional[int] = None):
+        from transformers import AutoImageProcessor
+
+        self.image_processor = AutoImageProcessor.from_pretrained(model_id)
+        self.session = OnnxSession(path, threads)
+        self.input_size = int(self.session.input_shape[-1])
+
+    def __call__(self, images, batch_size: Optional[int] = None):
+        import torch
+
+        single = not isinstance(images, list)
+        images = [images] if single else images
+
+        pixel_values = self.image_processor(
+            images=images,
+            size={"height": self.input_size, "width": self.input_size},
+            keep_aspect_ratio=False,
+            return_tensors="np",
+        )["pixel_values"].astype(np.float32)
+        predicted = self.session.run(pixel_values=pixel_values)[0]
+
+        outputs = [
+            format_depth_output(torch.from_numpy(depth), image.size)
+            for depth, image in zip(predicted, images)
+        ]
+        return outputs[0] if single else outputs
+
+
+class OnnxOwlViT:
+    """Tours texte et vision d'OWL-ViT exécutées par ONNX Runtime"""
+
+    def __init__(self, image_path: Path, text_path: Path, threads: Optional[int] = None):
+        self.image_session = OnnxSession(image_path, threads)
+        self.text_session = OnnxSession(text_path, threads)
+
+    def text_embeds(self, input_ids: np.ndarray, attention_mask: np.ndarray) -> np.ndarray:
+        """Embeddings texte normalisés [nombre de requêtes, dimension]"""
+        return self.text_session.run(
+            input_ids=input_ids.astype(np.int64),
+            attention_mask=attention_mask.astype(np.int64),
+        )[0]
+
+    def predict(
+        self, pixel_values: np.ndarray, query_embeds: np.ndarray
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """Logits [batch, patches, requêtes] et boxes normalisées [batch, patches, 4]"""
+        logits, pred_boxes = self.image_session.run(
+            pixel_values=pixel_values.astype(np.float32),
+            query_embeds=query_embeds.astype(np.float32),
+        )
+        return logits, pred_boxes
+
+
+def _export(module, args: tuple, path: Path, input_names, output_names, dynamic_axes):
+    """Export TorchScript (tailles d'entrée figées sauf dynamic_axes)"""
+    import inspect
+    import torch
+
+    # Exporteur historique : l'exporteur dynamo fige lui aussi les tailles ici
+    kwargs = {}
+    if "dynamo" in inspect.signature(torch.onnx.export).parameters:
+        kwargs["dynamo"] = False
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with torch.no_grad():
+        torch.onnx.export(
+            module.eval(),
+            args,
+            str(path),
+            input_names=input_names,
+            output_names=output_names,
+            dynamic_axes=dynamic_axes,
+            opset_version=OPSET_VERSION,
+            **kwargs,
+        )
+    print(f"✅ Exporté: {path}")
+
+
+def export_depth(model_id: str, path: Path, input_size: int = DEPTH_INPUT_SIZE):
+    """Exporte Depth Anything (pixel_values [batch, 3, size, size] -> predicted_depth)"""
+    import torch
+    from transformers import AutoModelForDepthEstimation
+
+    model = AutoModelForDepthEstimation.from_pretrained(model_id)
+
+    class DepthGraph(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, pixel_values):
+            return self.model(pixel_values=pixel_values).predicted_depth
+
+    _export(
+        DepthGraph(),
+        (torch.randn(1, 3, input_size, input_size),),
+        path,
+        ["pixel_values"],
+        ["predicted_depth"],
+        {"pixel_values": {0: "batch"}, "predicted_depth": {0: "batch"}},
+    )
+
+
+def export_owlvit(model_id: str, image_path: Path, text_path: Path):
+    """Exporte OWL-ViT en deux graphes : têtes de détection (vision) et texte"""
+    import torch
+    from transformers import OwlViTForObjectDetection
+    from services.zero_shot_detector import owlvit_heads, owlvit_text_embeds
+
+    model = OwlViTForObjectDetection.from_pretrained(model_id)
+    image_size = model.config.vision_config.image_size
+    projection_dim = model.config.projection_dim
+
+    class ImageGraph(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, pixel_values, query_embeds):
+            return owlvit_heads(self.model, pixel_values, query_embeds)
+
+    class TextGraph(torch.nn.Module):
+        def __init__(self):
+            super().__init__()
+            self.model = model
+
+        def forward(self, input_ids, attention_mask):
+            return owlvit_text_embeds(self.model, input_ids, attention_mask)
+
+    _export(
+        ImageGraph(),
+        (torch.randn(1, 3, image_size, image_size), torch.randn(4, projection_dim)),
+        image_path,
+        ["pixel_values", "query_embeds"],
+        ["logits", "pred_boxes"],
+        {
+            "pixel_values": {0: "batch"},
+            "query_embeds": {0: "queries"},
+            "logits": {0: "batch", 2: "queries"},
+            "pred_boxes": {0: "batch"},
+        },
+    )
+    input_ids = torch.randint(1, 1000, (4, 16))
+    _export(
+        TextGraph(),
+        (input_ids, torch.ones_like(input_ids)),
+        text_path,
+        ["input_ids", "attention_mask"],
+        ["text_embeds"],
+        {
+            "input_ids": {0: "queries", 1: "sequence"},
+            "attention_mask": {0: "queries", 1: "sequence"},
+            "text_embeds": {0: "queries"},
+        },
+    )
+
+
+def quantize(path: Path) -> Path:
+    """Quantification dynamique int8 des poids (MatMul/Gemm), activations en float"""
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    output_path = path.with_suffix(".int8.onnx")
+    quantize_dynamic(str(path), str(output_path), weight_type=QuantType.QInt8)
+    print(f"✅ Quantifié: {output_path}")
+    return output_path
+
+
+def _box_iou(box1: Dict, box2: Dict) -> float:
+    """IoU de deux bounding boxes (dicts x1, y1, x2, y2)"""
+    if box1 == box2:
+        # Boxes identiques (y compris dégénérées, de surface nulle)
+        return 1.0
+    inter_w = max(0, min(box1["x2"], box2["x2"]) - max(box1["x1"], box2["x1"]))
+    inter_h = max(0, min(box1["y2"], box2["y2"]) - max(box1["y1"], box2["y1"]))
+    intersection = inter_w * inter_h
+    area1 = (box1["x2"] - box1["x1"]) * (box1["y2"] - box1["y1"])
+    area2 = (box2["x2"] - box2["x1"]) * (box2["y2"] - box2["y1"])
+    union = area1 + area2 - intersection
+    return intersection / union if union > 0 else 0
+
+
+def _compare_detections(reference: List[Dict], candidate: List[Dict]) -> Dict:
+    """Associe chaque détection de référence à la meilleure détection de même classe"""
+    unmatched = list(candidate)
+    ious, score_diffs = [], []
+    for det in reference:
+        same_class = [c for c in unmatched if c["class"] == det["class"]]
+        if not same_class:
+            ious.append(0.0)
+            continue
+        best = max(same_class, key=lambda c: _box_iou(det["bbox"], c["bbox"]))
+        unmatched.remove(best)
+        ious.append(_box_iou(det["bbox"], best["bbox"]))
+        score_diffs.append(abs(det["confidence"] - best["confidence"]))
+
+    return {
+        "torch_count": len(reference),
+        "onnx_count": len(candidate),
+        "min_iou": round(min(ious), 4) if ious else 1.0,
+        "mean_iou": round(float(np.mean(ious)), 4) if ious else 1.0,
+        "max_confidence_diff": round(max(score_diffs), 4) if score_diffs else 0.0,
+    }
+
+
+def _depth_stats(output: Dict) -> Dict:
+    depth = np.array(output["depth"], dtype=np.float64)
+    return {
+        "min_depth": float(depth.min()),
+        "max_depth": float(depth.max()),
+        "mean_depth": float(depth.mean()),
+        "std_depth": float(depth.std()),
+    }
+
+
+def parity(image_paths: List[Path]) -> Dict:
+    """
+    Compare les sorties des backends torch et onnx sur des photos réelles :
+    boxes OWL-ViT (IoU, confiance) et statistiques de profondeur.
+    """
+    from services.depth_estimator import DepthEstimator
+    from services.zero_shot_detector import ZeroShotDetector
+    from services.shared_image import SharedImage
+
+    depth_torch = DepthEstimator(backend="torch")
+    depth_onnx = DepthEstimator(backend="onnx")
+    depth_torch._load_model()
+    depth_onnx._load_model()
+    parts_torch = ZeroShotDetector(backend="torch")
+    parts_onnx = ZeroShotDetector(backend="onnx")
+    queries = list(ZeroShotDetector.DEFAULT_QUERIES)
+
+    report = {"quantized": os.getenv("ONNX_QUANTIZED", "0") == "1", "images": {}}
+    for image_path in image_paths:
+        image = Image.open(image_path).convert("RGB")
+        torch_stats = _depth_stats(depth_torch.pipe([image])[0])
+        onnx_stats = _depth_stats(depth_onnx.pipe([image])[0])
+        shared = SharedImage.from_pil(image)
+
+        report["images"][str(image_path)] = {
+            "depth": {
+                "torch": torch_stats,
+                "onnx": onnx_stats,
+                "max_abs_diff": round(
+                    max(abs(torch_stats[k] - onnx_stats[k]) for k in torch_stats), 3
+                ),
+            },
+            "parts": _compare_detections(
+                parts_torch._detect_batch([shared], queries)[0],
+                parts_onnx._detect_batch([shared], queries)[0],
+            ),
+        }
+    return report
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Export et vérification des graphes ONNX")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    export_parser = commands.add_parser("export", help="Exporter les graphes ONNX")
+    export_parser.add_argument(
+        "--quantize", action="store_true", help="Produire aussi les versions int8"
+    )
+    export_parser.add_argument("--depth-size", type=int, default=DEPTH_INPUT_SIZE)
+
+    parity_parser = commands.add_parser("parity", help="Comparer torch et onnx sur des photos")
+    parity_parser.add_argument("images", nargs="+", type=Path)
+    parity_parser.add_argument(
+        "--quantized", action="store_true", help="Utiliser les graphes int8"
+    )
+    parity_parser.add_argument("--min-iou", type=float, default=0.9)
+    parity_parser.add_argument("--max-depth-diff", type=float, default=5.0)
+
+    args = parser.parse_args()
+
+    if args.command == "export":
+        from services.depth_estimator import DepthEstimator
+        from services.zero_shot_detector import ZeroShotDetector
+
+        paths = [
+            onnx_model_path(name, quantized=False)
+            for name in (DEPTH_GRAPH, OWLVIT_IMAGE_GRAPH, OWLVIT_TEXT_GRAPH)
+        ]
+        export_depth(DepthEstimator.MODEL_ID, paths[0], args.depth_size)
+        export_owlvit(ZeroShotDetector.MODEL_ID, paths[1], paths[2])
+        if args.quantize:
+            for path in paths:
+                quantize(path)
+        return
+
+    os.environ["ONNX_QUANTIZED"] = "1" if args.quantized else "0"
+    report = parity(args.images)
+    print(json.dumps(report, indent=2))
+
+    failed = [
+        name
+        for name, result in report["images"].items()
+        if result["parts"]["min_iou"] < args.min_iou
+        or result["parts"]["torch_count"] != result["parts"]["onnx_count"]
+        or result["depth"]["max_abs_diff"] > args.max_depth_diff
+    ]
+    if failed:
+        print(f"❌ Écarts hors tolérance: {', '.join(failed)}")
+        sys.exit(1)
+    print("✅ Parité torch / onnx dans les tolérances")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,408 @@
+"""
+Simulateur de portefeuille (what-if) pour la souscription.
+Les sinistres (détections, termes du contrat, type de sinistre) sont chargés une
+fois en colonnes NumPy ; chaque scénario (franchise, plafond, règles de
+garantie) est ensuite évalué sur tout le portefeuille en quelques opérations
+vectorisées, avec les mêmes règles que ClaimEvaluator.evaluate_claim.
+Le Monte Carlo tire la présence de chaque détection selon sa confiance : en
+moyenne, le coût simulé d'un sinistre est le coût estimé par ClaimEvaluator.
+"""
+
+import itertools
+import os
+from pathlib import Path
+from typing import Dict, List, Optional, Tuple
+import numpy as np
+from services.claim_dossier import get_claim_dossier
+from services.claim_evaluator import ClaimEvaluator, get_claim_evaluator
+from services.registry import get_registry
+
+# Paramètres acceptés dans un scénario
+SCENARIO_KEYS = (
+    "name",
+    "franchise",
+    "franchise_delta",
+    "plafond",
+    "plafond_delta",
+    "coverage",
+)
+# Percentiles rapportés pour les totaux simulés
+PERCENTILES = (5, 50, 95)
+
+
+class Portfolio:
+    """Sinistres d'un portefeuille en colonnes (une ligne par sinistre)"""
+
+    def __init__(self, evaluator: ClaimEvaluator, claims: List[Dict]):
+        """
+        Args:
+            evaluator: Évaluateur dont les coûts et les règles sont repris
+            claims: Sinistres {damage_data, contract_data, damage_type}, comme les
+                arguments de ClaimEvaluator.evaluate_claim
+        """
+        self.size = len(claims)
+        damages = [claim["damage_data"] for claim in claims]
+        contracts = [claim["contract_data"] for claim in claims]
+
+        # Détections de tous les sinistres
+        counts = [len(damage.get("detected_objects", [])) for damage in damages]
+        columns = evaluator.damage_columns(
+            [obj for damage in damages for obj in damage.get("detected_objects", [])]
+        )
+
+        # Coût estimé de chaque sinistre, identique à celui de l'évaluateur
+        self.estimated_cost = np.array(
+            [
+                damage["estimated_cost"]
+                for damage in evaluator.analyze_damages(
+                    damages, breakdown=False, columns=columns
+                )
+            ],
+            dtype=np.float64,
+        )
+
+        # Monte Carlo : coût de chaque détection si la pièce est réellement
+        # endommagée, et probabilité qu'elle le soit (confiance)
+        self.detection_claim = np.repeat(np.arange(self.size), counts)
+        self.detection_cost = np.array(columns["base_costs"], dtype=np.float64) * np.array(
+            columns["factors"], dtype=np.float64
+        )
+        self.detection_confidence = np.array(columns["confidences"], dtype=np.float64)
+
+        # Estimation par la profondeur si aucune pièce n'est retenue
+        self.has_depth_estimate = np.array(
+            ["depth_stats" in damage for damage in damages], dtype=bool
+        )
+        self.depth_estimate = np.array(
+            [
+                evaluator._estimate_from_depth(damage["depth_stats"])
+                if "depth_stats" in damage
+                else 0.0
+                for damage in damages
+            ],
+            dtype=np.float64,
+        )
+
+        # Termes du contrat (plafond infini = pas de plafond)
+        self.franchise = np.array(
+            [
+                (contract.get("franchise") or {}).get("amount", 0)
+                if (contract.get("franchise") or {}).get("found")
+                else 0
+                for contract in contracts
+            ],
+            dtype=np.float64,
+        )
+        self.plafond = np.array(
+            [
+                (contract.get("plafond") or {}).get("amount")
+                if (contract.get("plafond") or {}).get("found")
+                else np.inf
+                for contract in contracts
+            ],
+            dtype=np.float64,
+        )
+
+        # Garanties actives (sinistre x garantie) et type de sinistre (code)
+        self.garanties = list(
+            dict.fromkeys(
+                itertools.chain(
+                    evaluator.GARANTIE_COVERAGE,
+                    *(contract.get("garanties", {}) for contract in contracts),
+                )
+            )
+        )
+        garanties = [contract.get("garanties", {}) for contract in contracts]
+        self.garantie_active = np.array(
+            [[bool(active.get(name)) for active in garanties] for name in self.garanties],
+            dtype=bool,
+        ).reshape(len(self.garanties), self.size).T
+        self.damage_types = sorted({claim["damage_type"] for claim in claims})
+        type_codes = {damage_type: code for code, damage_type in enumerate(self.damage_types)}
+        self.damage_type = np.array(
+            [type_codes[claim["damage_type"]] for claim in claims], dtype=np.intp
+        )
+
+    @property
+    def detection_count(self) -> int:
+        return len(self.detection_cost)
+
+    def covered_by_garantie(self, coverage: Dict[str, List[str]]) -> np.ndarray:
+        """
+        Sinistres couverts par au moins une garantie active, selon les règles
+        coverage (garantie -> types de sinistre). "tous_risques" couvre tout,
+        comme dans ClaimEvaluator.
+        """
+        rules = np.array(
+            [
+                [
+                    name == "tous_risques" or damage_type in coverage.get(name, [])
+                    for damage_type in self.damage_types
+                ]
+                for name in self.garanties
+            ],
+            dtype=bool,
+        ).reshape(len(self.garanties), len(self.damage_types))
+        return (self.garantie_active & rules[:, self.damage_type].T).any(axis=1)
+
+
+class PortfolioSimulator:
+    """Évaluation vectorisée de scénarios what-if sur un portefeuille"""
+
+    def __init__(
+        self,
+        evaluator: Optional[ClaimEvaluator] = None,
+        max_samples: int = 10000,
+        chunk_cells: int = 4_000_000,
+    ):
+        """
+        Args:
+            evaluator: Évaluateur de référence (défaut: singleton)
+            max_samples: Nombre maximum de tirages Monte Carlo par simulation
+            chunk_cells: Taille des blocs de tirages (tirages x détections),
+                pour borner la mémoire
+        """
+        self.evaluator = evaluator or get_claim_evaluator()
+        self.max_samples = max_samples
+        self.chunk_cells = chunk_cells
+        print(f"📈 PortfolioSimulator prêt (max {self.max_samples} tirages)")
+
+    def load(self, claims: List[Dict]) -> Portfolio:
+        """Met en colonnes des sinistres {damage_data, contract_data, damage_type}"""
+        return Portfolio(self.evaluator, claims)
+
+    def load_from_dossier(
+        self, claims: List[Tuple[Path, Path, str]]
+    ) -> Tuple[Portfolio, List[Dict]]:
+        """
+        Charge les dégâts et les termes de contrat enregistrés dans le dossier de
+        sinistre, sans relancer les modèles.
+
+        Args:
+            claims: (photo, contrat, type de sinistre) de chaque sinistre
+
+        Returns:
+            Tuple (portefeuille, sinistres ignorés faute de sortie enregistrée)
+        """
+        dossier = get_claim_dossier()
+        images = [image_path for image_path, _, _ in claims]
+        damages = dossier.get_many(images, "damage")
+        # Photos analysées sans évaluation : détections sans profondeur locale
+        missing = [path for path in images if path not in damages]
+        parts = dossier.get_many(missing, "parts")
+        depth = dossier.get_many(missing, "depth")
+        for path in missing:
+            if path in parts and path in depth:
+                damages[path] = {
+                    "detected_objects": parts[path].get("detections", []),
+                    "depth_stats": depth[path].get("stats", {}),
+                }
+        contracts = dossier.get_many([path for _, path, _ in claims], "analysis")
+
+        loaded, skipped = [], []
+        for index, (image_path, contract_path, damage_type) in enumerate(claims):
+            if image_path not in damages:
+                skipped.append({"index": index, "detail": "Photo non analysée"})
+            elif contract_path not in contracts:
+                skipped.append({"index": index, "detail": "Contrat non analysé"})
+            else:
+                loaded.append(
+                    {
+                        "damage_data": damages[image_path],
+                        "contract_data": contracts[contract_path],
+                        "damage_type": damage_type,
+                    }
+                )
+        return self.load(loaded), skipped
+
+    @staticmethod
+    def sweep(
+        scenarios: Optional[List[Dict]] = None,
+        franchise_deltas: Optional[List[float]] = None,
+        plafond_deltas: Optional[List[float]] = None,
+    ) -> List[Dict]:
+        """
+        Grille de scénarios : chaque scénario de base (défaut: termes actuels)
+        combiné à chaque variation de franchise et de plafond.
+        """
+        grid = []
+        for scenario, franchise_delta, plafond_delta in itertools.product(
+            scenarios or [{}], franchise_deltas or [None], plafond_deltas or [None]
+        ):
+            scenario = dict(scenario)
+            if franchise_delta is not None:
+                scenario["franchise_delta"] = (
+                    scenario.get("franchise_delta", 0) + franchise_delta
+                )
+            if plafond_delta is not None:
+                scenario["plafond_delta"] = scenario.get("plafond_delta", 0) + plafond_delta
+            grid.append(scenario)
+        return grid
+
+    def _terms(self, portfolio: Portfolio, scenario: Dict) -> Tuple:
+        """Franchise, plafond et couverture par garantie de chaque sinistre"""
+        unknown = set(scenario) - set(SCENARIO_KEYS)
+        if unknown:
+            raise ValueError(f"Paramètres de scénario inconnus: {sorted(unknown)}")
+
+        if scenario.get("franchise") is not None:
+            franchise = np.full(portfolio.size, float(scenario["franchise"]))
+        else:
+            franchise = portfolio.franchise + scenario.get("franchise_delta", 0)
+        if scenario.get("plafond") is not None:
+            plafond = np.full(portfolio.size, float(scenario["plafond"]))
+        else:
+            # Les contrats sans plafond restent sans plafond (inf + delta)
+            plafond = portfolio.plafond + scenario.get("plafond_delta", 0)
+
+        coverage = {
+            **self.evaluator.GARANTIE_COVERAGE,
+            **(scenario.get("coverage") or {}),
+        }
+        return (
+            np.maximum(franchise, 0),
+            np.maximum(plafond, 0),
+            portfolio.covered_by_garantie(coverage),
+        )
+
+    @staticmethod
+    def _decide(costs: np.ndarray, franchise, plafond, garantie) -> Tuple:
+        """
+        Décision et remboursement (règles de ClaimEvaluator.evaluate_claim) pour
+        un vecteur de coûts ou une matrice tirages x sinistres
+        """
+        covered = garantie & (costs > franchise) & (costs <= plafond)
+        reimbursement = np.minimum(costs - franchise, plafond)
+        reimbursement *= covered
+        return covered, reimbursement
+
+    def _sample_costs(self, portfolio: Portfolio, rows: int, rng) -> np.ndarray:
+        """Coûts de sinistre tirés (rows x sinistres) : chaque détection est
+        retenue avec la probabilité de sa confiance"""
+        draws = rng.random((rows, portfolio.detection_count))
+        present = draws < portfolio.detection_confidence
+        offsets = np.arange(rows)[:, None] * portfolio.size
+        costs = np.bincount(
+            (portfolio.detection_claim + offsets).ravel(),
+            weights=(present * portfolio.detection_cost).ravel(),
+            minlength=rows * portfolio.size,
+        ).reshape(rows, portfolio.size)
+        # Aucune pièce retenue : estimation par la profondeur
+        fallback = (costs == 0) & portfolio.has_depth_estimate
+        return np.where(fallback, portfolio.depth_estimate, costs)
+
+    def simulate(
+        self,
+        portfolio: Portfolio,
+        scenarios: Optional[List[Dict]] = None,
+        samples: int = 0,
+        seed: Optional[int] = None,
+    ) -> Dict:
+        """
+        Évalue chaque scénario sur tout le portefeuille.
+
+        Args:
+            portfolio: Portefeuille chargé (load / load_from_dossier)
+            scenarios: Variantes des termes (franchise, franchise_delta, plafond,
+                plafond_delta, coverage) ; défaut: termes actuels uniquement
+            samples: Tirages Monte Carlo sur la confiance des détections (0 = aucun)
+            seed: Graine des tirages (mêmes tirages pour tous les scénarios)
+
+        Returns:
+            dict baseline (termes actuels) et un résumé par scénario
+        """
+        if not 0 <= samples <= self.max_samples:
+            raise ValueError(f"samples doit être entre 0 et {self.max_samples}")
+        scenarios = scenarios or [{}]
+        terms = [self._terms(portfolio, scenario) for scenario in [{}] + scenarios]
+
+        # Décision sur le coût estimé de chaque sinistre
+        summaries = []
+        for scenario_terms in terms:
+            covered, reimbursement = self._decide(portfolio.estimated_cost, *scenario_terms)
+            total_reimbursement = float(reimbursement.sum())
+            summaries.append(
+                {
+                    "covered_claims": int(covered.sum()),
+                    "coverage_rate": (
+                        round(float(covered.mean()), 4) if portfolio.size else 0.0
+                    ),
+                    "estimated_damage": round(float(portfolio.estimated_cost.sum()), 2),
+                    "reimbursement": round(total_reimbursement, 2),
+                    "out_of_pocket": round(
+                        float(portfolio.estimated_cost.sum()) - total_reimbursement, 2
+                    ),
+                }
+            )
+
+        if samples:
+            # Totaux par tirage et par scénario ; tirages par blocs pour borner la mémoire
+            rng = np.random.default_rng(seed)
+            totals = {
+                key: np.empty((len(terms), samples))
+                for key in ("covered_claims", "reimbursement", "out_of_pocket")
+            }
+            rows = max(
+                1,
+                self.chunk_cells // max(portfolio.detection_count, portfolio.size, 1),
+            )
+            for start in range(0, samples, rows):
+                stop = min(start + rows, samples)
+                costs = self._sample_costs(portfolio, stop - start, rng)
+                damage_totals = costs.sum(axis=1)
+                for index, scenario_terms in enumerate(terms):
+                    covered, reimbursement = self._decide(costs, *scenario_terms)
+                    reimbursement_totals = reimbursement.sum(axis=1)
+                    totals["covered_claims"][index, start:stop] = covered.sum(axis=1)
+                    totals["reimbursement"][index, start:stop] = reimbursement_totals
+                    totals["out_of_pocket"][index, start:stop] = (
+                        damage_totals - reimbursement_totals
+                    )
+
+            for index, summary in enumerate(summaries):
+                summary["monte_carlo"] = {
+                    key: _distribution(values[index]) for key, values in totals.items()
+                }
+
+        baseline = summaries[0]
+        for summary in summaries[1:]:
+            summary["reimbursement_change"] = round(
+                summary["reimbursement"] - baseline["reimbursement"], 2
+            )
+
+        return {
+            "claims": portfolio.size,
+            "detections": portfolio.detection_count,
+            "samples": samples,
+            "seed": seed,
+            "baseline": baseline,
+            "scenarios": [
+                {"scenario": scenario, **summary}
+                for scenario, summary in zip(scenarios, summaries[1:])
+            ],
+        }
+
+
+def _distribution(values: np.ndarray) -> Dict:
+    """Moyenne, écart-type et percentiles d'un total simulé"""
+    return {
+        "mean": round(float(values.mean()), 2),
+        "std": round(float(values.std()), 2),
+        **{
+            f"p{q}": round(float(value), 2)
+            for q, value in zip(PERCENTILES, np.percentile(values, PERCENTILES))
+        },
+    }
+
+
+def _create_portfolio_simulator() -> PortfolioSimulator:
+    return PortfolioSimulator(
+        max_samples=int(os.getenv("PORTFOLIO_MAX_SAMPLES", "10000")),
+        chunk_cells=int(os.getenv("PORTFOLIO_CHUNK_CELLS", "4000000")),
+    )
+
+
+# Instance globale
+def get_portfolio_simulator() -> PortfolioSimulator:
+    """Retourne l'instance singleton du PortfolioSimulator (configurée par variables d'environnement)"""
+    return get_registry().get("portfolio_simulator", _create_portfolio_simulator)
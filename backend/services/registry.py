@@ -0,0 +1,99 @@
+"""
+Registre des services (singletons).
+Construction verrouillée et "single-flight" : même si plusieurs threads demandent
+un service en même temps, le modèle n'est chargé qu'une seule fois.
+Mesure aussi le temps de chargement et l'empreinte mémoire de chaque modèle.
+"""
+
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict
+
+
+def current_rss_bytes() -> int:
+    """Mémoire résidente (RSS) actuelle du processus, en octets"""
+    try:
+        with open("/proc/self/statm") as f:
+            resident_pages = int(f.read().split()[1])
+        return resident_pages * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        # Hors Linux : pic de mémoire (ko sous Linux, octets sous macOS)
+        import resource
+        import sys
+
+        max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return max_rss if sys.platform == "darwin" else max_rss * 1024
+
+
+class ServiceRegistry:
+    """Singletons des services avec initialisation unique et thread-safe"""
+
+    def __init__(self):
+        self._instances: Dict[str, Any] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_guard = threading.Lock()
+        self._loads: Dict[str, Dict] = {}
+
+    def _lock_for(self, name: str) -> threading.Lock:
+        with self._locks_guard:
+            if name not in self._locks:
+                self._locks[name] = threading.Lock()
+            return self._locks[name]
+
+    def get(self, name: str, factory: Callable[[], Any]) -> Any:
+        """
+        Retourne le service `name`, en le construisant avec factory() au premier appel.
+        Les appels concurrents attendent la fin de la construction en cours.
+
+        Args:
+            name: Nom du service
+            factory: Fonction construisant le service
+        """
+        instance = self._instances.get(name)
+        if instance is not None:
+            return instance
+
+        with self._lock_for(name):
+            instance = self._instances.get(name)
+            if instance is None:
+                with self.measure(name):
+                    instance = factory()
+                self._instances[name] = instance
+        return instance
+
+    @contextmanager
+    def measure(self, name: str):
+        """
+        Mesure le temps et la mémoire consommés par un chargement.
+        La variation de RSS est indicative si d'autres threads allouent en même temps.
+        """
+        rss_before = current_rss_bytes()
+        start = time.perf_counter()
+        yield
+        self._loads[name] = {
+            "load_seconds": round(time.perf_counter() - start, 3),
+            "memory_mb": round((current_rss_bytes() - rss_before) / (1024 * 1024), 1),
+            "loaded_at": time.time(),
+        }
+        print(
+            f"📦 {name} chargé en {self._loads[name]['load_seconds']}s "
+            f"(+{self._loads[name]['memory_mb']} Mo)"
+        )
+
+    def report(self) -> Dict:
+        """Retourne les services chargés avec leur temps de chargement et mémoire"""
+        return {
+            "loaded": dict(self._loads),
+            "process_rss_mb": round(current_rss_bytes() / (1024 * 1024), 1),
+        }
+
+
+# Instance globale
+_service_registry = ServiceRegistry()
+
+
+def get_registry() -> ServiceRegistry:
+    """Retourne le registre global des services"""
+    return _service_registry
@@ -0,0 +1,183 @@
+"""
+Répartition des cœurs CPU entre les modèles.
+torch, ultralytics, ONNX Runtime et tesseract supposent chacun disposer de tous
+les cœurs : exécutés en même temps dans un même processus, ils lancent bien plus
+de threads qu'il n'y a de cœurs et la latence s'effondre. Le gouverneur attribue
+à chaque modèle un budget de threads intra-op par worker, de sorte que
+(inférences simultanées x threads) reste dans le nombre de cœurs.
+"""
+
+import os
+import threading
+from typing import Dict, Optional
+import cv2
+import torch
+
+# Part relative des cœurs attribuée à chaque modèle (budget automatique)
+DEFAULT_CORE_SHARES = {
+    "zero_shot": 2,
+    "depth": 2,
+    "yolo": 1,
+    "contract": 1,
+    "render": 1,
+}
+
+# Budget déjà appliqué au thread courant (torch/OpenMP : réglage par thread)
+_thread_state = threading.local()
+
+
+def parse_thread_budgets(value: Optional[str]) -> Dict[str, int]:
+    """
+    Parse une configuration de la forme "depth=4,zero_shot=2".
+
+    Returns:
+        Dict modèle -> threads intra-op par worker (modèles absents = automatique)
+    """
+    budgets = {}
+    for item in (value or "").split(","):
+        if not item.strip():
+            continue
+        name, _, threads = item.partition("=")
+        budgets[name.strip()] = max(1, int(threads))
+    return budgets
+
+
+def apply_thread_budget(threads: int):
+    """
+    Limite les threads intra-op de torch (et donc d'ultralytics) pour le thread
+    courant. Avec le backend OpenMP le réglage est propre à chaque thread :
+    deux workers de modèles différents gardent chacun leur budget.
+    """
+    if getattr(_thread_state, "threads", None) == threads:
+        return
+    torch.set_num_threads(threads)
+    _thread_state.threads = threads
+
+
+def configure_process(interop_threads: int, tesseract_threads: int, opencv_threads: int):
+    """
+    Réglages globaux du processus (processus principal et workers du pool) :
+    threads inter-op de torch, OpenMP de tesseract et pool interne d'OpenCV.
+    """
+    try:
+        # Possible une seule fois, avant tout travail parallèle de torch
+        torch.set_num_interop_threads(interop_threads)
+    except RuntimeError:
+        pass
+    # Lu par chaque processus tesseract lancé par pytesseract
+    os.environ["OMP_THREAD_LIMIT"] = str(tesseract_threads)
+    cv2.setNumThreads(opencv_threads)
+
+
+class ResourceGovernor:
+    """Budgets de threads par modèle et par worker"""
+
+    def __init__(
+        self,
+        model_limits: Dict[str, int],
+        cores: Optional[int] = None,
+        thread_budgets: Optional[Dict[str, int]] = None,
+        compute_workers: Optional[Dict[str, int]] = None,
+        interop_threads: int = 1,
+    ):
+        """
+        Args:
+            model_limits: Inférences simultanées par modèle (limites de l'executor)
+            cores: Cœurs à répartir (défaut: tous les cœurs de la machine)
+            thread_budgets: Threads intra-op imposés par worker, par modèle
+                (les autres modèles reçoivent leur part de DEFAULT_CORE_SHARES)
+            compute_workers: Workers qui calculent réellement, quand ils diffèrent
+                de la limite (ex: micro-batching OWL-ViT, un seul thread de calcul)
+            interop_threads: Threads inter-op de torch (réglage global du processus)
+        """
+        self.cores = cores or os.cpu_count() or 1
+        self.model_limits = dict(model_limits)
+        self.compute_workers = {
+            model: (compute_workers or {}).get(model, limit)
+            for model, limit in self.model_limits.items()
+        }
+        self.interop_threads = max(1, interop_threads)
+
+        total_shares = sum(DEFAULT_CORE_SHARES.get(m, 1) for m in self.model_limits)
+        thread_budgets = thread_budgets or {}
+        self.budgets = {}
+        for model, workers in self.compute_workers.items():
+            if model in thread_budgets:
+                self.budgets[model] = thread_budgets[model]
+                continue
+            model_cores = self.cores * DEFAULT_CORE_SHARES.get(model, 1) / total_shares
+            self.budgets[model] = max(1, int(model_cores // workers))
+
+        # Tâches hors modèle (préchauffage, statistiques par pièce) : part égale
+        self.default_budget = max(1, self.cores // max(1, sum(self.compute_workers.values())))
+
+        if self.total_threads > self.cores:
+            print(
+                f"⚠️ Budgets de threads ({self.total_threads}) supérieurs au nombre "
+                f"de cœurs ({self.cores}) : les modèles simultanés se concurrencent"
+            )
+
+    @classmethod
+    def from_stats(cls, stats: Dict) -> "ResourceGovernor":
+        """
+        Reconstruit un gouverneur à partir de son rapport (stats()), ex: celui du
+        serveur d'inférence vu depuis un worker HTTP en mode remote
+        """
+        models = stats["models"]
+        return cls(
+            {model: info["concurrency"] for model, info in models.items()},
+            cores=stats["cores"],
+            thread_budgets={
+                model: info["threads_per_worker"] for model, info in models.items()
+            },
+            compute_workers={
+                model: info["compute_workers"] for model, info in models.items()
+            },
+            interop_threads=stats["interop_threads"],
+        )
+
+    def threads(self, model: str) -> int:
+        """Threads intra-op d'un worker du modèle"""
+        return self.budgets.get(model, self.default_budget)
+
+    @property
+    def total_threads(self) -> int:
+        """Threads intra-op au pire cas, tous les workers de tous les modèles actifs"""
+        return sum(
+            self.budgets[model] * workers for model, workers in self.compute_workers.items()
+        )
+
+    def configure_process(self):
+        """Applique les réglages globaux au processus courant"""
+        configure_process(
+            self.interop_threads, self.threads("contract"), self.threads("render")
+        )
+
+    def stats(self) -> Dict:
+        """Retourne l'allocation active des cœurs"""
+        return {
+            "cores": self.cores,
+            "interop_threads": self.interop_threads,
+            "total_threads": self.total_threads,
+            "oversubscribed": self.total_threads > self.cores,
+            "default_threads": self.default_budget,
+            "models": {
+                model: {
+                    "concurrency": self.model_limits[model],
+                    "compute_workers": workers,
+                    "threads_per_worker": self.budgets[model],
+                    "max_threads": self.budgets[model] * workers,
+                }
+                for model, workers in self.compute_workers.items()
+            },
+        }
+
+
+def get_resource_governor() -> ResourceGovernor:
+    """
+    Retourne le gouverneur de l'InferenceExecutor global (en mode remote : celui
+    du serveur d'inférence, ou la répartition locale par défaut s'il ne répond pas)
+    """
+    from services.inference_executor import get_inference_executor
+
+    return get_inference_executor().governor
@@ -0,0 +1,268 @@
+"""
+Cache de résultats d'inférence adressé par contenu.
+La clé combine le hash SHA-256 de l'image, l'identifiant du modèle et les
+paramètres d'inférence (requêtes texte, seuils...).
+Deux niveaux : un LRU en mémoire puis un stockage persistant sur disque (JSON).
+"""
+
+import hashlib
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Dict, Optional
+from services.registry import get_registry
+
+# Mémo des hash déjà calculés : (chemin, taille, mtime) -> sha256 (LRU borné :
+# chaque upload ajoute une entrée pour toute la durée de vie du processus)
+HASH_MEMO_SIZE = 4096
+_hash_memo: "OrderedDict[tuple, str]" = OrderedDict()
+_hash_memo_lock = threading.Lock()
+
+
+def _memo_key(file_path: Path) -> tuple:
+    stat = file_path.stat()
+    return (str(file_path.resolve()), stat.st_size, stat.st_mtime_ns)
+
+
+def _memorize(memo_key: tuple, content_hash: str):
+    with _hash_memo_lock:
+        _hash_memo[memo_key] = content_hash
+        _hash_memo.move_to_end(memo_key)
+        while len(_hash_memo) > HASH_MEMO_SIZE:
+            _hash_memo.popitem(last=False)
+
+
+def remember_hash(file_path: Path, content_hash: str):
+    """Mémorise un hash déjà calculé (ex: pendant l'upload) pour éviter une relecture"""
+    _memorize(_memo_key(file_path), content_hash)
+
+
+def hash_file(file_path: Path, chunk_size: int = 1024 * 1024) -> str:
+    """
+    Calcule le hash SHA-256 du contenu d'un fichier (par blocs).
+    Le résultat est mémorisé tant que le fichier n'est pas modifié.
+
+    Args:
+        file_path: Chemin vers le fichier
+        chunk_size: Taille des blocs lus
+
+    Returns:
+        Hash hexadécimal du contenu
+    """
+    memo_key = _memo_key(file_path)
+
+    with _hash_memo_lock:
+        if memo_key in _hash_memo:
+            _hash_memo.move_to_end(memo_key)
+            return _hash_memo[memo_key]
+
+    digest = hashlib.sha256()
+    with file_path.open("rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    content_hash = digest.hexdigest()
+
+    _memorize(memo_key, content_hash)
+    return content_hash
+
+
+class ResultCache:
+    """Cache à deux niveaux (mémoire LRU + disque) pour les résultats d'analyse"""
+
+    def __init__(
+        self,
+        cache_dir: Path,
+        memory_size: int = 256,
+        disk_size: int = 5000,
+        ttl_seconds: Optional[float] = None,
+    ):
+        """
+        Args:
+            cache_dir: Dossier du niveau persistant
+            memory_size: Nombre maximum d'entrées gardées en mémoire
+            disk_size: Nombre maximum d'entrées gardées sur disque
+            ttl_seconds: Durée de vie d'une entrée (None = pas d'expiration)
+        """
+        self.cache_dir = Path(cache_dir)
+        self.cache_dir.mkdir(parents=True, exist_ok=True)
+        self.memory_size = memory_size
+        self.disk_size = disk_size
+        self.ttl_seconds = ttl_seconds
+
+        # Valeurs gardées sérialisées : chaque lecture retourne une copie, qu'un
+        # appelant peut modifier sans altérer le cache
+        self._memory: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._disk_count = sum(1 for _ in self.cache_dir.glob("*/*.json"))
+
+        self.counters = {
+            "memory_hits": 0,
+            "disk_hits": 0,
+            "misses": 0,
+            "sets": 0,
+            "evictions": 0,
+        }
+
+    @staticmethod
+    def make_key(content_hash: str, model_id: str, params: Optional[Dict] = None) -> str:
+        """
+        Construit la clé de cache à partir du contenu, du modèle et des paramètres.
+
+        Args:
+            content_hash: Hash SHA-256 du fichier analysé
+            model_id: Identifiant du modèle (ex: "google/owlvit-base-patch32")
+            params: Paramètres d'inférence influençant le résultat
+
+        Returns:
+            Clé hexadécimale
+        """
+        payload = json.dumps(
+            {"content": content_hash, "model": model_id, "params": params or {}},
+            sort_keys=True,
+            default=str,
+        )
+        return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+    def _disk_path(self, key: str) -> Path:
+        return self.cache_dir / key[:2] / f"{key}.json"
+
+    def _is_expired(self, created_at: float) -> bool:
+        return self.ttl_seconds is not None and time.time() - created_at > self.ttl_seconds
+
+    def get(self, key: str) -> Optional[Any]:
+        """Retourne la valeur en cache ou None (miss ou entrée expirée)"""
+        with self._lock:
+            entry = self._memory.get(key)
+            if entry is not None:
+                created_at, payload = entry
+                if not self._is_expired(created_at):
+                    self._memory.move_to_end(key)
+                    self.counters["memory_hits"] += 1
+                else:
+                    del self._memory[key]
+                    entry = None
+        if entry is not None:
+            return json.loads(payload)
+
+        disk_path = self._disk_path(key)
+        try:
+            entry = json.loads(disk_path.read_text(encoding="utf-8"))
+        except (FileNotFoundError, json.JSONDecodeError):
+            entry = None
+        payload = json.dumps(entry["value"]) if entry is not None else None
+
+        with self._lock:
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+
+            if self._is_expired(entry["created_at"]):
+                self._remove_disk_entry(disk_path)
+                self.counters["misses"] += 1
+                return None
+
+            # Rafraîchir la date d'accès (LRU sur disque) et promouvoir en mémoire
+            try:
+                os.utime(disk_path)
+            except OSError:
+                pass
+            self._store_in_memory(key, entry["created_at"], payload)
+            self.counters["disk_hits"] += 1
+            return entry["value"]
+
+    def set(self, key: str, value: Any):
+        """Enregistre une valeur (sérialisable en JSON) dans les deux niveaux"""
+        created_at = time.time()
+        disk_path = self._disk_path(key)
+        disk_path.parent.mkdir(parents=True, exist_ok=True)
+
+        payload = json.dumps(value, default=float)
+
+        # Écriture atomique pour ne jamais lire un fichier à moitié écrit. Nom
+        # temporaire unique entre processus (workers, serveur d'inférence) et threads
+        tmp_path = disk_path.with_suffix(f".{os.getpid()}.{uuid.uuid4().hex}.tmp")
+        try:
+            tmp_path.write_text(
+                f'{{"created_at": {created_at!r}, "value": {payload}}}', encoding="utf-8"
+            )
+            is_new = not disk_path.exists()
+            os.replace(tmp_path, disk_path)
+        except BaseException:
+            tmp_path.unlink(missing_ok=True)
+            raise
+
+        with self._lock:
+            self._store_in_memory(key, created_at, payload)
+            self.counters["sets"] += 1
+            if is_new:
+                self._disk_count += 1
+            if self._disk_count > self.disk_size:
+                self._evict_disk()
+
+    def _store_in_memory(self, key: str, created_at: float, payload: str):
+        self._memory[key] = (created_at, payload)
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.memory_size:
+            self._memory.popitem(last=False)
+            self.counters["evictions"] += 1
+
+    def _remove_disk_entry(self, disk_path: Path):
+        try:
+            disk_path.unlink()
+            self._disk_count -= 1
+        except FileNotFoundError:
+            pass
+
+    def _evict_disk(self):
+        """Supprime les entrées les moins récemment utilisées (10% de marge)"""
+        entries = sorted(
+            self.cache_dir.glob("*/*.json"), key=lambda p: p.stat().st_mtime
+        )
+        self._disk_count = len(entries)
+        target = int(self.disk_size * 0.9)
+        for disk_path in entries[: max(0, len(entries) - target)]:
+            self._remove_disk_entry(disk_path)
+            self.counters["evictions"] += 1
+
+    def clear(self):
+        """Vide les deux niveaux du cache"""
+        with self._lock:
+            self._memory.clear()
+            for disk_path in self.cache_dir.glob("*/*.json"):
+                self._remove_disk_entry(disk_path)
+            self._disk_count = 0
+
+    def stats(self) -> Dict:
+        """Retourne les compteurs hit/miss et l'occupation du cache"""
+        with self._lock:
+            hits = self.counters["memory_hits"] + self.counters["disk_hits"]
+            lookups = hits + self.counters["misses"]
+            return {
+                **self.counters,
+                "hit_rate": round(hits / lookups, 3) if lookups else 0,
+                "memory_entries": len(self._memory),
+                "disk_entries": self._disk_count,
+                "memory_size": self.memory_size,
+                "disk_size": self.disk_size,
+                "ttl_seconds": self.ttl_seconds,
+            }
+
+
+def _create_result_cache() -> ResultCache:
+    ttl = os.getenv("RESULT_CACHE_TTL_SECONDS")
+    return ResultCache(
+        cache_dir=Path(os.getenv("RESULT_CACHE_DIR", "cache/results")),
+        memory_size=int(os.getenv("RESULT_CACHE_MEMORY_SIZE", "256")),
+        disk_size=int(os.getenv("RESULT_CACHE_DISK_SIZE", "5000")),
+        ttl_seconds=float(ttl) if ttl else None,
+    )
+
+
+# Instance globale
+def get_result_cache() -> ResultCache:
+    """Retourne l'instance singleton du ResultCache (configurée par variables d'environnement)"""
+    return get_registry().get("result_cache", _create_result_cache)
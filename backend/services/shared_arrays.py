@@ -0,0 +1,187 @@
+"""
+Tableaux en mémoire partagée entre le processus principal et les workers.
+En mode INFERENCE_EXECUTOR=process, les photos décodées et les profondeurs
+brutes passent par des segments multiprocessing.shared_memory : seul un petit
+descripteur (nom du segment, forme, dtype) est sérialisé vers l'autre processus,
+quelle que soit la taille de l'image.
+
+Les segments appartiennent au processus principal (SharedArrayStore). Chaque
+tâche qui en utilise un en prend une référence ; un segment libre n'est supprimé
+que lorsque le budget mémoire est dépassé (les plus anciens d'abord), pour que
+les autres modèles réutilisent la même photo sans la décoder à nouveau.
+"""
+
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from multiprocessing import shared_memory
+from typing import Dict, Iterator, List, Optional, Tuple
+import numpy as np
+
+
+def _create(array: np.ndarray) -> Tuple[shared_memory.SharedMemory, Dict]:
+    """Crée un segment contenant une copie de array"""
+    array = np.ascontiguousarray(array)
+    shm = shared_memory.SharedMemory(create=True, size=max(array.nbytes, 1))
+    descriptor = {"name": shm.name, "shape": list(array.shape), "dtype": array.dtype.str}
+    view = np.ndarray(array.shape, dtype=array.dtype, buffer=shm.buf)
+    view[...] = array
+    # Plus aucune vue sur le buffer : le segment peut être fermé
+    del view
+    return shm, descriptor
+
+
+def publish_array(array: np.ndarray, info: Optional[Dict] = None) -> Dict:
+    """
+    Copie un tableau dans un nouveau segment et retourne son descripteur.
+    Côté worker : le processus principal adopte ensuite le segment (SharedArrayStore.adopt).
+
+    Args:
+        array: Tableau à partager
+        info: Métadonnées ajoutées au descripteur (ex: taille de l'image source)
+    """
+    shm, descriptor = _create(array)
+    shm.close()
+    if info:
+        descriptor["info"] = info
+    return descriptor
+
+
+@contextmanager
+def attach(descriptor: Dict) -> Iterator[np.ndarray]:
+    """
+    Vue sans copie sur un segment, valable jusqu'à la sortie du bloc
+    (la vue ni aucun tableau qui la référence ne doivent être gardés ensuite)
+    """
+    shm = shared_memory.SharedMemory(name=descriptor["name"])
+    view = np.ndarray(tuple(descriptor["shape"]), dtype=descriptor["dtype"], buffer=shm.buf)
+    try:
+        yield view
+    finally:
+        del view
+        shm.close()
+
+
+def _unlink(segments: List[shared_memory.SharedMemory]):
+    for shm in segments:
+        shm.close()
+        try:
+            shm.unlink()
+        except FileNotFoundError:
+            pass
+
+
+class SharedArrayStore:
+    """Segments détenus par le processus principal, avec compteur de références"""
+
+    def __init__(self, max_bytes: int = 32 * 1024 * 1024):
+        """
+        Args:
+            max_bytes: Taille totale au-delà de laquelle les segments libres sont
+                supprimés (les segments en cours d'utilisation ne le sont jamais)
+        """
+        self.max_bytes = max_bytes
+        self._segments: "OrderedDict[str, Dict]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0, "published": 0, "adopted": 0, "evicted": 0}
+
+    def acquire(self, key: str) -> Optional[Dict]:
+        """
+        Descripteur du segment `key` avec une référence prise (à rendre avec release),
+        ou None s'il n'existe pas
+        """
+        with self._lock:
+            entry = self._segments.get(key)
+            if entry is None:
+                self.counters["misses"] += 1
+                return None
+            entry["refs"] += 1
+            self._segments.move_to_end(key)
+            self.counters["hits"] += 1
+            return entry["descriptor"]
+
+    def publish(self, key: str, array: np.ndarray, info: Optional[Dict] = None) -> Dict:
+        """
+        Copie array dans un nouveau segment `key` et en prend une référence.
+
+        Args:
+            key: Clé du contenu (ex: hash de la photo)
+            array: Tableau à partager
+            info: Métadonnées ajoutées au descripteur (ex: taille de l'image source)
+        """
+        shm, descriptor = _create(array)
+        if info:
+            descriptor["info"] = info
+        self.counters["published"] += 1
+        return self._insert(key, shm, descriptor, refs=1)
+
+    def adopt(self, key: str, descriptor: Dict) -> Dict:
+        """Prend possession d'un segment créé par un worker (publish_array), sans référence"""
+        shm = shared_memory.SharedMemory(name=descriptor["name"])
+        self.counters["adopted"] += 1
+        return self._insert(key, shm, descriptor, refs=0)
+
+    def release(self, key: str):
+        """Rend une référence prise par acquire ou publish"""
+        with self._lock:
+            entry = self._segments.get(key)
+            if entry is not None:
+                entry["refs"] -= 1
+            evicted = self._evict()
+        _unlink(evicted)
+
+    def _insert(
+        self, key: str, shm: shared_memory.SharedMemory, descriptor: Dict, refs: int
+    ) -> Dict:
+        with self._lock:
+            entry = self._segments.get(key)
+            if entry is None:
+                self._segments[key] = {
+                    "shm": shm,
+                    "descriptor": descriptor,
+                    "refs": refs,
+                    "bytes": shm.size,
+                }
+                discarded = []
+            else:
+                # Même contenu publié entre-temps par une autre tâche
+                entry["refs"] += refs
+                descriptor = entry["descriptor"]
+                discarded = [shm]
+            evicted = self._evict()
+        _unlink(discarded + evicted)
+        return descriptor
+
+    def _evict(self) -> List[shared_memory.SharedMemory]:
+        """Retire les segments libres les plus anciens au-delà du budget (sous verrou)"""
+        total = sum(entry["bytes"] for entry in self._segments.values())
+        evicted = []
+        for key in list(self._segments):
+            if total <= self.max_bytes:
+                break
+            entry = self._segments[key]
+            if entry["refs"] > 0:
+                continue
+            del self._segments[key]
+            total -= entry["bytes"]
+            evicted.append(entry["shm"])
+        self.counters["evicted"] += len(evicted)
+        return evicted
+
+    def stats(self) -> Dict:
+        """Retourne les compteurs et l'occupation des segments"""
+        with self._lock:
+            return {
+                **self.counters,
+                "segments": len(self._segments),
+                "in_use": sum(1 for entry in self._segments.values() if entry["refs"] > 0),
+                "bytes": sum(entry["bytes"] for entry in self._segments.values()),
+                "max_bytes": self.max_bytes,
+            }
+
+    def close(self):
+        """Supprime tous les segments (arrêt de l'application)"""
+        with self._lock:
+            segments = [entry["shm"] for entry in self._segments.values()]
+            self._segments.clear()
+        _unlink(segments)
@@ -0,0 +1,303 @@
+"""
+Image partagée entre les modèles (OWL-ViT, Depth Anything, YOLO).
+Une photo est décodée et convertie en RGB une seule fois, puis réutilisée par
+chaque modèle, avec un cache des tenseurs prétraités par modèle.
+Les JPEG surdimensionnés sont décodés directement à une échelle réduite
+(draft libjpeg) et un garde-fou refuse les images de trop grande résolution.
+En mode process, la première tâche qui a besoin des pixels décode la photo dans
+son worker et la publie en mémoire partagée (services/shared_arrays.py) : les
+tâches suivantes la reçoivent décodée, quel que soit le modèle.
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Any, Callable, Dict, Optional, Tuple
+import numpy as np
+from PIL import Image
+from services.result_cache import hash_file, remember_hash
+from services.registry import get_registry
+from services.shared_arrays import SharedArrayStore, attach, publish_array
+
+
+class ImageTooLarge(ValueError):
+    """L'image dépasse le nombre maximum de pixels autorisé"""
+
+    def __init__(self, pixels: int, max_pixels: int):
+        self.pixels = pixels
+        self.max_pixels = max_pixels
+        super().__init__(
+            f"Image trop grande ({pixels / 1e6:.1f} Mpx, maximum {max_pixels / 1e6:.0f} Mpx)"
+        )
+
+    def __reduce__(self):
+        # Levée dans un worker du pool de processus : renvoyée par pickle
+        return type(self), (self.pixels, self.max_pixels)
+
+
+def segment_key(content_hash: str) -> str:
+    """Clé du segment de mémoire partagée d'une photo décodée"""
+    return f"image:{content_hash}"
+
+
+def check_image_size(image_path: Path, max_pixels: int):
+    """
+    Vérifie la résolution d'une image en ne lisant que son en-tête.
+    Un fichier illisible n'est pas refusé ici : l'erreur remontera à l'analyse.
+
+    Raises:
+        ImageTooLarge: Si largeur x hauteur dépasse max_pixels
+    """
+    try:
+        with Image.open(image_path) as image:
+            width, height = image.size
+    except Exception:
+        return
+    if width * height > max_pixels:
+        raise ImageTooLarge(width * height, max_pixels)
+
+
+class SharedImage:
+    """Image décodée une seule fois, avec ses entrées prétraitées par modèle"""
+
+    def __init__(
+        self,
+        image_path: Optional[Path] = None,
+        max_side: int = 1280,
+        max_pixels: int = 50_000_000,
+        image: Optional[Image.Image] = None,
+        original_size: Optional[Tuple[int, int]] = None,
+    ):
+        """
+        Args:
+            image_path: Image source (décodée à la première utilisation)
+            max_side: Plus grand côté visé au décodage ; au-delà, l'image est
+                décodée à une échelle réduite (sans descendre sous max_side)
+            max_pixels: Nombre maximum de pixels de l'image source
+            image: Image PIL déjà décodée (à la place de image_path)
+            original_size: Taille de l'image source si image a été réduite au décodage
+        """
+        self.path = Path(image_path) if image_path is not None else None
+        self.max_side = max_side
+        self.max_pixels = max_pixels
+        self._rgb = None
+        self._original_size = None
+        if image is not None:
+            self._rgb = image if image.mode == "RGB" else image.convert("RGB")
+            self._original_size = tuple(original_size or image.size)
+        self._tensors: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    @classmethod
+    def from_pil(cls, image: Image.Image) -> "SharedImage":
+        """Enveloppe une image PIL déjà en mémoire (ex: image synthétique de préchauffage)"""
+        return cls(image=image)
+
+    @property
+    def rgb(self) -> Image.Image:
+        """Image RGB décodée (une seule fois, même avec des appels concurrents)"""
+        if self._rgb is None:
+            with self._lock:
+                if self._rgb is None:
+                    self._rgb = self._decode()
+        return self._rgb
+
+    @property
+    def decoded(self) -> bool:
+        """True si les pixels ont déjà été décodés"""
+        return self._rgb is not None
+
+    @property
+    def original_size(self) -> Tuple[int, int]:
+        """Taille (largeur, hauteur) de l'image source"""
+        if self._original_size is None:
+            # En-tête seulement, sans décoder les pixels
+            with Image.open(self.path) as image:
+                self._original_size = image.size
+        return self._original_size
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """Taille (largeur, hauteur) de l'image décodée"""
+        return self.rgb.size
+
+    @property
+    def scale(self) -> Tuple[float, float]:
+        """Facteurs (x, y) pour ramener des coordonnées décodées à l'image source"""
+        (width, height), (decoded_width, decoded_height) = self.original_size, self.size
+        return width / decoded_width, height / decoded_height
+
+    def tensor(self, name: str, compute: Callable[[Image.Image], Any]) -> Any:
+        """
+        Entrée prétraitée d'un modèle, calculée une seule fois par image.
+
+        Args:
+            name: Nom du prétraitement (ex: "owlvit")
+            compute: Fonction image RGB -> entrée du modèle
+        """
+        if name not in self._tensors:
+            value = compute(self.rgb)
+            with self._lock:
+                self._tensors.setdefault(name, value)
+        return self._tensors[name]
+
+    def _decode(self) -> Image.Image:
+        with Image.open(self.path) as image:
+            width, height = image.size
+            self._original_size = (width, height)
+            if width * height > self.max_pixels:
+                raise ImageTooLarge(width * height, self.max_pixels)
+
+            largest = max(width, height)
+            if image.format == "JPEG" and largest > self.max_side:
+                # Décodage DCT à 1/2, 1/4 ou 1/8 : moins de CPU et de mémoire
+                ratio = self.max_side / largest
+                image.draft("RGB", (round(width * ratio), round(height * ratio)))
+
+            image = image.convert("RGB")
+
+        # Autres formats (ou JPEG encore très grand) : réduction par facteur entier
+        factor = max(image.size) // self.max_side
+        if factor >= 2:
+            image = image.reduce(factor)
+        return image
+
+
+class SharedImageCache:
+    """Dernières images décodées (LRU), partagées entre les modèles"""
+
+    def __init__(self, size: int = 4, max_side: int = 1280, max_pixels: int = 50_000_000):
+        """
+        Args:
+            size: Nombre d'images décodées gardées en mémoire
+            max_side: Voir SharedImage
+            max_pixels: Voir SharedImage
+        """
+        self.size = size
+        self.max_side = max_side
+        self.max_pixels = max_pixels
+        self._images: "OrderedDict[str, SharedImage]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.counters = {"hits": 0, "misses": 0}
+
+    def get(self, image_path: Path) -> SharedImage:
+        """
+        Retourne l'image partagée d'un fichier (clé = hash du contenu).
+        Les requêtes concurrentes sur la même photo obtiennent le même objet.
+        """
+        key = hash_file(Path(image_path))
+        with self._lock:
+            shared = self._images.get(key)
+            if shared is not None:
+                self._images.move_to_end(key)
+                self.counters["hits"] += 1
+                return shared
+
+            shared = SharedImage(image_path, self.max_side, self.max_pixels)
+            self.counters["misses"] += 1
+            if self.size > 0:
+                self._images[key] = shared
+                while len(self._images) > self.size:
+                    self._images.popitem(last=False)
+        return shared
+
+    def share(self, image_path: Path, store: SharedArrayStore) -> Tuple[Optional[str], Dict]:
+        """
+        Côté processus principal : descripteur de la photo à passer au worker, sans
+        la décoder. Si un worker l'a déjà publiée, une référence est prise sur son
+        segment (à rendre avec store.release) ; sinon le worker lit le fichier et ne
+        décode la photo que si le cache de résultats ne répond pas (voir publish).
+
+        Returns:
+            (clé du segment, ou None si la photo n'est pas encore partagée, descripteur)
+        """
+        image_path = Path(image_path)
+        content_hash = hash_file(image_path)
+        key = segment_key(content_hash)
+        array = store.acquire(key)
+        descriptor = {"path": str(image_path), "hash": content_hash, "array": array}
+        return (key if array is not None else None), descriptor
+
+    def adopt(self, descriptor: Dict) -> Path:
+        """
+        Côté worker : place la photo reçue par mémoire partagée dans le cache, pour
+        que les modèles la trouvent sans relire ni décoder le fichier.
+
+        Returns:
+            Chemin de la photo (à passer au modèle)
+        """
+        image_path = Path(descriptor["path"])
+        content_hash = descriptor["hash"]
+        remember_hash(image_path, content_hash)
+
+        with self._lock:
+            if content_hash in self._images:
+                self._images.move_to_end(content_hash)
+                return image_path
+
+        array = descriptor["array"]
+        if array is None:
+            # Pas encore partagée : décodée depuis le fichier si le modèle en a besoin
+            return image_path
+        with attach(array) as pixels:
+            # Seule copie de la photo dans le worker (le segment est fermé aussitôt)
+            image = Image.fromarray(pixels)
+        shared = SharedImage(
+            image_path,
+            self.max_side,
+            self.max_pixels,
+            image=image,
+            original_size=array["info"]["original_size"],
+        )
+
+        with self._lock:
+            if self.size > 0:
+                self._images[content_hash] = shared
+                while len(self._images) > self.size:
+                    self._images.popitem(last=False)
+        return image_path
+
+    def publish(self, descriptor: Dict) -> Optional[Dict]:
+        """
+        Côté worker, après la tâche : copie en mémoire partagée une photo reçue sans
+        segment si la tâche l'a décodée (pas pour un résultat servi par le cache),
+        pour que le processus principal l'adopte et la passe aux tâches suivantes.
+
+        Returns:
+            Descripteur du nouveau segment, ou None si la photo n'a pas été décodée
+        """
+        if descriptor["array"] is not None:
+            return None
+        with self._lock:
+            shared = self._images.get(descriptor["hash"])
+        if shared is None or not shared.decoded:
+            return None
+        return publish_array(
+            np.asarray(shared.rgb), info={"original_size": list(shared.original_size)}
+        )
+
+    def stats(self) -> Dict:
+        """Retourne les compteurs et la configuration du cache d'images"""
+        with self._lock:
+            return {
+                **self.counters,
+                "entries": len(self._images),
+                "size": self.size,
+                "max_side": self.max_side,
+                "max_pixels": self.max_pixels,
+            }
+
+
+def _create_shared_image_cache() -> SharedImageCache:
+    return SharedImageCache(
+        size=int(os.getenv("IMAGE_CACHE_SIZE", "4")),
+        max_side=int(os.getenv("IMAGE_DECODE_MAX_SIDE", "1280")),
+        max_pixels=int(os.getenv("IMAGE_MAX_PIXELS", "50000000")),
+    )
+
+
+# Instance globale
+def get_shared_image_cache() -> SharedImageCache:
+    """Retourne l'instance singleton du SharedImageCache (configurée par variables d'environnement)"""
+    return get_registry().get("shared_image_cache", _create_shared_image_cache)
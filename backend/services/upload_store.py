@@ -0,0 +1,105 @@
+"""
+Stockage des uploads adressé par contenu.
+Le fichier est écrit par blocs pendant que son SHA-256 est calculé, la taille
+maximum est vérifiée au fil de l'eau, et des octets identiques sont stockés
+une seule fois (nom de fichier = hash du contenu et extension normalisée).
+Le fichier en cours de réception est écrit hors du dossier servi (/files), dans
+un dossier voisin sur le même système de fichiers : le renommage final est atomique.
+"""
+
+import hashlib
+import os
+import uuid
+from pathlib import Path
+from typing import Dict
+from fastapi import UploadFile
+from services.result_cache import remember_hash
+
+CHUNK_SIZE = 1024 * 1024
+
+# Variantes d'une même extension : un même contenu n'est stocké qu'une fois
+EXTENSION_ALIASES = {".jpeg": ".jpg", ".jpe": ".jpg", ".tif": ".tiff"}
+
+
+class UploadTooLarge(Exception):
+    """Le fichier uploadé dépasse la taille maximum autorisée"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        super().__init__(
+            f"Fichier trop volumineux (maximum {max_bytes // (1024 * 1024)} Mo)"
+        )
+
+
+def staging_dir(upload_dir: Path) -> Path:
+    """Dossier des uploads en cours de réception, voisin de upload_dir (non servi)"""
+    return upload_dir.parent / f".{upload_dir.name}-staging"
+
+
+def normalize_extension(filename: str) -> str:
+    """Extension en minuscules, variantes ramenées à une seule forme (.jpeg -> .jpg)"""
+    extension = Path(filename).suffix.lower()
+    return EXTENSION_ALIASES.get(extension, extension)
+
+
+async def store_upload(
+    file: UploadFile, upload_dir: Path, max_bytes: int, prefix: str = ""
+) -> Dict:
+    """
+    Enregistre un upload sous le nom <prefix><sha256><extension normalisée>.
+
+    Args:
+        file: Fichier reçu par FastAPI
+        upload_dir: Dossier de stockage
+        max_bytes: Taille maximum autorisée
+        prefix: Préfixe du nom de fichier (ex: "contract_")
+
+    Returns:
+        dict contenant filename, path, sha256, size et deduplicated
+        (True si un fichier identique était déjà stocké)
+
+    Raises:
+        UploadTooLarge: Si le fichier dépasse max_bytes (rien n'est conservé)
+    """
+    digest = hashlib.sha256()
+    size = 0
+    staging = staging_dir(upload_dir)
+    staging.mkdir(parents=True, exist_ok=True)
+    tmp_path = staging / f"{uuid.uuid4()}.tmp"
+
+    try:
+        with tmp_path.open("wb") as buffer:
+            while True:
+                chunk = await file.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLarge(max_bytes)
+                digest.update(chunk)
+                buffer.write(chunk)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+
+    content_hash = digest.hexdigest()
+    file_extension = normalize_extension(file.filename or "")
+    filename = f"{prefix}{content_hash}{file_extension}"
+    file_path = upload_dir / filename
+
+    # Contenu déjà stocké : on garde l'objet existant
+    deduplicated = file_path.exists()
+    if deduplicated:
+        tmp_path.unlink()
+    else:
+        os.replace(tmp_path, file_path)
+
+    remember_hash(file_path, content_hash)
+
+    return {
+        "filename": filename,
+        "path": file_path,
+        "sha256": content_hash,
+        "size": size,
+        "deduplicated": deduplicated,
+    }
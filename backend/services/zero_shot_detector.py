@@ -1,228 +1,434 @@
-"""
-Service de Zero-Shot Object Detection utilisant OWL-ViT de Hugging Face.
-Permet de détecter des objets spécifiques via des requêtes textuelles (ex: "bumper").
-"""
-
-from pathlib import Path
-from PIL import Image
-import torch
-import cv2
-import numpy as np
-from transformers import OwlViTProcessor, OwlViTForObjectDetection
-
-
-class ZeroShotDetector:
-    def __init__(self):
-        """
-        Initialise le modèle OWL-ViT.
-        Utilise google/owlvit-base-patch32.
-        """
-        print("🔧 Initialisation du modèle OWL-ViT (Zero-Shot)...")
-
-        self.device = "cuda" if torch.cuda.is_available() else "cpu"
-        print(f"✓ Utilisation du device: {self.device}")
-
-        try:
-            self.processor = OwlViTProcessor.from_pretrained(
-                "google/owlvit-base-patch32"
-            )
-            self.model = OwlViTForObjectDetection.from_pretrained(
-                "google/owlvit-base-patch32"
-            ).to(self.device)
-            self.model.eval()
-            print("✅ Modèle OWL-ViT chargé avec succès")
-        except Exception as e:
-            print(f"❌ Erreur lors du chargement de OWL-ViT: {e}")
-            raise e
-
-    def detect_parts(self, image_path: Path, text_queries: list = None) -> dict:
-        """
-        Détecte des pièces spécifiques dans une image.
-
-        Args:
-            image_path: Chemin vers l'image source
-            text_queries: Liste des textes à chercher (ex: ["bumper", "door"])
-
-        Returns:
-            dict contenant l'image annotée et les détections
-        """
-        if text_queries is None:
-            # Requêtes simplifiées (sans "car") pour meilleure détection
-            text_queries = [
-                "bumper",
-                "door",
-                "window",
-                "wheel",
-                "headlight",
-                "hood",
-                "trunk",
-                "mirror",
-                "windshield",
-                "tire",
-                "roof",
-                "fender",
-            ]
-
-        # Charger l'image
-        image = Image.open(image_path).convert("RGB")
-        target_sizes = torch.Tensor([image.size[::-1]])
-
-        # Préparer les inputs
-        inputs = self.processor(
-            text=text_queries, images=image, return_tensors="pt"
-        ).to(self.device)
-
-        # Inférence
-        with torch.no_grad():
-            outputs = self.model(**inputs)
-
-        # Post-processing pour obtenir les bounding boxes
-        # Threshold augmenté pour réduire les fausses détections
-        results = self.processor.post_process_object_detection(
-            outputs=outputs, target_sizes=target_sizes.to(self.device), threshold=0.15
-        )[0]
-
-        # Préparer l'image pour annotation (OpenCV utilise BGR)
-        image_cv = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-
-        detections = []
-
-        for i, (box, score, label) in enumerate(
-            zip(results["boxes"], results["scores"], results["labels"])
-        ):
-            box = [round(i, 2) for i in box.tolist()]
-            score = round(score.item(), 3)
-            label_text = text_queries[label]
-
-            # Filtrer les scores faibles (augmenté de 0.05 à 0.1)
-            if score < 0.1:
-                continue
-
-            x1, y1, x2, y2 = map(int, box)
-
-            # Dessiner la bounding box
-            # Couleur différente pour chaque classe (hash du label)
-            color_seed = hash(label_text) % 255
-            color = (color_seed, (color_seed * 2) % 255, (color_seed * 3) % 255)
-
-            cv2.rectangle(image_cv, (x1, y1), (x2, y2), color, 2)
-
-            # Ajouter le label
-            label_display = f"{label_text} {score:.2f}"
-            (w, h), _ = cv2.getTextSize(label_display, cv2.FONT_HERSHEY_SIMPLEX, 0.5, 1)
-            cv2.rectangle(image_cv, (x1, y1 - 20), (x1 + w, y1), color, -1)
-            cv2.putText(
-                image_cv,
-                label_display,
-                (x1, y1 - 5),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                0.5,
-                (255, 255, 255),
-                1,
-            )
-
-            detections.append(
-                {
-                    "class": label_text,
-                    "confidence": score,
-                    "bbox": {"x1": x1, "y1": y1, "x2": x2, "y2": y2},
-                }
-            )
-
-        # Appliquer NMS pour éliminer les détections qui se chevauchent
-        detections = self._apply_nms(detections, iou_threshold=0.5)
-
-        # Sauvegarder l'image annotée
-        output_filename = f"parts_{image_path.name}"
-        output_path = image_path.parent / output_filename
-        cv2.imwrite(str(output_path), image_cv)
-
-        # Statistiques
-        stats = {
-            "total_objects": len(detections),
-            "classes_detected": list(set([d["class"] for d in detections])),
-            "avg_confidence": np.mean([d["confidence"] for d in detections])
-            if detections
-            else 0,
-        }
-
-        return {
-            "annotated_image_path": str(output_path),
-            "annotated_image_filename": output_filename,
-            "detections": detections,
-            "stats": stats,
-        }
-
-    def _apply_nms(self, detections: list, iou_threshold: float = 0.5) -> list:
-        """
-        Applique Non-Maximum Suppression pour éliminer les détections qui se chevauchent
-
-        Args:
-            detections: Liste des détections
-            iou_threshold: Seuil IoU pour considérer deux boxes comme chevauchantes
-
-        Returns:
-            Liste filtrée des détections
-        """
-        if len(detections) == 0:
-            return detections
-
-        # Trier par confiance décroissante
-        detections = sorted(detections, key=lambda x: x["confidence"], reverse=True)
-
-        filtered_detections = []
-
-        while detections:
-            # Prendre la détection avec la plus haute confiance
-            best = detections.pop(0)
-            filtered_detections.append(best)
-
-            # Filtrer les détections qui se chevauchent trop avec celle-ci
-            detections = [
-                det
-                for det in detections
-                if self._calculate_iou(best["bbox"], det["bbox"]) < iou_threshold
-            ]
-
-        return filtered_detections
-
-    def _calculate_iou(self, box1: dict, box2: dict) -> float:
-        """
-        Calcule l'Intersection over Union (IoU) entre deux bounding boxes
-
-        Args:
-            box1, box2: Dictionnaires avec x1, y1, x2, y2
-
-        Returns:
-            IoU score entre 0 et 1
-        """
-        # Coordonnées de l'intersection
-        x1 = max(box1["x1"], box2["x1"])
-        y1 = max(box1["y1"], box2["y1"])
-        x2 = min(box1["x2"], box2["x2"])
-        y2 = min(box1["y2"], box2["y2"])
-
-        # Aire de l'intersection
-        intersection = max(0, x2 - x1) * max(0, y2 - y1)
-
-        # Aires des deux boxes
-        area1 = (box1["x2"] - box1["x1"]) * (box1["y2"] - box1["y1"])
-        area2 = (box2["x2"] - box2["x1"]) * (box2["y2"] - box2["y1"])
-
-        # Union
-        union = area1 + area2 - intersection
-
-        # IoU
-        return intersection / union if union > 0 else 0
-
-
-# Instance globale
-_zero_shot_detector = None
-
-
-def get_zero_shot_detector() -> ZeroShotDetector:
-    """Retourne l'instance singleton du ZeroShotDetector"""
-    global _zero_shot_detector
-    if _zero_shot_detector is None:
-        _zero_shot_detector = ZeroShotDetector()
-    return _zero_shot_detector
+"""
+Service de Zero-Shot Object Detection utilisant OWL-ViT de Hugging Face.
+Permet de détecter des objets spécifiques via des requêtes textuelles (ex: "bumper").
+"""
+
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from PIL import Image
+import torch
+import numpy as np
+from transformers import OwlViTProcessor, OwlViTForObjectDetection
+from transformers.models.owlvit.modeling_owlvit import OwlViTObjectDetectionOutput
+from services.result_cache import get_result_cache, hash_file
+from services.batch_scheduler import MicroBatchScheduler
+from services.registry import get_registry
+from services.box_ops import nms
+from services.shared_image import SharedImage, get_shared_image_cache
+from services.resource_governor import apply_thread_budget, get_resource_governor
+from services.onnx_backend import (
+    OWLVIT_IMAGE_GRAPH,
+    OWLVIT_TEXT_GRAPH,
+    OnnxOwlViT,
+    get_inference_backend,
+    onnx_model_path,
+)
+
+
+def owlvit_heads(model, pixel_values: torch.Tensor, text_embeds: torch.Tensor):
+    """
+    Tour vision + têtes de classes et de boxes d'OWL-ViT, avec des embeddings
+    texte déjà calculés (partagé par l'inférence PyTorch et l'export ONNX).
+
+    Returns:
+        Tuple (logits [batch, patches, requêtes], boxes normalisées [batch, patches, 4])
+    """
+    feature_map = model.image_embedder(pixel_values=pixel_values)[0]
+    batch_size, height, width, hidden_dim = feature_map.shape
+    image_feats = feature_map.reshape(batch_size, height * width, hidden_dim)
+
+    query_embeds = text_embeds.unsqueeze(0).expand(batch_size, -1, -1)
+    query_mask = torch.ones(
+        query_embeds.shape[:2], dtype=torch.bool, device=query_embeds.device
+    )
+    logits, _ = model.class_predictor(image_feats, query_embeds, query_mask)
+    pred_boxes = model.box_predictor(image_feats, feature_map)
+    return logits, pred_boxes
+
+
+def owlvit_text_embeds(model, input_ids: torch.Tensor, attention_mask: torch.Tensor):
+    """Embeddings texte normalisés d'OWL-ViT [nombre de requêtes, dimension]"""
+    text_embeds = model.owlvit.get_text_features(
+        input_ids=input_ids, attention_mask=attention_mask
+    )
+    if not isinstance(text_embeds, torch.Tensor):
+        # transformers >= 5 retourne un ModelOutput
+        text_embeds = text_embeds.pooler_output
+    # Même normalisation que OwlViTModel.forward
+    return text_embeds / torch.linalg.norm(text_embeds, ord=2, dim=-1, keepdim=True)
+
+
+class ZeroShotDetector:
+    MODEL_ID = "google/owlvit-base-patch32"
+    # Threshold augmenté pour réduire les fausses détections
+    DETECTION_THRESHOLD = 0.15
+    # Filtrer les scores faibles (augmenté de 0.05 à 0.1)
+    MIN_SCORE = 0.1
+    NMS_IOU_THRESHOLD = 0.5
+    # Requêtes simplifiées (sans "car") pour meilleure détection
+    DEFAULT_QUERIES = (
+        "bumper",
+        "door",
+        "window",
+        "wheel",
+        "headlight",
+        "hood",
+        "trunk",
+        "mirror",
+        "windshield",
+        "tire",
+        "roof",
+        "fender",
+    )
+
+    def __init__(self, backend: str = None):
+        """
+        Initialise le modèle OWL-ViT.
+        Utilise google/owlvit-base-patch32.
+
+        Args:
+            backend: "torch" ou "onnx" (défaut: variable INFERENCE_BACKEND)
+        """
+        print("🔧 Initialisation du modèle OWL-ViT (Zero-Shot)...")
+
+        self.backend = backend or get_inference_backend()
+        # Variante du modèle (fait partie de la clé de cache) : fp32 ou int8 en ONNX
+        self.model_variant = (
+            onnx_model_path(OWLVIT_IMAGE_GRAPH).name
+            if self.backend == "onnx"
+            else self.backend
+        )
+        self.device = (
+            "cuda" if torch.cuda.is_available() and self.backend == "torch" else "cpu"
+        )
+        print(f"✓ Utilisation du device: {self.device} (backend {self.backend})")
+
+        try:
+            self.processor = OwlViTProcessor.from_pretrained(self.MODEL_ID)
+            self.model = None
+            self.onnx = None
+            if self.backend == "onnx":
+                self.onnx = OnnxOwlViT(
+                    onnx_model_path(OWLVIT_IMAGE_GRAPH),
+                    onnx_model_path(OWLVIT_TEXT_GRAPH),
+                    threads=get_resource_governor().threads("zero_shot"),
+                )
+            else:
+                self.model = OwlViTForObjectDetection.from_pretrained(self.MODEL_ID).to(
+                    self.device
+                )
+                self.model.eval()
+            print("✅ Modèle OWL-ViT chargé avec succès")
+        except Exception as e:
+            print(f"❌ Erreur lors du chargement de OWL-ViT: {e}")
+            raise e
+
+        # Cache LRU des embeddings texte (clé = tuple de requêtes)
+        self.text_cache_size = int(os.getenv("ZERO_SHOT_TEXT_CACHE_SIZE", "32"))
+        self._text_embeds = OrderedDict()
+        self._text_embeds_lock = threading.Lock()
+        self._get_text_embeds(self.DEFAULT_QUERIES)
+        print("✓ Embeddings des requêtes par défaut précalculés")
+
+        # Micro-batching des requêtes concurrentes (désactivé si taille de lot = 1)
+        max_batch_size = int(os.getenv("ZERO_SHOT_BATCH_SIZE", "4"))
+        self.scheduler = None
+        if max_batch_size > 1:
+            self.scheduler = MicroBatchScheduler(
+                self._process_batch,
+                max_batch_size=max_batch_size,
+                max_wait_ms=float(os.getenv("ZERO_SHOT_BATCH_WAIT_MS", "10")),
+                name="owlvit-batch",
+                initializer=lambda: apply_thread_budget(
+                    get_resource_governor().threads("zero_shot")
+                ),
+            )
+            print(f"✓ Micro-batching OWL-ViT actif ({self.scheduler.stats()})")
+
+        # NMS agnostique (toutes pièces confondues) ou par classe
+        self.nms_class_agnostic = (
+            os.getenv("ZERO_SHOT_NMS_MODE", "agnostic").lower() != "per_class"
+        )
+
+    def warmup(self):
+        """Exécute une inférence sur une image synthétique (requêtes par défaut)"""
+        self._detect_batch(
+            [SharedImage.from_pil(Image.new("RGB", (640, 480)))],
+            list(self.DEFAULT_QUERIES),
+        )
+        print("🔥 Modèle OWL-ViT préchauffé")
+
+    def detect_parts(self, image_path: Path, text_queries: list = None) -> dict:
+        """
+        Détecte des pièces spécifiques dans une image.
+
+        Args:
+            image_path: Chemin vers l'image source
+            text_queries: Liste des textes à chercher (ex: ["bumper", "door"])
+
+        Returns:
+            dict contenant les détections et leurs statistiques
+        """
+        return self.detect_parts_batch([image_path], text_queries)[0]
+
+    def detect_parts_batch(self, image_paths: list, text_queries: list = None) -> list:
+        """
+        Détecte des pièces dans plusieurs images.
+        Les images absentes du cache passent ensemble dans un seul forward.
+
+        Args:
+            image_paths: Chemins vers les images sources
+            text_queries: Liste des textes à chercher (communs à toutes les images)
+
+        Returns:
+            Liste de dicts (détections et statistiques), dans l'ordre des chemins
+        """
+        if text_queries is None:
+            text_queries = self.DEFAULT_QUERIES
+        text_queries = tuple(text_queries)
+
+        # Résultats déjà calculés pour ces contenus et ces requêtes ?
+        cache = get_result_cache()
+        results = [None] * len(image_paths)
+        cache_keys = {}
+        for index, image_path in enumerate(image_paths):
+            cache_key = cache.make_key(
+                hash_file(image_path),
+                self.MODEL_ID,
+                {
+                    "text_queries": list(text_queries),
+                    "threshold": self.DETECTION_THRESHOLD,
+                    "min_score": self.MIN_SCORE,
+                    "nms_iou": self.NMS_IOU_THRESHOLD,
+                    "nms_class_agnostic": self.nms_class_agnostic,
+                    "backend": self.model_variant,
+                },
+            )
+            cached = cache.get(cache_key)
+            if cached is not None:
+                results[index] = cached
+            else:
+                cache_keys[index] = cache_key
+
+        if not cache_keys:
+            return results
+
+        # Images décodées une seule fois, partagées avec les autres modèles
+        missing = list(cache_keys)
+        image_cache = get_shared_image_cache()
+        images = [image_cache.get(image_paths[i]) for i in missing]
+
+        # Inférence (une image seule est regroupée avec les requêtes concurrentes
+        # si le batching est actif)
+        if len(images) == 1 and self.scheduler is not None:
+            batch_detections = [self.scheduler.run((images[0], text_queries))]
+        else:
+            batch_detections = self._detect_batch(images, list(text_queries))
+
+        for index, detections in zip(missing, batch_detections):
+            results[index] = self._build_result(detections)
+            cache.set(cache_keys[index], results[index])
+
+        return results
+
+    def _build_result(self, detections: list) -> dict:
+        """Assemble le résultat d'une détection (l'annotation est rendue à la demande)"""
+        # Statistiques
+        stats = {
+            "total_objects": len(detections),
+            "classes_detected": list(set([d["class"] for d in detections])),
+            "avg_confidence": np.mean([d["confidence"] for d in detections])
+            if detections
+            else 0,
+        }
+
+        return {
+            "detections": detections,
+            "stats": stats,
+        }
+
+    def _process_batch(self, items: list) -> list:
+        """
+        Traite un lot du MicroBatchScheduler.
+        Les images partageant les mêmes requêtes texte passent dans un seul forward.
+
+        Args:
+            items: Liste de tuples (SharedImage, requêtes texte)
+
+        Returns:
+            Liste des détections de chaque image, dans l'ordre des items
+        """
+        groups = {}
+        for index, (image, text_queries) in enumerate(items):
+            groups.setdefault(text_queries, []).append(index)
+
+        results = [None] * len(items)
+        for text_queries, indices in groups.items():
+            images = [items[i][0] for i in indices]
+            for index, detections in zip(
+                indices, self._detect_batch(images, list(text_queries))
+            ):
+                results[index] = detections
+        return results
+
+    def _detect_batch(self, images: list, text_queries: list) -> list:
+        """
+        Exécute OWL-ViT sur plusieurs images en un seul forward.
+
+        Args:
+            images: Liste de SharedImage
+            text_queries: Requêtes texte communes à toutes les images
+
+        Returns:
+            Liste des détections (après filtrage et NMS) pour chaque image,
+            en coordonnées de l'image source
+        """
+        # Boxes normalisées ramenées à la taille source (même si décodée réduite)
+        target_sizes = torch.Tensor([image.original_size[::-1] for image in images])
+
+        # Préparer les images (pixel_values gardés avec l'image partagée, le texte
+        # est déjà encodé et mis en cache)
+        pixel_values = torch.cat(
+            [image.tensor("owlvit", self._preprocess) for image in images]
+        ).to(self.device)
+        text_embeds = self._get_text_embeds(tuple(text_queries))
+
+        # Inférence : tour vision + têtes de classes et de boxes uniquement
+        if self.onnx is not None:
+            logits, pred_boxes = (
+                torch.from_numpy(output)
+                for output in self.onnx.predict(
+                    pixel_values.numpy(), text_embeds.numpy()
+                )
+            )
+        else:
+            with torch.no_grad():
+                logits, pred_boxes = owlvit_heads(self.model, pixel_values, text_embeds)
+
+        outputs = OwlViTObjectDetectionOutput(logits=logits, pred_boxes=pred_boxes)
+
+        # Post-processing pour obtenir les bounding boxes de chaque image
+        batch_results = self.processor.post_process_object_detection(
+            outputs=outputs,
+            target_sizes=target_sizes.to(self.device),
+            threshold=self.DETECTION_THRESHOLD,
+        )
+
+        all_detections = []
+        for results in batch_results:
+            detections = []
+
+            for box, score, label in zip(
+                results["boxes"], results["scores"], results["labels"]
+            ):
+                box = [round(i, 2) for i in box.tolist()]
+                score = round(score.item(), 3)
+
+                # Filtrer les scores faibles
+                if score < self.MIN_SCORE:
+                    continue
+
+                x1, y1, x2, y2 = map(int, box)
+                detections.append(
+                    {
+                        "class": text_queries[label],
+                        "confidence": score,
+                        "bbox": {"x1": x1, "y1": y1, "x2": x2, "y2": y2},
+                    }
+                )
+
+            # Appliquer NMS pour éliminer les détections qui se chevauchent
+            all_detections.append(
+                self._apply_nms(
+                    detections,
+                    iou_threshold=self.NMS_IOU_THRESHOLD,
+                    class_agnostic=self.nms_class_agnostic,
+                )
+            )
+
+        return all_detections
+
+    def _preprocess(self, image: Image.Image) -> torch.Tensor:
+        """pixel_values OWL-ViT d'une image RGB"""
+        return self.processor(images=image, return_tensors="pt")["pixel_values"]
+
+    def _get_text_embeds(self, text_queries: tuple) -> torch.Tensor:
+        """
+        Retourne les embeddings texte d'un jeu de requêtes (calculés une seule fois).
+
+        Args:
+            text_queries: Tuple de requêtes texte
+
+        Returns:
+            Tensor [nombre de requêtes, dimension] sur le device du modèle
+        """
+        with self._text_embeds_lock:
+            if text_queries in self._text_embeds:
+                self._text_embeds.move_to_end(text_queries)
+                return self._text_embeds[text_queries]
+
+        inputs = self.processor(text=list(text_queries), return_tensors="pt").to(
+            self.device
+        )
+        if self.onnx is not None:
+            text_embeds = torch.from_numpy(
+                self.onnx.text_embeds(
+                    inputs["input_ids"].numpy(), inputs["attention_mask"].numpy()
+                )
+            )
+        else:
+            with torch.no_grad():
+                text_embeds = owlvit_text_embeds(
+                    self.model, inputs["input_ids"], inputs["attention_mask"]
+                )
+
+        with self._text_embeds_lock:
+            self._text_embeds[text_queries] = text_embeds
+            while len(self._text_embeds) > self.text_cache_size:
+                self._text_embeds.popitem(last=False)
+        return text_embeds
+
+    def _apply_nms(
+        self, detections: list, iou_threshold: float = 0.5, class_agnostic: bool = True
+    ) -> list:
+        """
+        Applique Non-Maximum Suppression pour éliminer les détections qui se chevauchent
+
+        Args:
+            detections: Liste des détections
+            iou_threshold: Seuil IoU pour considérer deux boxes comme chevauchantes
+            class_agnostic: Si False, seules les détections d'une même pièce
+                peuvent se supprimer entre elles
+
+        Returns:
+            Liste filtrée des détections, par confiance décroissante
+        """
+        if len(detections) == 0:
+            return detections
+
+        boxes = np.array(
+            [
+                [d["bbox"]["x1"], d["bbox"]["y1"], d["bbox"]["x2"], d["bbox"]["y2"]]
+                for d in detections
+            ],
+            dtype=np.float64,
+        )
+        scores = np.array([d["confidence"] for d in detections], dtype=np.float64)
+
+        classes = None
+        if not class_agnostic:
+            class_ids = {}
+            classes = np.array(
+                [class_ids.setdefault(d["class"], len(class_ids)) for d in detections]
+            )
+
+        keep = nms(boxes, scores, iou_threshold=iou_threshold, classes=classes)
+        return [detections[i] for i in keep]
+
+
+# Instance globale
+def get_zero_shot_detector() -> ZeroShotDetector:
+    """Retourne l'instance singleton du ZeroShotDetector"""
+    return get_registry().get("zero_shot_detector", ZeroShotDetector)
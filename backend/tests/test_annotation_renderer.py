@@ -0,0 +1,39 @@
+"""
+Rendu des annotations sur une photo portant une orientation EXIF
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+from PIL import Image
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.annotation_renderer import AnnotationRenderer  # noqa: E402
+
+
+def test_render_ignores_exif_orientation(tmp_path):
+    # Paysage 400x200 marqué "rotation 90°" (orientation 6), comme une photo de téléphone
+    image_path = tmp_path / "portrait.jpg"
+    exif = Image.Exif()
+    exif[0x0112] = 6
+    Image.new("RGB", (400, 200), (255, 255, 255)).save(image_path, "JPEG", exif=exif)
+
+    with Image.open(image_path) as image:
+        pil_size = image.size
+    detection = {
+        "class": "door",
+        "confidence": 0.9,
+        "bbox": {"x1": 300, "y1": 40, "x2": 380, "y2": 160},
+    }
+
+    renderer = AnnotationRenderer(tmp_path / "renders")
+    output = renderer.render(image_path, [detection], fmt="png")
+    rendered = np.asarray(Image.open(output).convert("RGB"))
+
+    # Même repère que l'image vue par les modèles
+    assert (rendered.shape[1], rendered.shape[0]) == pil_size
+    # Le cadre est dessiné à l'emplacement de la box
+    assert rendered[100, 380].tolist() != [255, 255, 255]
+    assert rendered[100, 200].tolist() == [255, 255, 255]
@@ -0,0 +1,161 @@
+"""
+Opérations NumPy sur les bounding boxes, comparées à un calcul direct
+"""
+
+import sys
+from pathlib import Path
+
+import numpy as np
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services import box_ops  # noqa: E402
+from services.box_ops import box_region_stats, nms  # noqa: E402
+
+
+def reference_nms(boxes, scores, iou_threshold, classes=None):
+    """NMS glouton d'origine : boucle Python, IoU paire par paire"""
+
+    def iou(a, b):
+        inter_w = max(0, min(a[2], b[2]) - max(a[0], b[0]))
+        inter_h = max(0, min(a[3], b[3]) - max(a[1], b[1]))
+        intersection = inter_w * inter_h
+        union = (a[2] - a[0]) * (a[3] - a[1]) + (b[2] - b[0]) * (b[3] - b[1]) - intersection
+        return intersection / union if union > 0 else 0
+
+    order = sorted(range(len(boxes)), key=lambda i: -scores[i])
+    keep = []
+    while order:
+        best = order.pop(0)
+        keep.append(best)
+        order = [
+            i
+            for i in order
+            if (classes is not None and classes[i] != classes[best])
+            or iou(boxes[best], boxes[i]) < iou_threshold
+        ]
+    return keep
+
+
+# Trois pièces qui se recouvrent deux à deux, une box isolée et une box dégénérée
+BOXES = [
+    [10, 10, 110, 110],
+    [20, 20, 120, 120],
+    [15, 5, 105, 115],
+    [300, 300, 360, 380],
+    [305, 310, 355, 370],
+    [50, 50, 50, 90],
+]
+SCORES = [0.9, 0.8, 0.95, 0.4, 0.7, 0.6]
+CLASSES = [0, 1, 0, 2, 2, 1]
+
+
+def test_nms_empty():
+    assert nms(np.empty((0, 4)), np.empty(0)).tolist() == []
+    assert nms(np.empty((0, 4)), np.empty(0), classes=np.empty(0)).tolist() == []
+
+
+def test_nms_class_agnostic_matches_reference():
+    for threshold in (0.1, 0.5, 0.9):
+        expected = reference_nms(BOXES, SCORES, threshold)
+        assert nms(np.array(BOXES), np.array(SCORES), threshold).tolist() == expected
+
+
+def test_nms_per_class_matches_reference():
+    for threshold in (0.1, 0.5, 0.9):
+        expected = reference_nms(BOXES, SCORES, threshold, classes=CLASSES)
+        actual = nms(np.array(BOXES), np.array(SCORES), threshold, classes=np.array(CLASSES))
+        assert actual.tolist() == expected
+
+
+def test_nms_per_class_keeps_overlapping_boxes_of_other_classes():
+    boxes = np.array([[0, 0, 10, 10], [0, 0, 10, 10]])
+    scores = np.array([0.9, 0.8])
+    assert nms(boxes, scores, 0.5).tolist() == [0]
+    assert nms(boxes, scores, 0.5, classes=np.array([0, 1])).tolist() == [0, 1]
+
+
+def test_nms_random_boxes_match_reference():
+    rng = np.random.default_rng(0)
+    corners = rng.uniform(0, 200, size=(60, 2))
+    sizes = rng.uniform(5, 80, size=(60, 2))
+    boxes = np.hstack([corners, corners + sizes]).round(1)
+    scores = rng.uniform(0, 1, size=60).round(3)
+    classes = rng.integers(0, 4, size=60)
+
+    assert nms(boxes, scores, 0.5).tolist() == reference_nms(boxes.tolist(), scores, 0.5)
+    assert nms(boxes, scores, 0.5, classes=classes).tolist() == reference_nms(
+        boxes.tolist(), scores, 0.5, classes=classes.tolist()
+    )
+
+
+def reference_region_stats(values, boxes):
+    """Lecture directe de chaque zone, coordonnées arrondies vers l'extérieur et bornées"""
+    height, width = values.shape
+    stats = []
+    for x1, y1, x2, y2 in boxes:
+        x1, x2 = min(max(int(np.floor(x1)), 0), width), min(max(int(np.ceil(x2)), 0), width)
+        y1, y2 = min(max(int(np.floor(y1)), 0), height), min(max(int(np.ceil(y2)), 0), height)
+        region = values[y1:y2, x1:x2]
+        if region.size == 0:
+            stats.append(None)
+            continue
+        stats.append(
+            {
+                "mean": float(region.mean()),
+                "std": float(region.std()),
+                "min": float(region.min()),
+                "max": float(region.max()),
+                "pixels": int(region.size),
+            }
+        )
+    return stats
+
+
+DEPTH = np.random.default_rng(1).uniform(0.5, 10.0, size=(40, 60))
+REGION_BOXES = np.array(
+    [
+        [0, 0, 60, 40],  # carte entière
+        [5, 5, 25, 15],
+        [10.4, 3.6, 20.2, 9.1],  # coordonnées non entières
+        [-10, -5, 8, 6],  # débordement en haut à gauche
+        [50, 30, 90, 70],  # débordement en bas à droite
+        [30, 20, 30, 35],  # largeur nulle
+        [100, 100, 120, 120],  # hors de la carte
+    ]
+)
+
+
+def assert_stats_close(actual, expected):
+    assert len(actual) == len(expected)
+    for got, want in zip(actual, expected):
+        if want is None:
+            assert got is None
+            continue
+        assert got["pixels"] == want["pixels"]
+        for key in ("mean", "std", "min", "max"):
+            assert got[key] == pytest.approx(want[key], rel=1e-9, abs=1e-9)
+
+
+def test_box_region_stats_empty():
+    assert box_region_stats(DEPTH, np.empty((0, 4))) == []
+
+
+@pytest.mark.parametrize("ratio", [box_ops.SUMMED_AREA_MIN_RATIO, -1])
+def test_box_region_stats_matches_direct_reads(monkeypatch, ratio):
+    # ratio = -1 force les tables de sommes cumulées quelle que soit l'aire des boxes
+    monkeypatch.setattr(box_ops, "SUMMED_AREA_MIN_RATIO", ratio)
+    expected = reference_region_stats(DEPTH, REGION_BOXES)
+    assert expected[-2] is None and expected[-1] is None
+    assert_stats_close(box_region_stats(DEPTH, REGION_BOXES), expected)
+
+
+def test_box_region_stats_many_boxes_use_tables():
+    # Aire totale bien supérieure à SUMMED_AREA_MIN_RATIO x la carte : chemin des tables
+    rng = np.random.default_rng(2)
+    x1 = rng.integers(0, 30, size=200)
+    y1 = rng.integers(0, 20, size=200)
+    boxes = np.stack([x1, y1, x1 + 30, y1 + 20], axis=1)
+    assert (30 * 20 * len(boxes)) > box_ops.SUMMED_AREA_MIN_RATIO * DEPTH.size
+    assert_stats_close(box_region_stats(DEPTH, boxes), reference_region_stats(DEPTH, boxes))
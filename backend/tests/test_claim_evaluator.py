@@ -0,0 +1,150 @@
+"""
+Évaluation des dégâts : analyze_damages (colonnes NumPy) comparé au calcul
+d'origine pièce par pièce
+"""
+
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.claim_evaluator import ClaimEvaluator  # noqa: E402
+
+
+def reference_part_cost(part_name):
+    if part_name in ClaimEvaluator.PIECE_COSTS:
+        return ClaimEvaluator.PIECE_COSTS[part_name]
+    for key, cost in ClaimEvaluator.PIECE_COSTS.items():
+        if key in part_name or part_name in key:
+            return cost
+    return 500
+
+
+def reference_factor(obj):
+    depth = obj.get("depth")
+    if not depth:
+        return 1.0
+    low, high = ClaimEvaluator.DEFORMATION_FACTOR_RANGE
+    ratio = min(depth.get("std", 0) / ClaimEvaluator.DEFORMATION_STD_REFERENCE, 1.0)
+    return round(low + (high - low) * ratio, 3)
+
+
+def reference_analysis(damage):
+    """Calcul d'origine : coût, détail et gravité, une boucle par détection"""
+    objects = damage.get("detected_objects", [])
+
+    total_cost = 0
+    for obj in objects:
+        part_name = obj.get("class", "unknown").lower()
+        total_cost += (
+            reference_part_cost(part_name) * obj.get("confidence", 0) * reference_factor(obj)
+        )
+    if total_cost == 0 and "depth_stats" in damage:
+        stats = damage["depth_stats"]
+        total_cost = max(stats.get("mean", 0) * 10 + stats.get("max", 0) * 5, 200)
+
+    breakdown = []
+    for obj in objects:
+        part_name = obj.get("class", "unknown")
+        base_cost = reference_part_cost(part_name.lower())
+        factor = reference_factor(obj)
+        breakdown.append(
+            {
+                "part": part_name,
+                "confidence": round(obj.get("confidence", 0) * 100, 1),
+                "base_cost": base_cost,
+                "deformation_factor": factor,
+                "estimated_cost": round(base_cost * obj.get("confidence", 0) * factor, 2),
+            }
+        )
+
+    mean_depth = damage.get("depth_stats", {}).get("mean", 0)
+    deformed = sum(
+        1
+        for obj in objects
+        if (obj.get("depth") or {}).get("std", 0) >= ClaimEvaluator.DEFORMATION_STD_REFERENCE
+    )
+    if len(objects) >= 3 or mean_depth > 150 or deformed >= 2:
+        severity = "severe"
+    elif len(objects) >= 2 or mean_depth > 100 or deformed >= 1:
+        severity = "moderate"
+    else:
+        severity = "minor"
+
+    return {"estimated_cost": round(total_cost, 2), "severity": severity, "breakdown": breakdown}
+
+
+DAMAGES = [
+    # Aucune détection, sans puis avec statistiques de profondeur
+    {"detected_objects": []},
+    {},
+    {"detected_objects": [], "depth_stats": {"mean": 5, "max": 10}},
+    {"detected_objects": [], "depth_stats": {"mean": 120, "max": 255}},
+    # Détection sans classe : pièce "unknown", coût par défaut
+    {"detected_objects": [{"confidence": 0.8}]},
+    # Noms exacts, noms libres (correspondance partielle) et pièce inconnue
+    {
+        "detected_objects": [
+            {"class": "hood", "confidence": 0.9},
+            {"class": "Front Bumper", "confidence": 0.75, "depth": {"std": 12.0}},
+            {"class": "bumpers", "confidence": 0.5, "depth": {"std": 45.0}},
+            {"class": "spoiler", "confidence": 0.33},
+        ],
+        "depth_stats": {"mean": 80, "max": 200},
+    },
+    # Pièces déformées (écart-type au-delà de la référence), profondeur vide
+    {
+        "detected_objects": [
+            {"class": "left door panel", "confidence": 0.6, "depth": {"std": 30.0}},
+            {"class": "glass", "confidence": 0.4, "depth": {}},
+        ],
+        "depth_stats": {"mean": 160, "max": 255},
+    },
+    # Confiance nulle : coût nul, repli sur la profondeur
+    {
+        "detected_objects": [{"class": "roof", "confidence": 0}],
+        "depth_stats": {"mean": 30, "max": 90},
+    },
+]
+
+
+@pytest.fixture
+def evaluator():
+    return ClaimEvaluator()
+
+
+def test_analyze_damages_empty(evaluator):
+    assert evaluator.analyze_damages([]) == []
+
+
+def test_analyze_damages_matches_per_detection_costs(evaluator):
+    assert evaluator.analyze_damages(DAMAGES) == [reference_analysis(d) for d in DAMAGES]
+
+
+def test_analyze_damages_one_claim_at_a_time(evaluator):
+    for damage in DAMAGES:
+        assert evaluator.analyze_damages([damage]) == [reference_analysis(damage)]
+
+
+def test_analyze_damages_without_breakdown(evaluator):
+    for result, damage in zip(evaluator.analyze_damages(DAMAGES, breakdown=False), DAMAGES):
+        expected = reference_analysis(damage)
+        del expected["breakdown"]
+        assert result == expected
+
+
+def test_unknown_detection_costs_default(evaluator):
+    (result,) = evaluator.analyze_damages([{"detected_objects": [{"confidence": 1.0}]}])
+    assert result["breakdown"][0]["part"] == "unknown"
+    assert result["breakdown"][0]["base_cost"] == ClaimEvaluator.DEFAULT_PART_COST == 500
+    assert result["estimated_cost"] == 500
+
+
+def test_precomputed_columns(evaluator):
+    objects = [obj for damage in DAMAGES for obj in damage.get("detected_objects", [])]
+    columns = evaluator.damage_columns(objects)
+    assert evaluator.analyze_damages(DAMAGES, columns=columns) == evaluator.analyze_damages(
+        DAMAGES
+    )
@@ -0,0 +1,105 @@
+"""
+Analyse de contrat : ContractMatcher comparé aux regex d'origine
+"""
+
+import re
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from services.contract_analyzer import ContractAnalyzer  # noqa: E402
+
+
+def reference_amount(text, patterns):
+    """Extraction d'origine : premier pattern trouvé en re.search IGNORECASE"""
+    for pattern in patterns:
+        match = re.search(pattern, text, re.IGNORECASE)
+        if match:
+            amount = match.group(1).replace(" ", "").replace(",", ".")
+            return {"amount": float(amount), "currency": "EUR", "found": True}
+    return {"found": False, "amount": None}
+
+
+def reference_analysis(text):
+    """Franchise, plafond et garanties tels que les extrayait l'implémentation d'origine"""
+    franchise = reference_amount(
+        text,
+        [
+            r"franchise[:\s]+(\d+[\s,.]?\d*)\s*€",
+            r"franchise[:\s]+(\d+[\s,.]?\d*)\s*euros?",
+            r"montant de la franchise[:\s]+(\d+[\s,.]?\d*)\s*€",
+        ],
+    )
+    plafond = reference_amount(
+        text,
+        [
+            r"plafond[:\s]+(\d+[\s,.]?\d*)\s*€",
+            r"plafond de garantie[:\s]+(\d+[\s,.]?\d*)\s*€",
+            r"limite de garantie[:\s]+(\d+[\s,.]?\d*)\s*€",
+            r"montant maximum[:\s]+(\d+[\s,.]?\d*)\s*€",
+        ],
+    )
+    text_lower = text.lower()
+    garanties = {
+        "tous_risques": "tous risques" in text_lower or "tout risque" in text_lower,
+        "tiers": "responsabilité civile" in text_lower or "au tiers" in text_lower,
+        "vol": "vol" in text_lower,
+        "incendie": "incendie" in text_lower,
+        "bris_de_glace": "bris de glace" in text_lower or "brise de glace" in text_lower,
+        "assistance": "assistance" in text_lower or "dépannage" in text_lower,
+    }
+    return franchise, plafond, garanties
+
+
+CONTRACTS = [
+    "",
+    "Contrat sans aucun marqueur reconnu.",
+    "Franchise: 300 €\nPlafond: 15000 €\nGarantie Tous Risques, VOL et Incendie.",
+    "FRANCHISE : 1 200,50 €, plafond de garantie : 20 000 €, Responsabilité Civile",
+    "Montant de la franchise: 250 €. Limite de garantie 8.500 € pour le bris de glace.",
+    "franchise 450 euros ; montant maximum: 30000€ ; assistance 0 km",
+    # Le pattern en € l'emporte sur une occurrence antérieure en euros
+    "franchise 100 euros puis franchise: 200 € ; plafond: voir annexe ; dépannage",
+    # Mots-clés sans montant exploitable, puis montant plus loin
+    "franchise: voir annexe. plafond de 5000 €. Plafond 7000 € assurance au tiers",
+    # Occurrences chevauchantes des mots-clés
+    "plafondépannage montant maximumontant maximum: 40 € brise de glace tout risque",
+    "RESPONSABILITÉ CIVILE — FRANCHISE 90 EUROS — PLAFOND DE GARANTIE 1,5 €",
+]
+
+
+@pytest.fixture(scope="module")
+def analyzer():
+    return ContractAnalyzer()
+
+
+@pytest.mark.parametrize("text", CONTRACTS)
+def test_matcher_matches_original_regex(analyzer, text):
+    markers = analyzer.matcher.scan(text)
+    actual = (
+        analyzer._amount(markers["franchise"]),
+        analyzer._amount(markers["plafond"]),
+        markers["garanties"],
+    )
+    assert actual == reference_analysis(text)
+
+
+@pytest.mark.parametrize("text", CONTRACTS)
+def test_analyze_contract_matches_original_regex(analyzer, text):
+    franchise, plafond, garanties = reference_analysis(text)
+    result = analyzer.analyze_contract(text)
+
+    assert result["franchise"] == franchise
+    assert result["plafond"] == plafond
+    assert result["garanties"] == garanties
+    assert result["summary"]["garanties_actives"] == [k for k, v in garanties.items() if v]
+
+
+def test_analyze_contract_empty_text(analyzer):
+    result = analyzer.analyze_contract("")
+    assert result["franchise"] == {"found": False, "amount": None}
+    assert result["plafond"] == {"found": False, "amount": None}
+    assert result["summary"]["garanties_count"] == 0